@@ -1,10 +1,14 @@
+import argparse
 import asyncio
 import os
+import sys
 import json
+import time
 from typing import Optional
 from contextlib import AsyncExitStack
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+import httpx
 import requests
 
 # 加载.env文件，确保API Key受到保护
@@ -18,6 +22,13 @@ USER_AGENT = os.getenv("OPEN_WEATHER_USER_AGENT")
 # 从环境变量中获取 API 密钥
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
+# 请求 OpenWeather 的超时（秒）
+WEATHER_TIMEOUT = float(os.getenv("OPEN_WEATHER_TIMEOUT", "10"))
+
+# 复用 TCP 连接的 requests 会话
+weather_session = requests.Session()
+weather_session.headers["User-Agent"] = USER_AGENT or "my-weather-function-calling"
+
 functions = [
     {
         "name": "get_current_weather",
@@ -40,22 +51,29 @@ functions = [
 ]
 
 
+def weather_params(location):
+    return {"q": location, "appid": OPEN_WEATHER_API_KEY, "units": "metric", "lang": "zh_cn"}
+
+
+def describe_weather(data):
+    temperature = data['main']['temp']
+    description = data['weather'][0]['description']
+    humidity = data['main']['humidity']
+    wind_speed = data['wind']['speed']
+    return f"当前温度为：{temperature}℃\n天气状况：{description}\n湿度：{humidity}%\n风速：{wind_speed} m/s"
+
+
 def get_current_weather(location):
-    url = f"{OPENWEATHER_API_BASE}?q={location}&appid={OPEN_WEATHER_API_KEY}&units=metric&lang=zh_cn"
-    print(url)
+    # 通过 params 传参，避免把包含 API Key 的完整 URL 打印或拼接到日志中
     try:
-        response = requests.get(url, headers={"User-Agent": USER_AGENT})
-        data = response.json()
+        response = weather_session.get(OPENWEATHER_API_BASE, params=weather_params(location), timeout=WEATHER_TIMEOUT)
         if response.status_code == 200:
-            temperature = data['main']['temp']
-            description = data['weather'][0]['description']
-            humidity = data['main']['humidity']
-            wind_speed = data['wind']['speed']
-            return f"当前温度为：{temperature}℃\n天气状况：{description}\n湿度：{humidity}%\n风速：{wind_speed} m/s"
+            return describe_weather(response.json())
         else:
             return f"无法获取到该城市的天气"
     except requests.exceptions.RequestException as e:
-        print(e)
+        # 异常信息中带有包含 API Key 的完整 URL，只打印异常类型
+        print(type(e).__name__)
         return f"请求失败，请稍后再试"
 
 
@@ -82,7 +100,104 @@ def get_response(client, user_query):
     return response.choices[0].message.content
 
 
-if __name__ == "__main__":
+async def get_current_weather_async(http_client, location):
+    try:
+        response = await http_client.get(OPENWEATHER_API_BASE, params=weather_params(location))
+        if response.status_code == 200:
+            return describe_weather(response.json())
+        else:
+            return "无法获取到该城市的天气"
+    except httpx.HTTPError:
+        return "请求失败，请稍后再试"
+
+
+async def get_response_async(client, http_client, user_query):
+    response = await client.chat.completions.create(
+        model="deepseek-chat",
+        messages=[
+            {"role": "user", "content": user_query}  # 使用用户消息
+        ],
+        functions=functions,
+        function_call="auto"
+    )
+    message = response.choices[0].message
+
+    if message.function_call:
+        function_name = message.function_call.name
+
+        if function_name == "get_current_weather":
+            arguments = json.loads(message.function_call.arguments)
+            location = arguments.get("location")
+            return await get_current_weather_async(http_client, location)
+
+    return response.choices[0].message.content
+
+
+def read_queries(path):
+    """从文件或标准输入（path 为 -）读取查询，每行一条，忽略空行"""
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with source:
+        return [line.strip() for line in source if line.strip()]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+
+async def run_batch(queries, output, workers):
+    """
+    以有界并发批量处理查询：AsyncOpenAI 与 httpx.AsyncClient 都在所有查询间复用连接池，
+    结果按 JSONL 逐行写出，结束时输出吞吐量与 p50/p99 延迟。
+    """
+    client = AsyncOpenAI(api_key=openai_api_key, base_url="https://api.deepseek.com")
+    limits = httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+    http_client = httpx.AsyncClient(
+        limits=limits,
+        timeout=WEATHER_TIMEOUT,
+        headers={"User-Agent": USER_AGENT or "my-weather-function-calling"},
+    )
+    queue = asyncio.Queue()
+    for index, query in enumerate(queries):
+        queue.put_nowait((index, query))
+    latencies = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        while True:
+            try:
+                index, query = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            record = {"index": index, "query": query}
+            try:
+                record["response"] = await get_response_async(client, http_client, query)
+            except Exception as e:
+                failures += 1
+                record["error"] = str(e)
+            record["latency"] = round(time.perf_counter() - start, 4)
+            latencies.append(record["latency"])
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(workers, 1))))
+    finally:
+        await http_client.aclose()
+        await client.close()
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"完成 {len(queries)} 条查询（失败 {failures} 条），耗时 {elapsed:.2f}s，"
+        f"吞吐 {len(queries) / elapsed:.2f} 条/s，"
+        f"p50 {percentile(latencies, 0.5):.3f}s，p99 {percentile(latencies, 0.99):.3f}s",
+        file=sys.stderr,
+    )
+
+
+def repl():
     client = OpenAI(api_key=openai_api_key, base_url="https://api.deepseek.com")
     while True:
         user_input = input("Enter your query: ")
@@ -90,4 +205,20 @@ if __name__ == "__main__":
             print("Bye")
             break
         print(get_response(client, user_input))
-        print("-" * 50 + "\n")
\ No newline at end of file
+        print("-" * 50 + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="天气查询 Function Calling 示例")
+    parser.add_argument("--batch", metavar="FILE", help="批量模式：从文件读取查询（每行一条），- 表示标准输入")
+    parser.add_argument("--output", metavar="FILE", default="-", help="批量模式的 JSONL 输出文件，默认为标准输出")
+    parser.add_argument("--workers", type=int, default=8, help="批量模式的并发数")
+    args = parser.parse_args()
+
+    if args.batch:
+        queries = read_queries(args.batch)
+        output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        with output:
+            asyncio.run(run_batch(queries, output, args.workers))
+    else:
+        repl()
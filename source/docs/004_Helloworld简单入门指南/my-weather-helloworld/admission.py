@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Any, Iterable, Optional
+from dotenv import load_dotenv
+from metrics import REGISTRY
+
+# 加载.env文件
+load_dotenv()
+
+# /call_tool 准入控制配置
+ADMISSION = os.getenv("MCP_ADMISSION", "1").lower() in ("1", "true", "yes")  # 总开关
+MAX_IN_FLIGHT = int(os.getenv("MCP_ADMISSION_MAX_IN_FLIGHT", "32"))  # 每个工具同时执行的调用数上限
+# 按工具覆盖 MAX_IN_FLIGHT，如 query_history=2,query_weather_many=8
+TOOL_LIMITS = os.getenv("MCP_ADMISSION_TOOL_LIMITS", "")
+QUEUE_SIZE = int(os.getenv("MCP_ADMISSION_QUEUE_SIZE", "64"))  # 每个工具的等待队列长度，队列满时返回 429
+DEFAULT_TIMEOUT = float(os.getenv("MCP_ADMISSION_DEFAULT_TIMEOUT", "30"))  # 客户端没有携带截止时间时使用的超时（秒）
+# batch 通道最多占用的并发比例，保证 interactive 调用总有空闲的执行槽
+BATCH_MAX_SHARE = float(os.getenv("MCP_ADMISSION_BATCH_MAX_SHARE", "0.75"))
+SERVICE_TIME_ALPHA = 0.2  # 平均执行耗时的指数移动平均系数，用于估算排队时间与 Retry-After
+
+# 请求头：截止时间（剩余秒数）与优先级通道
+TIMEOUT_HEADER = "X-Request-Timeout"
+PRIORITY_HEADER = "X-Priority"
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+
+class Rejected(Exception):
+    """
+    准入控制拒绝了请求。
+    status 为 429（该工具的队列已满）或 503（排队时间超过截止时间、在队列中超时或被 interactive 请求挤出），
+    retry_after 为建议的重试间隔（秒）。
+    """
+
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_tool_limits(value: str) -> dict[str, int]:
+    limits = {}
+    for item in value.split(","):
+        name, sep, limit = item.partition("=")
+        if sep and limit.strip().isdigit():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class ToolLimiter:
+    """
+    单个工具的并发上限与有界等待队列。执行槽释放时直接交给下一个等待者（interactive 通道优先），
+    不经过“释放后再竞争”，因此不会被新到达的请求插队。
+    """
+
+    def __init__(self, name: str, max_in_flight: int = MAX_IN_FLIGHT, queue_size: int = QUEUE_SIZE,
+                 batch_max_share: float = BATCH_MAX_SHARE):
+        self.name = name
+        self.max_in_flight = max(max_in_flight, 1)
+        self.queue_size = queue_size
+        self.batch_limit = max(int(self.max_in_flight * batch_max_share), 1)
+        self.in_flight = {INTERACTIVE: 0, BATCH: 0}
+        self.waiters: dict[str, deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self.service_time = 0.05  # 平均执行耗时（秒），随请求完成更新
+        self.admitted = 0
+        self.rejected = {429: 0, 503: 0}
+        self.shed = 0  # 被 interactive 请求挤出的 batch 请求数
+        self.timed_out = 0  # 在队列中等到截止时间的请求数
+
+    @property
+    def running(self) -> int:
+        return self.in_flight[INTERACTIVE] + self.in_flight[BATCH]
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters[INTERACTIVE]) + len(self.waiters[BATCH])
+
+    def _has_slot(self, lane: str) -> bool:
+        if self.running >= self.max_in_flight:
+            return False
+        return lane == INTERACTIVE or self.in_flight[BATCH] < self.batch_limit
+
+    def estimated_wait(self, ahead: int) -> float:
+        """前面还有 ahead 个请求排队时，估算的等待秒数"""
+        return (ahead + 1) * self.service_time / self.max_in_flight
+
+    def retry_after(self) -> int:
+        return max(math.ceil(self.estimated_wait(self.queued)), 1)
+
+    def _reject(self, status: int, reason: str) -> Rejected:
+        self.rejected[status] += 1
+        return Rejected(status, reason, self.retry_after())
+
+    async def acquire(self, lane: str, deadline: float) -> None:
+        """
+        取得一个执行槽；需要排队时最多等到 deadline（loop.time() 时间）。
+        :raises Rejected: 队列已满、预计排队时间超过截止时间，或在队列中等到截止时间
+        """
+        loop = asyncio.get_running_loop()
+        # 没有更高或同等优先级的等待者时才直接执行，保证先到先得
+        if not self.waiters[INTERACTIVE] and not (lane == BATCH and self.waiters[BATCH]) and self._has_slot(lane):
+            self.in_flight[lane] += 1
+            self.admitted += 1
+            return
+
+        ahead = len(self.waiters[INTERACTIVE]) + (len(self.waiters[BATCH]) if lane == BATCH else 0)
+        if self.estimated_wait(ahead) > deadline - loop.time():
+            raise self._reject(503, "预计排队时间超过请求的截止时间")
+        if self.queued >= self.queue_size:
+            if lane == INTERACTIVE and self.waiters[BATCH]:
+                # 挤出最晚进入队列的 batch 请求，为 interactive 请求腾出位置
+                victim = self.waiters[BATCH].pop()
+                self.shed += 1
+                victim.set_exception(self._reject(503, "队列已满，batch 请求被 interactive 请求挤出"))
+            else:
+                raise self._reject(429, f"工具 {self.name} 的等待队列已满")
+
+        waiter = loop.create_future()
+        self.waiters[lane].append(waiter)
+        try:
+            async with asyncio.timeout_at(deadline):
+                await waiter
+        except TimeoutError:
+            self._abandon(lane, waiter)
+            self.timed_out += 1
+            raise self._reject(503, "排队等待超过请求的截止时间") from None
+        except asyncio.CancelledError:
+            self._abandon(lane, waiter)
+            raise
+        self.admitted += 1
+
+    def _abandon(self, lane: str, waiter: asyncio.Future):
+        """等待者超时或被取消（如客户端断开）：移出队列；执行槽恰好已经交给它时，转交给下一个等待者"""
+        try:
+            self.waiters[lane].remove(waiter)
+        except ValueError:
+            pass
+        if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+            self.release(lane, None)
+
+    def release(self, lane: str, elapsed: Optional[float]):
+        """执行结束：更新平均耗时，并把执行槽直接交给下一个等待者"""
+        if elapsed is not None:
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+        self.in_flight[lane] -= 1
+        for next_lane in LANES:
+            queue = self.waiters[next_lane]
+            while queue and self._has_slot(next_lane):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self.in_flight[next_lane] += 1
+                waiter.set_result(None)
+            if queue and next_lane == INTERACTIVE:
+                # interactive 仍在排队时不让 batch 请求先执行
+                return
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": dict(self.in_flight),
+            "queued": {lane: len(self.waiters[lane]) for lane in LANES},
+            "service_ms": round(self.service_time * 1000, 2),
+            "admitted": self.admitted,
+            "rejected_429": self.rejected[429],
+            "rejected_503": self.rejected[503],
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+class Admission:
+    """按工具分别限流的 /call_tool 准入控制"""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, queue_size: int = QUEUE_SIZE,
+                 tool_limits: Optional[dict[str, int]] = None, enabled: bool = ADMISSION):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.tool_limits = parse_tool_limits(TOOL_LIMITS) if tool_limits is None else tool_limits
+        self.enabled = enabled
+        self.limiters: dict[str, ToolLimiter] = {}
+
+    def limiter(self, tool_name: str) -> ToolLimiter:
+        limiter = self.limiters.get(tool_name)
+        if limiter is None:
+            limit = self.tool_limits.get(tool_name, self.max_in_flight)
+            limiter = self.limiters[tool_name] = ToolLimiter(tool_name, limit, self.queue_size)
+        return limiter
+
+    @staticmethod
+    def deadline(headers, default_timeout: float = DEFAULT_TIMEOUT) -> float:
+        """由 X-Request-Timeout（剩余秒数）计算截止时间（loop.time() 时间）；缺失或无效时使用默认超时"""
+        try:
+            timeout = float(headers.get(TIMEOUT_HEADER, default_timeout))
+        except ValueError:
+            timeout = default_timeout
+        return asyncio.get_running_loop().time() + max(timeout, 0.0)
+
+    @staticmethod
+    def lane(headers, data: dict[str, Any]) -> str:
+        lane = (headers.get(PRIORITY_HEADER) or data.get("priority") or INTERACTIVE).lower()
+        return lane if lane in LANES else INTERACTIVE
+
+    async def acquire(self, tool_name: str, lane: str, deadline: float) -> "AdmissionSlot":
+        if not self.enabled:
+            return AdmissionSlot(None, lane)
+        limiter = self.limiter(str(tool_name))
+        await limiter.acquire(lane, deadline)
+        return AdmissionSlot(limiter, lane)
+
+    def stats(self) -> dict[str, Any]:
+        return {"enabled": self.enabled, "tools": {name: limiter.stats() for name, limiter in self.limiters.items()}}
+
+    def metrics(self) -> Iterable[tuple[str, str, str, float, dict[str, str]]]:
+        # 同一指标的样本需要连续输出
+        limiters = list(self.limiters.items())
+        for name, limiter in limiters:
+            yield "mcp_admission_in_flight", "gauge", "正在执行的工具调用数", limiter.running, {"tool": name}
+        for name, limiter in limiters:
+            yield "mcp_admission_queued", "gauge", "等待执行的工具调用数", limiter.queued, {"tool": name}
+        for name, limiter in limiters:
+            for status, count in limiter.rejected.items():
+                yield "mcp_admission_rejected_total", "counter", "准入控制拒绝的工具调用数", count, {"tool": name, "status": str(status)}
+
+
+class AdmissionSlot:
+    """取得的执行槽，执行结束时调用 release（可重复调用）"""
+
+    def __init__(self, limiter: Optional[ToolLimiter], lane: str):
+        self.limiter = limiter
+        self.lane = lane
+        self.started_at = time.perf_counter()
+
+    def release(self):
+        if self.limiter is not None:
+            self.limiter.release(self.lane, time.perf_counter() - self.started_at)
+            self.limiter = None
+
+
+admission = Admission()
+REGISTRY.add_collector(admission.metrics)
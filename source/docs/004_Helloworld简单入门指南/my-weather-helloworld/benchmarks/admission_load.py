@@ -0,0 +1,114 @@
+"""
+/call_tool 过载压测：上游连接数限制为 --upstream-connections、桩服务器固定延迟 --latency，
+服务器的处理能力约为 连接数 / 延迟 次/秒。以 --overload 倍的处理能力匀速发起请求（开环，不等待前一个请求完成），
+每个请求查询不同的城市（不命中缓存），其中 --interactive 比例为 interactive，其余为 batch。
+
+依次运行三种模式：不做准入控制也不带截止时间（原来的行为）、只带截止时间（X-Request-Timeout）、开启准入控制，
+报告各通道成功请求的延迟分位数、被拒绝（429 / 503）、超时（504）与失败的请求数，以及 429 的响应耗时。
+
+运行：python -m benchmarks.admission_load --duration 10 --overload 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+import aiohttp
+from admission import BATCH, INTERACTIVE, PRIORITY_HEADER, TIMEOUT_HEADER
+from benchmarks.stub_openweather import start_stub
+from benchmarks.suite import percentile
+from benchmarks.worker_scaling import wait_ready
+
+
+async def run(url: str, rate: float, duration: float, interactive: float, timeout: float | None) -> dict:
+    outcomes: dict[str, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async def one(i: int, lane: str):
+            data = {"tool_name": "query_weather", "tool_args": {"city": f"Load{i}"}}
+            headers = {PRIORITY_HEADER: lane}
+            if timeout is not None:
+                headers[TIMEOUT_HEADER] = str(timeout)
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/call_tool", json=data, headers=headers) as response:
+                    body = await response.json()
+                    status = response.status
+            except Exception:
+                status, body = "error", {}
+            # 上游失败时工具仍返回 200，结果以 ⚠ 开头
+            outcome = "ok" if status == 200 and not str(body.get("result", "")).startswith("⚠") else str(status)
+            outcomes[lane][outcome].append(time.perf_counter() - start)
+
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(rate * duration)):
+            await asyncio.sleep(max(start + i / rate - time.perf_counter(), 0))
+            lane = INTERACTIVE if random.random() < interactive else BATCH
+            tasks.append(asyncio.create_task(one(i, lane)))
+        await asyncio.gather(*tasks)
+    return outcomes
+
+
+def report(name: str, outcomes: dict):
+    for lane in (INTERACTIVE, BATCH):
+        results = outcomes.get(lane, {})
+        ok = sorted(results.get("ok", []))
+        total = sum(len(samples) for samples in results.values())
+        others = "  ".join(f"{status}:{len(samples)}" for status, samples in sorted(results.items()) if status != "ok")
+        rejected = sorted(results.get("429", []))
+        latency = (f"{percentile(ok, 50) * 1000:>8.0f}{percentile(ok, 99) * 1000:>8.0f}{ok[-1] * 1000:>8.0f}"
+                   if ok else f"{'-':>8}{'-':>8}{'-':>8}")
+        reject_p99 = f"{percentile(rejected, 99) * 1000:>12.1f}" if rejected else f"{'-':>12}"
+        print(f"{name:<8}{lane:<12}{total:>6}{len(ok):>6}{latency}{reject_p99}  {others}")
+
+
+async def main(args):
+    runner, upstream_url, _ = await start_stub(latency=args.latency)
+    capacity = args.upstream_connections / args.latency
+    rate = capacity * args.overload
+    print(f"处理能力约 {capacity:.0f} 次/秒，发起 {rate:.0f} 次/秒，持续 {args.duration:.0f} 秒，截止时间 {args.timeout}s")
+    print(f"{'模式':<8}{'通道':<12}{'请求':>6}{'成功':>6}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}{'429 p99 ms':>12}  其他结果")
+    try:
+        for name, enabled, timeout in (("原行为", "0", None), ("截止时间", "0", args.timeout), ("准入控制", "1", args.timeout)):
+            env = {
+                **os.environ,
+                "OPENWEATHER_API_BASE": upstream_url,
+                "OPEN_WEATHER_API_KEY": "benchmark",
+                "OPENWEATHER_MAX_CONNECTIONS": str(args.upstream_connections),
+                "OPENWEATHER_RETRY_MAX": "0",
+                "WEATHER_CACHE_TTL": "0",
+                "WEATHER_REFRESH_AHEAD": "0",
+                "LOG_LEVEL": "WARNING",
+                "MCP_ADMISSION": enabled,
+                "MCP_ADMISSION_MAX_IN_FLIGHT": str(args.upstream_connections),
+                "MCP_ADMISSION_QUEUE_SIZE": str(args.queue_size),
+            }
+            url = f"http://127.0.0.1:{args.port}"
+            server = await asyncio.create_subprocess_exec(
+                sys.executable, "http_with_sse_transport_server.py", "--host", "127.0.0.1", "--port", str(args.port),
+                env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            try:
+                await wait_ready(url)
+                report(name, await run(url, rate, args.duration, args.interactive, timeout))
+            finally:
+                server.terminate()
+                await server.wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/call_tool 过载压测")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--overload", type=float, default=2, help="发起速率相对处理能力的倍数")
+    parser.add_argument("--latency", type=float, default=0.1, help="桩服务器固定延迟（秒）")
+    parser.add_argument("--upstream-connections", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--interactive", type=float, default=0.3, help="interactive 请求的比例")
+    parser.add_argument("--timeout", type=float, default=2, help="X-Request-Timeout（秒）")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""
+城市索引基准：编译与加载耗时、常驻内存（对比把全部城市放进 dict 的做法），以及精确、别名、模糊、未命中查找的延迟。
+默认生成与 OpenWeather city.list.json 规模相同（约 20 万城市）的合成列表，也可以用 --city-list 指定真实文件。
+
+运行：python -m benchmarks.city_index --cities 209579
+"""
+import argparse
+import gc
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+from city_index import CityIndex, CityResolver, build_index, normalize_name
+
+SYLLABLES = ["ba", "be", "ji", "ng", "shan", "lon", "don", "par", "is", "ber", "lin", "to", "kyo", "san", "ta",
+             "mo", "ri", "ca", "no", "va", "el", "ar", "ha", "zhou", "wu", "xi", "an", "chen", "du", "ville"]
+COUNTRIES = ["CN", "US", "GB", "FR", "DE", "JP", "RU", "IN", "BR", "CA"]
+REAL_CITIES = [("Beijing", "CN"), ("Shanghai", "CN"), ("Xi'an", "CN"), ("Tokyo", "JP"), ("London", "GB"),
+               ("London", "CA"), ("Paris", "FR"), ("New York", "US"), ("São Paulo", "BR")]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def synthetic_city_list(path: str, count: int):
+    rng = random.Random(42)
+    cities = [{"id": 1000000 + i, "name": name, "country": country} for i, (name, country) in enumerate(REAL_CITIES)]
+    while len(cities) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        cities.append({"id": 2000000 + len(cities), "name": name, "country": rng.choice(COUNTRIES),
+                       "coord": {"lon": rng.uniform(-180, 180), "lat": rng.uniform(-90, 90)}})
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(cities, f)
+
+
+def dict_index(source: str) -> dict[str, list[int]]:
+    """对照组：normalize_name -> [id, ...] 的 dict"""
+    opener = gzip.open if source.endswith(".gz") else open
+    with opener(source, "rt", encoding="utf-8") as f:
+        cities = json.load(f)
+    index: dict[str, list[int]] = {}
+    for city in cities:
+        index.setdefault(normalize_name(city["name"]), []).append(city["id"])
+    return index
+
+
+def measure(name: str, resolver: CityResolver, queries: list[str], rounds: int, fresh: bool = False):
+    samples = []
+    for _ in range(rounds):
+        for query in queries:
+            if fresh:
+                resolver._fuzzy_cache.clear()
+            start = time.perf_counter()
+            resolver.resolve(query)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    print(f"{name:<14}{mean * 1e6:>12.1f}{samples[len(samples) // 2] * 1e6:>12.1f}{samples[int(len(samples) * 0.99) - 1] * 1e6:>12.1f}")
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.city_list
+        if source is None:
+            source = os.path.join(tmp, "city.list.json.gz")
+            synthetic_city_list(source, args.cities)
+        target = os.path.join(tmp, "city.idx")
+
+        start = time.perf_counter()
+        count = build_index(source, target)
+        print(f"编译 {count} 个城市: {time.perf_counter() - start:.2f} s，索引文件 {os.path.getsize(target) / 2**20:.1f} MB")
+
+        gc.collect()
+        before = rss_mb()
+        start = time.perf_counter()
+        index = CityIndex(target)
+        load_seconds = time.perf_counter() - start
+        resolver = CityResolver(index)
+        measure("warmup", resolver, ["Beijing"], 1)
+        print(f"加载: {load_seconds * 1000:.2f} ms，常驻内存增加 {rss_mb() - before:.1f} MB（mmap 按需映射）")
+
+        gc.collect()
+        before = rss_mb()
+        start = time.perf_counter()
+        baseline = dict_index(source)
+        gc.collect()
+        print(f"对照 dict 索引: 加载 {time.perf_counter() - start:.2f} s，常驻内存增加 {rss_mb() - before:.1f} MB")
+        del baseline
+
+        print(f"{'查找':<14}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}")
+        measure("exact", resolver, ["Beijing", "beijing", " TOKYO ", "Paris,FR", "London,CA", "sao paulo"], args.rounds)
+        measure("alias", resolver, ["北京", "上海市", "东京", "伦敦", "西安"], args.rounds)
+        measure("fuzzy", resolver, ["Bejing", "Shangahi", "Tokio", "Pariss"], max(args.rounds // 100, 3), fresh=True)
+        measure("fuzzy(cached)", resolver, ["Bejing", "Shangahi", "Tokio", "Pariss"], args.rounds)
+        measure("miss", resolver, ["Qwzxvbnm", "Atlantis Xyz"], max(args.rounds // 100, 3), fresh=True)
+        print(resolver.stats())
+        index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="城市索引基准")
+    parser.add_argument("--city-list", help="OpenWeather city.list.json(.gz)，默认生成合成列表")
+    parser.add_argument("--cities", type=int, default=209579, help="合成列表的城市数")
+    parser.add_argument("--rounds", type=int, default=2000)
+    main(parser.parse_args())
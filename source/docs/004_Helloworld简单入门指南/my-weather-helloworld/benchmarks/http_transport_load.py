@@ -0,0 +1,66 @@
+"""
+HTTP 传输层压测：对运行中的 http_with_sse_transport_server.py 发起并发请求，
+对比每次新建连接与连接池复用、完整 /list_tools 与 ETag 条件请求（304）的吞吐量。
+
+先启动服务器：uv run http_with_sse_transport_server.py
+运行：python -m benchmarks.http_transport_load --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+import aiohttp
+import fast_json
+
+
+async def run(session: aiohttp.ClientSession, requests: int, concurrency: int, send) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await send(session)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+async def main(url: str, requests: int, concurrency: int, city: str):
+    async with aiohttp.ClientSession() as probe:
+        async with probe.get(f"{url}/list_tools") as response:
+            etag = response.headers.get("ETag")
+
+    async def list_tools(session):
+        async with session.get(f"{url}/list_tools") as response:
+            await response.read()
+
+    async def list_tools_revalidate(session):
+        async with session.get(f"{url}/list_tools", headers={"If-None-Match": etag}) as response:
+            await response.read()
+
+    async def call_tool(session):
+        data = {"tool_name": "query_weather", "tool_args": {"city": city}}
+        async with session.post(f"{url}/call_tool", json=data) as response:
+            await response.read()
+
+    scenarios = [
+        ("list_tools 每次新建连接", lambda: aiohttp.TCPConnector(force_close=True), list_tools),
+        ("list_tools 连接池", lambda: aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30), list_tools),
+        ("list_tools 304 连接池", lambda: aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30), list_tools_revalidate),
+        ("call_tool 每次新建连接", lambda: aiohttp.TCPConnector(force_close=True), call_tool),
+        ("call_tool 连接池", lambda: aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30), call_tool),
+    ]
+    print(f"{'场景':<24}{'req/s':>10}")
+    for name, connector, send in scenarios:
+        async with aiohttp.ClientSession(connector=connector(), json_serialize=fast_json.dumps_str) as session:
+            rps = await run(session, requests, concurrency, send)
+        print(f"{name:<24}{rps:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP 传输层压测")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--city", default="Beijing", help="call_tool 查询的城市（命中服务器缓存后只测传输开销）")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.requests, args.concurrency, args.city))
@@ -0,0 +1,84 @@
+"""
+多服务器路由基准：同时配置若干个正常的 stdio 服务器、一个启动很慢的 stdio 服务器、一个不存在的脚本和一个不响应的 HTTP 地址，
+对比逐个连接与 MCPRouter 并发连接的总耗时，并验证不可用的服务器不影响其他服务器的工具调用。
+
+运行：python -m benchmarks.mcp_router --servers 3 --slow 2 --timeout 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from benchmarks.stub_openweather import start_stub
+from mcp_router import MCPRouter
+
+
+async def hanging_listener() -> tuple[asyncio.AbstractServer, str]:
+    """接受连接但从不响应的 TCP 服务，模拟卡住的 HTTP 服务器"""
+    server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+def slow_script(directory: str, delay: float) -> str:
+    path = os.path.join(directory, "slow_server.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"import time, runpy\ntime.sleep({delay})\n"
+                f"runpy.run_path({os.path.abspath('stdio_transport_server.py')!r}, run_name='__main__')\n")
+    return path
+
+
+async def connect(specs: list[tuple[str, str]], env: dict[str, str], timeout: float) -> MCPRouter:
+    return await MCPRouter(specs, env=env, connect_timeout=timeout, reconnect_delay=3600).start()
+
+
+async def main(args):
+    runner, upstream_url, _ = await start_stub(latency=0.05)
+    hang, hang_url = await hanging_listener()
+    env = {
+        **os.environ,
+        "OPENWEATHER_API_BASE": upstream_url,
+        "OPEN_WEATHER_API_KEY": "benchmark",
+        "FASTMCP_LOG_LEVEL": "WARNING",
+        "PYTHONPATH": os.getcwd(),
+    }
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            specs = [(f"weather{i}", "stdio_transport_server.py") for i in range(args.servers)]
+            specs += [("slow", slow_script(directory, args.slow)), ("missing", os.path.join(directory, "missing.py")),
+                      ("hang", hang_url)]
+
+            start = time.perf_counter()
+            for spec in specs:
+                router = await connect([spec], env, args.timeout)
+                await router.aclose()
+            sequential = time.perf_counter() - start
+
+            router = await connect(specs, env, args.timeout)
+            try:
+                print(router.summary())
+                print(f"\n逐个连接总耗时 {sequential:.2f}s，并发连接总耗时 {router.connect_seconds:.2f}s")
+                start = time.perf_counter()
+                tools = (await router.list_tools()).tools
+                print(f"合并后的工具 {len(tools)} 个（list_tools {(time.perf_counter() - start) * 1000:.0f} ms）: "
+                      f"{[tool.name for tool in tools[:4]]} ...")
+                results = await asyncio.gather(
+                    *(router.call_tool(f"{name}__query_weather", {"city": "Beijing"}) for name, _ in specs),
+                    return_exceptions=True,
+                )
+                for (name, _), result in zip(specs, results):
+                    outcome = f"失败: {result}" if isinstance(result, Exception) else result.content[0].text.splitlines()[0]
+                    print(f"  {name}: {outcome}")
+            finally:
+                await router.aclose()
+    finally:
+        hang.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多服务器路由并发连接基准")
+    parser.add_argument("--servers", type=int, default=3, help="正常的 stdio 服务器数")
+    parser.add_argument("--slow", type=float, default=2, help="慢服务器的启动延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=4, help="单个服务器的连接超时（秒）")
+    asyncio.run(main(parser.parse_args()))
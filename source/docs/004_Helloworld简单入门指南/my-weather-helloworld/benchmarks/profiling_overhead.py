@@ -0,0 +1,96 @@
+"""
+性能分析模式的开销基准：
+1. 离线：未开启分析时 profiling.span() / Histogram.time() 每次的耗时，与开启 sample 模式时对比；
+2. 实时：stdio 服务器在 MCP_PROFILE 为空 / sample / cprofile 时的缓存命中吞吐量，
+   确认关闭时没有可测量的开销、开启时的开销在可接受范围内。
+
+运行：python -m benchmarks.profiling_overhead --iterations 200000 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from benchmarks.stub_openweather import start_stub
+from benchmarks.suite import drive
+import profiling
+from metrics import Registry
+
+MODES = (("off", ""), ("sample", "sample"), ("cprofile", "cprofile"))
+
+
+def per_call_ns(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+async def offline(iterations: int):
+    histogram = Registry().histogram("bench_seconds", "基准", span="{tool}")
+
+    def with_span():
+        with profiling.span("bench"):
+            pass
+
+    def with_time():
+        with histogram.time(tool="query_weather"):
+            pass
+
+    print(f"{'调用':<24}{'关闭 ns':>12}{'sample ns':>12}")
+    disabled = {name: per_call_ns(func, iterations) for name, func in (("span()", with_span), ("Histogram.time()", with_time))}
+    with tempfile.TemporaryDirectory() as output_dir:
+        with profiling.profile("profiling_overhead", "sample", output_dir):
+            enabled = {name: per_call_ns(func, iterations) for name, func in (("span()", with_span), ("Histogram.time()", with_time))}
+    for name in disabled:
+        print(f"{name:<24}{disabled[name]:>12.0f}{enabled[name]:>12.0f}")
+
+
+async def live(args):
+    runner, upstream_url, _ = await start_stub()
+    print(f"\n实时：stdio 服务器，缓存命中，并发 {args.concurrency}，{args.requests} 次 call_tool")
+    print(f"{'MCP_PROFILE':<14}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'错误':>6}")
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            for name, modes in MODES:
+                env = {
+                    **os.environ,
+                    "OPENWEATHER_API_BASE": upstream_url,
+                    "OPEN_WEATHER_API_KEY": "benchmark",
+                    "LOG_LEVEL": "WARNING",
+                    "FASTMCP_LOG_LEVEL": "WARNING",
+                    "MCP_PROFILE": modes,
+                    "MCP_PROFILE_DIR": output_dir,
+                }
+                params = StdioServerParameters(command=sys.executable, args=["stdio_transport_server.py"], env=env)
+                async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+                    await session.initialize()
+
+                    async def one(i: int):
+                        result = await session.call_tool("query_weather", {"city": f"City{i % args.cities}"})
+                        if result.isError:
+                            raise RuntimeError(result.content[0].text)
+
+                    await drive(one, args.cities, args.concurrency)
+                    result = await drive(one, args.requests, args.concurrency)
+                print(f"{name:<14}{result['throughput']:>10.1f}{result.get('p50_ms', 0):>10.2f}"
+                      f"{result.get('p99_ms', 0):>10.2f}{result['errors']:>6}")
+    finally:
+        await runner.cleanup()
+
+
+async def main(args):
+    await offline(args.iterations)
+    await live(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="性能分析模式的开销基准")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cities", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
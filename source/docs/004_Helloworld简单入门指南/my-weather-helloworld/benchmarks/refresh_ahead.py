@@ -0,0 +1,82 @@
+"""
+热点城市提前刷新基准：以固定速率查询少量热点城市（外加少量冷门城市），缓存 TTL 设得很短，
+对比关闭与开启提前刷新时的请求延迟分布，以及刷新消耗的上游请求数。
+
+运行：python -m benchmarks.refresh_ahead --duration 12 --ttl 3 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from benchmarks.stub_openweather import start_stub
+from benchmarks.suite import percentile
+
+
+async def run(refresh: bool, args, stats) -> dict:
+    from weather_cache import WeatherCache, key_fetcher, normalize_key
+    from weather_refresh import HotKeyTracker, RefreshAhead
+
+    cache = WeatherCache(ttl=args.ttl)
+    cache.tracker = tracker = HotKeyTracker(half_life=args.duration)
+    refresher = RefreshAhead(cache, tracker, window=args.ttl / 3, interval=args.ttl / 12, budget=args.budget, min_score=3)
+    if refresh:
+        refresher.start()
+    hot = [f"Hot{i}" for i in range(args.hot)]
+    latencies = []  # 只统计热点城市；冷门城市每次都未命中，两种模式相同
+    stats.reset()
+
+    async def one(city: str):
+        key = normalize_key(city)
+        start = time.perf_counter()
+        await cache.get_or_fetch(key, key_fetcher(key))
+        if city.startswith("Hot"):
+            latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        city = random.choice(hot) if random.random() < 0.9 else f"Cold{random.randrange(1000)}"
+        tasks.append(asyncio.create_task(one(city)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+    await refresher.stop()
+
+    ordered = sorted(latencies)
+    slow = sum(1 for latency in latencies if latency >= args.latency / 2)
+    return {
+        "requests": len(tasks),
+        "hot": len(latencies),
+        "upstream": stats.requests,
+        "slow": slow,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "p999_ms": percentile(ordered, 99.9) * 1000,
+        "refreshed": refresher.refreshed,
+        "over_budget": refresher.over_budget,
+    }
+
+
+async def main(args):
+    runner, url, stats = await start_stub(latency=args.latency)
+    os.environ["OPENWEATHER_API_BASE"] = url
+    from weather_upstream import upstream
+    try:
+        print(f"{'模式':<10}{'请求数':>8}{'上游':>8}{'热点请求':>8}{'其中未命中':>8}{'p99 ms':>10}{'p99.9 ms':>10}{'刷新':>8}{'超预算':>8}")
+        for name, refresh in (("TTL", False), ("提前刷新", True)):
+            r = await run(refresh, args, stats)
+            print(f"{name:<10}{r['requests']:>8}{r['upstream']:>8}{r['hot']:>8}{r['slow']:>8}{r['p99_ms']:>10.2f}{r['p999_ms']:>10.2f}"
+                  f"{r['refreshed']:>8}{r['over_budget']:>8}")
+    finally:
+        await upstream.aclose()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="热点城市提前刷新基准")
+    parser.add_argument("--duration", type=float, default=12, help="每种模式运行的秒数")
+    parser.add_argument("--rate", type=float, default=100, help="每秒查询数")
+    parser.add_argument("--hot", type=int, default=10, help="热点城市数")
+    parser.add_argument("--ttl", type=float, default=3, help="缓存 TTL（秒）")
+    parser.add_argument("--budget", type=int, default=600, help="每分钟刷新预算")
+    parser.add_argument("--latency", type=float, default=0.2, help="桩服务器固定延迟（秒）")
+    asyncio.run(main(parser.parse_args()))
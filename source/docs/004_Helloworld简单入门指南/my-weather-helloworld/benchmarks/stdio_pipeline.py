@@ -0,0 +1,69 @@
+"""
+单个 stdio 服务器进程上的并发 JSON-RPC 基准：同一条管道上保持 1 / 8 / 64 个未完成的 tools/call，
+对比 mcp 自带的 stdio 传输（MCP_STDIO_PIPELINE=0）与批量读写的 stdio 传输（MCP_STDIO_PIPELINE=1）。
+  上游延迟 —— 不使用缓存，每次调用都等待桩服务器 --latency 秒，观察慢请求是否阻塞其他请求
+  缓存命中 —— 结果来自服务器缓存，只测传输与调度开销
+
+运行：python -m benchmarks.stdio_pipeline --requests 2000 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from benchmarks.stub_openweather import start_stub
+from benchmarks.suite import drive
+
+CONCURRENCY = (1, 8, 64)
+
+
+async def run_mode(env: dict[str, str], requests: int, cities: int) -> list[dict]:
+    params = StdioServerParameters(command=sys.executable, args=["stdio_transport_server.py"], env=env)
+    results = []
+    async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+        await session.initialize()
+        for concurrency in CONCURRENCY:
+            async def one(i: int):
+                result = await session.call_tool("query_weather", {"city": f"City{i % cities}"})
+                if result.isError:
+                    raise RuntimeError(result.content[0].text)
+
+            # 先预热（缓存命中场景同时填充缓存）
+            await drive(one, min(cities, requests), concurrency)
+            results.append(await drive(one, requests, concurrency))
+    return results
+
+
+async def main(args):
+    runner, upstream_url, _ = await start_stub(latency=args.latency)
+    base_env = {
+        **os.environ,
+        "OPENWEATHER_API_BASE": upstream_url,
+        "OPEN_WEATHER_API_KEY": "benchmark",
+        "WEATHER_REFRESH_AHEAD": "0",
+        "LOG_LEVEL": "WARNING",
+        "FASTMCP_LOG_LEVEL": "WARNING",  # 关闭 FastMCP 每个请求一行的 INFO 日志
+    }
+    scenarios = (
+        (f"上游延迟 {args.latency * 1000:.0f} ms", {"WEATHER_CACHE_TTL": "0"}, max(args.requests // 10, 64)),
+        ("缓存命中", {}, args.requests),
+    )
+    print(f"{'场景':<16}{'传输':<10}{'并发':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'错误':>6}")
+    try:
+        for scenario, overrides, requests in scenarios:
+            for mode, pipeline in (("mcp", "0"), ("pipeline", "1")):
+                env = {**base_env, **overrides, "MCP_STDIO_PIPELINE": pipeline}
+                for concurrency, result in zip(CONCURRENCY, await run_mode(env, requests, args.cities)):
+                    print(f"{scenario:<16}{mode:<10}{concurrency:>6}{result['throughput']:>10.1f}"
+                          f"{result.get('p50_ms', 0):>10.2f}{result.get('p99_ms', 0):>10.2f}{result['errors']:>6}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stdio 并发 JSON-RPC 基准")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器固定延迟（秒）")
+    parser.add_argument("--cities", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
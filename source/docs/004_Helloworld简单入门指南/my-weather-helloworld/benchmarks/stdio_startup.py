@@ -0,0 +1,109 @@
+"""
+stdio 服务器冷启动与进程池基准（上游指向本地桩服务器）：
+  冷启动 —— 每次新建子进程：启动 + initialize，以及首个 call_tool 完成的耗时
+  预热   —— 进程池已就绪时单个 call_tool 的耗时
+  吞吐   —— 不同进程池大小下并发 call_tool 的吞吐量
+  崩溃   —— 压测期间杀掉一个子进程，统计失败请求数与重启次数
+
+运行：python -m benchmarks.stdio_startup --cold-runs 5 --pool-sizes 1 2 4 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import sys
+import time
+from mcp import StdioServerParameters
+from benchmarks.stub_openweather import start_stub
+from benchmarks.suite import child_pids, drive
+from stdio_pool import StdioServerPool
+
+
+def server_params(env: dict[str, str]) -> StdioServerParameters:
+    return StdioServerParameters(command=sys.executable, args=["stdio_transport_server.py"], env=env)
+
+
+async def cold_start(env: dict[str, str], runs: int):
+    startup, first_call = [], []
+    for i in range(runs):
+        start = time.perf_counter()
+        async with StdioServerPool(server_params(env), size=1) as pool:
+            startup.append(pool.workers[0].startup_seconds)
+            await pool.call_tool("query_weather", {"city": f"Cold{i}"})
+            first_call.append(time.perf_counter() - start)
+    print(f"冷启动（{runs} 次平均）: 启动+initialize {sum(startup) / runs * 1000:.0f} ms，"
+          f"到首个工具结果 {sum(first_call) / runs * 1000:.0f} ms")
+
+
+async def warm_calls(env: dict[str, str], calls: int):
+    async with StdioServerPool(server_params(env), size=1) as pool:
+        await pool.call_tool("query_weather", {"city": "Warm"})
+        start = time.perf_counter()
+        for _ in range(calls):
+            await pool.call_tool("query_weather", {"city": "Warm"})
+        print(f"预热进程上的 call_tool（缓存命中）: {(time.perf_counter() - start) / calls * 1000:.2f} ms")
+
+
+async def pool_throughput(env: dict[str, str], sizes: list[int], requests: int, concurrency: int, cities: int):
+    print(f"{'进程数':>8}{'启动 ms':>10}{'req/s':>10}{'p99 ms':>10}  各进程调用数")
+    for size in sizes:
+        start = time.perf_counter()
+        async with StdioServerPool(server_params(env), size=size) as pool:
+            startup = (time.perf_counter() - start) * 1000
+
+            async def one(i: int):
+                await pool.call_tool("query_weather", {"city": f"City{i % cities}"})
+
+            result = await drive(one, requests, concurrency)
+            calls = [worker.calls for worker in pool.workers]
+        print(f"{size:>8}{startup:>10.0f}{result['throughput']:>10.1f}{result.get('p99_ms', 0):>10.2f}  {calls}")
+
+
+async def crash_recovery(env: dict[str, str], size: int, requests: int, concurrency: int, cities: int):
+    before = child_pids()
+    async with StdioServerPool(server_params(env), size=size) as pool:
+        victim = random.choice(sorted(child_pids() - before))
+
+        async def one(i: int):
+            if i == requests // 4:
+                os.kill(victim, signal.SIGKILL)
+            await asyncio.wait_for(pool.call_tool("query_weather", {"city": f"City{i % cities}"}), 5)
+
+        result = await drive(one, requests, concurrency)
+        # 等待后台重启完成
+        deadline = time.monotonic() + 30
+        while pool.stats()["healthy"] < size and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        stats = pool.stats()
+    print(f"崩溃恢复（{size} 个进程）: 失败请求 {result['errors']}/{requests}，"
+          f"重启 {stats['restarts']} 次，恢复后健康进程 {stats['healthy']}/{size}")
+
+
+async def main(args):
+    runner, upstream_url, _ = await start_stub(latency=args.latency)
+    env = {
+        **os.environ,
+        "OPENWEATHER_API_BASE": upstream_url,
+        "OPEN_WEATHER_API_KEY": "benchmark",
+        "FASTMCP_LOG_LEVEL": "WARNING",
+    }
+    try:
+        await cold_start(env, args.cold_runs)
+        await warm_calls(env, args.warm_calls)
+        await pool_throughput(env, args.pool_sizes, args.requests, args.concurrency, args.cities)
+        await crash_recovery(env, max(args.pool_sizes), args.requests, args.concurrency, args.cities)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stdio 服务器冷启动与进程池基准")
+    parser.add_argument("--cold-runs", type=int, default=5)
+    parser.add_argument("--warm-calls", type=int, default=200)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器固定延迟（秒）")
+    asyncio.run(main(parser.parse_args()))
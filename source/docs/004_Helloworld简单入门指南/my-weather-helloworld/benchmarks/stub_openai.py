@@ -0,0 +1,181 @@
+"""
+本地 OpenAI 兼容的 /v1/chat/completions 桩服务器，用于在没有大模型 API Key 的情况下做端到端基准测试。
+
+行为：请求带 tools 且最后一条消息来自用户时，返回 tool_calls 调用 query_weather；
+收到工具结果后返回一段普通回答。支持 stream=true（SSE 分块）与非流式两种响应。
+
+单独运行：python -m benchmarks.stub_openai --port 9100
+然后在 .env 中设置 BASE_URL=http://127.0.0.1:9100/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from aiohttp import web
+
+
+# 运行期间可修改的参数：runner.app[LLM_OPTIONS]["latency"] = 0.5
+LLM_OPTIONS = web.AppKey("llm_options", dict)
+
+
+class LLMStubStats:
+    def __init__(self):
+        self.requests = 0
+        self.tool_call_turns = 0
+        self.prompt_tokens = 0
+
+    def reset(self):
+        self.requests = 0
+        self.tool_call_turns = 0
+        self.prompt_tokens = 0
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """粗略估算：约 4 个字符一个 token，足够用于比较不同实现之间的相对差异"""
+    return sum(len(json.dumps(message, ensure_ascii=False)) for message in messages) // 4 + 1
+
+
+def plan_reply(body: dict, tool_calls: int, cities: int) -> dict:
+    """:return: assistant 消息（content 或 tool_calls）"""
+    messages = body.get("messages", [])
+    tools = body.get("tools") or []
+    if tools and messages and messages[-1].get("role") == "user":
+        names = [tool.get("function", {}).get("name") for tool in tools]
+        name = "query_weather" if "query_weather" in names else names[0]
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps({"city": f"City{random.randrange(cities)}"})},
+            } for _ in range(tool_calls)],
+        }
+    results = [message.get("content") or "" for message in messages if message.get("role") == "tool"]
+    return {"role": "assistant", "content": f"根据 {len(results)} 条工具结果整理的天气摘要。" + "晴" * 40}
+
+
+def make_app(
+    stats: LLMStubStats,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    tool_calls: int = 1,
+    cities: int = 50,
+    chunk_delay: float = 0.0,
+) -> web.Application:
+    options = {
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+        "tool_calls": tool_calls,
+        "cities": cities,
+        "chunk_delay": chunk_delay,
+    }
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        stats.requests += 1
+        body = await request.json()
+        prompt_tokens = estimate_tokens(body.get("messages", []))
+        stats.prompt_tokens += prompt_tokens
+        delay = options["latency"] + random.uniform(0, options["jitter"])
+        if delay:
+            await asyncio.sleep(delay)
+        if options["error_rate"] and random.random() < options["error_rate"]:
+            return web.json_response({"error": {"message": "injected error", "type": "server_error"}}, status=500)
+
+        message = plan_reply(body, options["tool_calls"], options["cities"])
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        if finish_reason == "tool_calls":
+            stats.tool_call_turns += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model") or "stub"
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(json.dumps(message, ensure_ascii=False)) // 4 + 1,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(delta: dict, finish: str | None = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            if options["chunk_delay"]:
+                await asyncio.sleep(options["chunk_delay"])
+
+        await send({"role": "assistant"})
+        if message.get("tool_calls"):
+            for index, tool_call in enumerate(message["tool_calls"]):
+                arguments = tool_call["function"]["arguments"]
+                half = len(arguments) // 2
+                await send({"tool_calls": [{
+                    "index": index, "id": tool_call["id"], "type": "function",
+                    "function": {"name": tool_call["function"]["name"], "arguments": arguments[:half]},
+                }]})
+                await send({"tool_calls": [{"index": index, "function": {"arguments": arguments[half:]}}]})
+        else:
+            content = message["content"]
+            for start in range(0, len(content), 8):
+                await send({"content": content[start:start + 8]})
+        await send({}, finish_reason)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app[LLM_OPTIONS] = options
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+async def start_stub_llm(host: str = "127.0.0.1", port: int = 0, **options) -> tuple[web.AppRunner, str, LLMStubStats]:
+    """启动桩服务器，返回 (runner, base_url, stats)；base_url 可直接作为 AsyncOpenAI 的 base_url"""
+    stats = LLMStubStats()
+    runner = web.AppRunner(make_app(stats, **options), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_host, bound_port = runner.addresses[0][:2]
+    return runner, f"http://{bound_host}:{bound_port}/v1", stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.0, help="固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机附加延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 500 错误的比例")
+    parser.add_argument("--tool-calls", type=int, default=1, help="每轮返回的 tool_calls 数量")
+    parser.add_argument("--cities", type=int, default=50, help="tool_calls 中随机选择的城市数")
+    args = parser.parse_args()
+
+    stats = LLMStubStats()
+    app = make_app(stats, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   tool_calls=args.tool_calls, cities=args.cities)
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
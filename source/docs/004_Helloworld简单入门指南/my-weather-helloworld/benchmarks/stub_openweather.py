@@ -0,0 +1,149 @@
+"""
+本地 OpenWeather 桩服务器，用于在没有真实 API Key 的情况下做基准测试。
+
+单独运行：python -m benchmarks.stub_openweather --port 9000
+然后在 .env 中设置 OPENWEATHER_API_BASE=http://127.0.0.1:9000/data/2.5/weather
+（历史数据：OPENWEATHER_HISTORY_API_BASE=http://127.0.0.1:9000/data/2.5/history/city）
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from aiohttp import web
+
+
+def sample_weather(city: str, city_id: int = 0) -> dict:
+    return {
+        "id": city_id,
+        "name": city,
+        "sys": {"country": "CN"},
+        "main": {"temp": 21.5, "humidity": 40},
+        "wind": {"speed": 3.2},
+        "weather": [{"description": "晴"}],
+    }
+
+
+def sample_series(city: str, start: int, count: int, step: int) -> dict:
+    """预报 / 历史接口的响应：每 step 秒一个时间点，气温按昼夜正弦变化"""
+    items = []
+    for i in range(count):
+        dt = start + i * step
+        temp = round(18 + 8 * math.sin((dt + 28800) / 86400 * 2 * math.pi - math.pi / 2), 2)
+        items.append({
+            "dt": dt,
+            "main": {"temp": temp, "temp_min": temp - 0.5, "temp_max": temp + 0.5, "humidity": 40 + i % 30},
+            "wind": {"speed": 2 + i % 5 * 0.7},
+            "pop": i % 7 / 10,
+            "weather": [{"description": "晴" if i % 5 else "多云"}],
+        })
+    return {"cnt": count, "list": items, "city": {"name": city, "country": "CN", "timezone": 28800}}
+
+
+# 运行期间可修改的故障注入参数：runner.app[STUB_OPTIONS]["error_rate"] = 1.0
+STUB_OPTIONS = web.AppKey("options", dict)
+
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        # 以客户端 (host, port) 区分 TCP 连接，每个新连接即一次握手
+        self.peers: set = set()
+
+    @property
+    def connections(self) -> int:
+        return len(self.peers)
+
+    def reset(self):
+        self.requests = 0
+        self.peers.clear()
+
+
+def make_app(stats: StubStats, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0) -> web.Application:
+    """
+    故障注入参数保存在 app[STUB_OPTIONS] 中，运行期间可以修改，用于模拟上游从正常到故障再到恢复。
+    """
+    options = {"latency": latency, "jitter": jitter, "error_rate": error_rate}
+
+    async def weather(request: web.Request) -> web.Response:
+        stats.requests += 1
+        stats.peers.add(request.transport.get_extra_info("peername"))
+        delay = options["latency"] + random.uniform(0, options["jitter"])
+        if delay:
+            await asyncio.sleep(delay)
+        if options["error_rate"] and random.random() < options["error_rate"]:
+            return web.json_response({"cod": 500, "message": "injected error"}, status=500)
+        city_id = request.query.get("id", "")
+        if city_id.isdigit():
+            return web.json_response(sample_weather(f"City{city_id}", int(city_id)))
+        city = request.query.get("q", "Beijing")
+        return web.json_response(sample_weather(city))
+
+    async def group(request: web.Request) -> web.Response:
+        stats.requests += 1
+        stats.peers.add(request.transport.get_extra_info("peername"))
+        delay = options["latency"] + random.uniform(0, options["jitter"])
+        if delay:
+            await asyncio.sleep(delay)
+        city_ids = [int(i) for i in request.query.get("id", "").split(",") if i.isdigit()]
+        items = [sample_weather(f"City{city_id}", city_id) for city_id in city_ids]
+        return web.json_response({"cnt": len(items), "list": items})
+
+    async def forecast(request: web.Request) -> web.Response:
+        stats.requests += 1
+        delay = options["latency"] + random.uniform(0, options["jitter"])
+        if delay:
+            await asyncio.sleep(delay)
+        city_id = request.query.get("id", "")
+        city = f"City{city_id}" if city_id.isdigit() else request.query.get("q", "Beijing")
+        count = min(int(request.query.get("cnt", "40")), 40)
+        start = int(time.time()) // 10800 * 10800 + 10800
+        return web.json_response(sample_series(city, start, count, 10800))
+
+    async def history(request: web.Request) -> web.Response:
+        stats.requests += 1
+        delay = options["latency"] + random.uniform(0, options["jitter"])
+        if delay:
+            await asyncio.sleep(delay)
+        city_id = request.query.get("id", "")
+        city = f"City{city_id}" if city_id.isdigit() else request.query.get("q", "Beijing")
+        start = (int(request.query["start"]) + 3599) // 3600 * 3600
+        count = max((int(request.query["end"]) - start) // 3600 + 1, 0)
+        return web.json_response(sample_series(city, start, count, 3600))
+
+    app = web.Application()
+    app[STUB_OPTIONS] = options
+    app.router.add_get("/data/2.5/weather", weather)
+    app.router.add_get("/data/2.5/group", group)
+    app.router.add_get("/data/2.5/forecast", forecast)
+    app.router.add_get("/data/2.5/history/city", history)
+    return app
+
+
+async def start_stub(host: str = "127.0.0.1", port: int = 0, **options) -> tuple[web.AppRunner, str, StubStats]:
+    """启动桩服务器，返回 (runner, weather_url, stats)；port=0 时自动选择空闲端口"""
+    stats = StubStats()
+    runner = web.AppRunner(make_app(stats, **options), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_host, bound_port = runner.addresses[0][:2]
+    return runner, f"http://{bound_host}:{bound_port}/data/2.5/weather", stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenWeather 桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机附加延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 500 错误的比例")
+    args = parser.parse_args()
+
+    stats = StubStats()
+    app = make_app(stats, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
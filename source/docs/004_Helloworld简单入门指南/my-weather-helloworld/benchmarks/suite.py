@@ -0,0 +1,306 @@
+"""
+端到端基准套件：启动本地 OpenWeather 桩与 OpenAI 兼容桩，依次压测
+  stdio   —— stdio_transport_server.py 的 call_tool（通过 MCP ClientSession）
+  http    —— http_with_sse_transport_server.py 的 POST /call_tool
+  client  —— stdio MCPClient.process_query（大模型 → 工具 → 大模型 的完整流程）
+报告吞吐量、延迟分位数，以及各进程的 CPU 时间与峰值 RSS，结果写入 JSON 以便回归比较。
+
+运行：python -m benchmarks.suite --requests 500 --concurrency 16 --output bench.json
+与基线比较：python -m benchmarks.suite --baseline bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Awaitable, Callable
+import aiohttp
+from benchmarks.stub_openweather import start_stub
+from benchmarks.stub_openai import start_stub_llm
+from benchmarks.worker_scaling import wait_ready
+
+try:
+    import psutil
+except ImportError:  # 未安装 psutil 时在 Linux 上读取 /proc，其他平台不报告 CPU 与 RSS
+    psutil = None
+
+# 读取进程信息时可能出现的异常（进程已退出等）
+USAGE_ERRORS = (OSError, ValueError, IndexError) if psutil is None else (OSError, psutil.Error)
+SCENARIOS = ("stdio", "http", "client")
+
+
+def child_pids() -> set[int]:
+    if psutil is not None:
+        return {child.pid for child in psutil.Process().children(recursive=True)}
+    pids = set()
+    for path in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        with open(path) as f:
+            pids.update(int(pid) for pid in f.read().split())
+    return pids
+
+
+def process_usage(pid: int) -> tuple[float, int] | None:
+    """:return: (CPU 秒数, RSS 字节数)；无法读取时返回 None"""
+    try:
+        if psutil is not None:
+            process = psutil.Process(pid)
+            cpu = process.cpu_times()
+            return cpu.user + cpu.system, process.memory_info().rss
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return (int(fields[11]) + int(fields[12])) / ticks, rss_pages * os.sysconf("SC_PAGE_SIZE")
+    except USAGE_ERRORS:
+        return None
+
+
+class ProcessMonitor:
+    """在压测期间采样若干进程的 CPU 时间与峰值 RSS"""
+
+    def __init__(self, components: dict[str, int], interval: float = 0.1):
+        self.components = components
+        self.interval = interval
+        self.cpu_start: dict[str, float] = {}
+        self.peak_rss: dict[str, int] = {}
+        self._task: asyncio.Task | None = None
+
+    def _sample(self) -> dict[str, tuple[float, int]]:
+        usage = {}
+        for name, pid in self.components.items():
+            found = process_usage(pid)
+            if found is not None:
+                usage[name] = found
+                self.peak_rss[name] = max(self.peak_rss.get(name, 0), found[1])
+        return usage
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self._sample()
+
+    def start(self):
+        self.cpu_start = {name: cpu for name, (cpu, _) in self._sample().items()}
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict[str, dict[str, float]]:
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        end = self._sample()
+        return {
+            name: {
+                "cpu_seconds": round(end[name][0] - self.cpu_start[name], 3),
+                "peak_rss_mb": round(self.peak_rss[name] / 2 ** 20, 1),
+            }
+            for name in end if name in self.cpu_start
+        }
+
+
+def percentile(samples: list[float], q: float) -> float:
+    index = min(len(samples) - 1, max(0, round(q / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+async def drive(one: Callable[[int], Awaitable[Any]], requests: int, concurrency: int) -> dict[str, Any]:
+    """以固定并发执行 requests 次 one(i)，返回吞吐量与延迟分位数（毫秒）"""
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await one(i)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result: dict[str, Any] = {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+    }
+    if latencies:
+        for q in (50, 90, 99):
+            result[f"p{q}_ms"] = round(percentile(latencies, q) * 1000, 2)
+        result["max_ms"] = round(latencies[-1] * 1000, 2)
+    return result
+
+
+async def bench_stdio(env: dict[str, str], args) -> dict[str, Any]:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    before = child_pids()
+    params = StdioServerParameters(command=sys.executable, args=["stdio_transport_server.py"], env=env)
+    async with stdio_client(params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            components = {"stdio_server": pid for pid in child_pids() - before}
+
+            async def one(i: int):
+                result = await session.call_tool("query_weather", {"city": f"City{i % args.cities}"})
+                if result.isError:
+                    raise RuntimeError(result.content[0].text)
+
+            monitor = ProcessMonitor(components)
+            monitor.start()
+            result = await drive(one, args.requests, args.concurrency)
+            result["processes"] = await monitor.stop()
+    return result
+
+
+async def bench_http(env: dict[str, str], args) -> dict[str, Any]:
+    url = f"http://127.0.0.1:{args.port}"
+    server = await asyncio.create_subprocess_exec(
+        sys.executable, "http_with_sse_transport_server.py", "--host", "127.0.0.1", "--port", str(args.port),
+        env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await wait_ready(url)
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async def one(i: int):
+                data = {"tool_name": "query_weather", "tool_args": {"city": f"City{i % args.cities}"}}
+                async with session.post(f"{url}/call_tool", json=data) as response:
+                    await response.read()
+                    response.raise_for_status()
+
+            monitor = ProcessMonitor({"http_server": server.pid})
+            monitor.start()
+            result = await drive(one, args.requests, args.concurrency)
+            result["processes"] = await monitor.stop()
+    finally:
+        server.terminate()
+        await server.wait()
+    return result
+
+
+async def bench_client(env: dict[str, str], args) -> dict[str, Any]:
+    from stdio_transport_client import MCPClient
+
+    client = MCPClient()
+    before = child_pids()
+    try:
+        await client.connect_to_server("stdio_transport_server.py", env=env)
+        components = {"client": os.getpid(), **{"stdio_server": pid for pid in child_pids() - before}}
+
+        async def one(i: int):
+            answer = await client.process_query(f"查询第 {i} 个城市的天气")
+            if not answer:
+                raise RuntimeError("大模型调用失败")
+
+        monitor = ProcessMonitor(components)
+        monitor.start()
+        # process_query 会打印每次工具调用，压测期间丢弃这些输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await drive(one, max(args.requests // 5, 1), args.concurrency)
+        result["processes"] = await monitor.stop()
+    finally:
+        await client.cleanup()
+    return result
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]):
+    print(f"\n与基线比较（{baseline.get('created', '?')}）")
+    print(f"{'场景':<10}{'吞吐量':>14}{'p99':>14}")
+    for name, result in results["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("throughput") or not base.get("p99_ms") or "p99_ms" not in result:
+            continue
+        throughput = (result["throughput"] / base["throughput"] - 1) * 100
+        p99 = (result["p99_ms"] / base["p99_ms"] - 1) * 100
+        print(f"{name:<10}{throughput:>+13.1f}%{p99:>+13.1f}%")
+
+
+async def main(args):
+    weather_runner, weather_url, weather_stats = await start_stub(
+        latency=args.weather_latency, jitter=args.weather_jitter, error_rate=args.weather_error_rate
+    )
+    llm_runner, llm_url, llm_stats = await start_stub_llm(
+        latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate,
+        tool_calls=args.tool_calls, cities=args.cities,
+    )
+    env = {
+        **os.environ,
+        "OPENWEATHER_API_BASE": weather_url,
+        "OPEN_WEATHER_API_KEY": "benchmark",
+        "LOG_LEVEL": "WARNING",
+        "FASTMCP_LOG_LEVEL": "WARNING",
+    }
+    if args.no_cache:
+        env["WEATHER_CACHE_TTL"] = "0"
+    # MCPClient 在当前进程中运行，需要在创建前指向桩服务器；并发查询互相独立，关闭对话记忆
+    os.environ.update(OPENAI_API_KEY="benchmark", BASE_URL=llm_url, MODEL="stub", MCP_STREAM="0", MCP_MEMORY_TOKENS="0")
+
+    benches = {"stdio": bench_stdio, "http": bench_http, "client": bench_client}
+    results: dict[str, Any] = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": {},
+    }
+    print(f"{'场景':<10}{'请求':>8}{'错误':>6}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}  进程 CPU / 峰值 RSS")
+    try:
+        for name in args.scenarios:
+            weather_stats.reset()
+            llm_stats.reset()
+            result = await benches[name](env, args)
+            result["upstream_requests"] = weather_stats.requests
+            result["llm_requests"] = llm_stats.requests
+            results["results"][name] = result
+            processes = ", ".join(
+                f"{component} {usage['cpu_seconds']:.2f}s / {usage['peak_rss_mb']:.0f}MB"
+                for component, usage in result["processes"].items()
+            )
+            print(
+                f"{name:<10}{result['requests']:>8}{result['errors']:>6}{result['throughput']:>10.1f}"
+                f"{result.get('p50_ms', 0):>10.2f}{result.get('p90_ms', 0):>10.2f}{result.get('p99_ms', 0):>10.2f}  {processes}"
+            )
+    finally:
+        await llm_runner.cleanup()
+        await weather_runner.cleanup()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="端到端基准套件")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="stdio/http 场景的请求数，client 场景为其 1/5")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cities", type=int, default=50, help="请求中轮流使用的城市数")
+    parser.add_argument("--no-cache", action="store_true", help="关闭服务器的天气缓存，每次请求都到达上游")
+    parser.add_argument("--port", type=int, default=8765, help="http 场景的服务器端口")
+    parser.add_argument("--weather-latency", type=float, default=0.05)
+    parser.add_argument("--weather-jitter", type=float, default=0.0)
+    parser.add_argument("--weather-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--tool-calls", type=int, default=2, help="桩大模型每轮返回的 tool_calls 数量")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="用于比较的基线 JSON 文件")
+    asyncio.run(main(parser.parse_args()))
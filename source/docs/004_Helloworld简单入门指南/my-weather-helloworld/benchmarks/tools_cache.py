@@ -0,0 +1,54 @@
+"""
+stdio MCPClient 工具列表缓存基准：对比每次查询都调用 list_tools 并重建 OpenAI 工具格式，
+与使用连接时缓存的工具格式时，每个查询在调用大模型之前的额外开销。
+
+运行：python -m benchmarks.tools_cache --queries 500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# MCPClient 要求设置 OPENAI_API_KEY，本基准不会真正调用大模型
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from stdio_transport_client import MCPClient
+
+
+def report(name: str, samples: list[float]):
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<12}{mean * 1e6:>12.1f}{samples[len(samples) // 2] * 1e6:>12.1f}{p99 * 1e6:>12.1f}")
+
+
+async def main(queries: int):
+    client = MCPClient()
+    try:
+        await client.connect_to_server("stdio_transport_server.py")
+
+        uncached = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            client.available_tools = None  # 模拟旧实现：每次查询都重新获取
+            await client.get_available_tools()
+            uncached.append(time.perf_counter() - start)
+
+        cached = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            await client.get_available_tools()
+            cached.append(time.perf_counter() - start)
+
+        print(f"{'模式':<12}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}")
+        report("list_tools", uncached)
+        report("cached", cached)
+    finally:
+        await client.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stdio 客户端工具列表缓存基准")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.queries))
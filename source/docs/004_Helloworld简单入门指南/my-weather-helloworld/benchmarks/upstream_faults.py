@@ -0,0 +1,81 @@
+"""
+上游故障注入测试：让本地桩服务器经历 正常 → 全部失败 → 恢复 几个阶段，观察限流、熔断、重试预算与过期缓存兜底的表现。
+
+运行：python -m benchmarks.upstream_faults --requests 200
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# 在导入天气模块之前缩短缓存与熔断相关的时间，便于在几秒内走完各阶段
+os.environ.setdefault("WEATHER_CACHE_TTL", "1")
+os.environ.setdefault("WEATHER_CACHE_ERROR_TTL", "0")
+os.environ.setdefault("OPENWEATHER_CB_MIN_CALLS", "10")
+os.environ.setdefault("OPENWEATHER_CB_COOLDOWN", "2")
+os.environ.setdefault("OPENWEATHER_RETRY_BASE_DELAY", "0.05")
+
+from benchmarks.stub_openweather import STUB_OPTIONS, start_stub
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+
+async def phase(name: str, cities: list[str], stats, cached_fetch_weather, guard):
+    before = stats.requests
+    latencies, errors = [], 0
+
+    async def one(city: str):
+        nonlocal errors
+        start = time.perf_counter()
+        data = await cached_fetch_weather(city)
+        latencies.append(time.perf_counter() - start)
+        errors += "error" in data
+
+    await asyncio.gather(*(one(city) for city in cities))
+    print(
+        f"{name:<10}{len(cities):>8}{errors:>8}{stats.requests - before:>10}"
+        f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}"
+        f"  {guard.breaker.state}"
+    )
+
+
+async def main(requests: int, latency: float):
+    runner, url, stats = await start_stub(latency=latency)
+    os.environ["OPENWEATHER_API_BASE"] = url
+    from weather_upstream import upstream
+    from weather_cache import cached_fetch_weather, weather_cache
+    from upstream_guard import guard
+
+    options = runner.app[STUB_OPTIONS]
+    hot = [f"Hot{i}" for i in range(20)]
+    print(f"{'阶段':<10}{'查询数':>8}{'失败数':>8}{'上游请求':>10}{'p50(ms)':>10}{'p99(ms)':>10}  熔断状态")
+    try:
+        await phase("预热", hot, stats, cached_fetch_weather, guard)
+        await asyncio.sleep(weather_cache.ttl + 0.2)  # 让热门城市的缓存过期
+
+        options["error_rate"] = 1.0
+        await phase("故障", hot + [f"Cold{i}" for i in range(requests)], stats, cached_fetch_weather, guard)
+        await phase("熔断中", [f"Cold{i}" for i in range(requests, requests * 2)], stats, cached_fetch_weather, guard)
+
+        options["error_rate"] = 0.0
+        await asyncio.sleep(guard.breaker.cooldown + 0.2)
+        # 冷却结束后先放行一次探测请求，成功后熔断器关闭
+        await phase("探测", ["Probe"], stats, cached_fetch_weather, guard)
+        await phase("恢复", [f"Cold{i}" for i in range(requests * 2, requests * 3)], stats, cached_fetch_weather, guard)
+
+        print("缓存统计:", weather_cache.stats())
+        print("上游保护:", guard.stats())
+    finally:
+        await upstream.aclose()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="上游故障注入测试")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="桩服务器固定延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency))
@@ -0,0 +1,59 @@
+"""
+对比每次调用新建 httpx.AsyncClient 与共享连接池时，每个请求产生的 TCP 握手次数与耗时。
+
+运行：python -m benchmarks.upstream_handshakes --requests 200 --concurrency 10
+"""
+import argparse
+import asyncio
+import os
+import time
+import httpx
+from benchmarks.stub_openweather import start_stub
+
+
+async def run(requests: int, concurrency: int, fetch) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await fetch(f"City{i % 10}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start
+
+
+async def main(requests: int, concurrency: int, latency: float):
+    runner, url, stats = await start_stub(latency=latency)
+    # 在导入 weather_upstream 之前把上游地址指向桩服务器
+    os.environ["OPENWEATHER_API_BASE"] = url
+    import weather_upstream
+
+    async def fetch_per_call(city: str):
+        # 旧实现：每次调用都新建客户端
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, params={"q": city}, timeout=30.0)
+            response.raise_for_status()
+            return response.json()
+
+    try:
+        print(f"{'模式':<12}{'请求数':>8}{'握手数':>8}{'握手/请求':>12}{'耗时(s)':>10}{'req/s':>10}")
+        for name, fetch in (("per-call", fetch_per_call), ("pooled", weather_upstream.fetch_weather)):
+            stats.reset()
+            elapsed = await run(requests, concurrency, fetch)
+            print(
+                f"{name:<12}{stats.requests:>8}{stats.connections:>8}"
+                f"{stats.connections / max(stats.requests, 1):>12.3f}{elapsed:>10.3f}{requests / elapsed:>10.1f}"
+            )
+    finally:
+        await weather_upstream.upstream.aclose()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="上游连接池握手次数基准")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务器固定延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency))
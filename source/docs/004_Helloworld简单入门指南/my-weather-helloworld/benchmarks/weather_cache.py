@@ -0,0 +1,47 @@
+"""
+天气缓存基准：模拟少量热门城市的高频并发查询，统计上游请求数与缓存命中情况。
+
+运行：python -m benchmarks.weather_cache --requests 5000 --cities 20 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from benchmarks.stub_openweather import start_stub
+
+
+async def main(requests: int, cities: int, concurrency: int, latency: float):
+    runner, url, stats = await start_stub(latency=latency)
+    os.environ["OPENWEATHER_API_BASE"] = url
+    from weather_upstream import upstream
+    from weather_cache import cached_fetch_weather, weather_cache
+
+    semaphore = asyncio.Semaphore(concurrency)
+    names = [f"City{i}" for i in range(cities)]
+
+    async def one():
+        async with semaphore:
+            # 混入大小写与空白差异，验证缓存键归一化
+            city = random.choice(names)
+            await cached_fetch_weather(random.choice([city, city.upper(), f" {city} "]))
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        print(f"查询数: {requests}, 城市数: {cities}, 上游请求数: {stats.requests}, 耗时: {elapsed:.3f}s")
+        print("缓存统计:", weather_cache.stats())
+    finally:
+        await upstream.aclose()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="天气缓存命中率与请求合并基准")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器固定延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.cities, args.concurrency, args.latency))
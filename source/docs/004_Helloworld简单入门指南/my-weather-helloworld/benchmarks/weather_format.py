@@ -0,0 +1,67 @@
+"""
+format_weather 基准：对比原实现与 text / llm / json 三种输出格式的格式化吞吐量，
+以及每个结果返回给大模型的字节数与估算 token 数。
+
+运行：python -m benchmarks.weather_format --iterations 200000
+"""
+import argparse
+import json
+import time
+from typing import Any
+from benchmarks.stub_openweather import sample_weather
+from conversation import estimate_tokens
+from weather_format import OUTPUT_FORMATS, format_weather
+
+
+def legacy_format_weather(data: dict[str, Any] | str) -> str:
+    """对照组：改动前服务器中的实现"""
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except Exception as e:
+            return f"无法解析天气数据: {e}"
+    if "error" in data:
+        return f"⚠ {data['error']}"
+    city = data.get("name", "未知")
+    country = data.get("sys", {}).get("country", "未知")
+    temp = data.get("main", {}).get("temp", "N/A")
+    humidity = data.get("main", {}).get("humidity", "N/A")
+    wind_speed = data.get("wind", {}).get("speed", "N/A")
+    weather_list = data.get("weather", [{}])
+    description = weather_list[0].get("description", "未知")
+    return (
+        f"🌍 {city}, {country}\n"
+        f"🌡 温度: {temp}°C\n"
+        f"💧 湿度: {humidity}%\n"
+        f"🌬 风速: {wind_speed} m/s\n"
+        f"⛅ 天气: {description}\n"
+    )
+
+
+def throughput(fn, data, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(data)
+    return iterations / (time.perf_counter() - start)
+
+
+def main(iterations: int):
+    data = sample_weather("Beijing", 1816670)
+    # 真实响应还包含坐标、气压、能见度等工具结果用不到的字段
+    data.update(coord={"lon": 116.3972, "lat": 39.9075}, visibility=10000, dt=1700000000, timezone=28800,
+                clouds={"all": 0}, base="stations")
+    raw = json.dumps(data)
+
+    modes = [("legacy", lambda d: legacy_format_weather(d))]
+    modes += [(mode, lambda d, mode=mode: format_weather(d, mode)) for mode in OUTPUT_FORMATS]
+    print(f"{'格式':<8}{'dict 万次/s':>14}{'str 万次/s':>14}{'字节':>8}{'tokens':>8}  示例")
+    for name, fn in modes:
+        output = fn(data)
+        print(f"{name:<8}{throughput(fn, data, iterations) / 1e4:>14.1f}{throughput(fn, raw, iterations // 4) / 1e4:>14.1f}"
+              f"{len(output.encode('utf-8')):>8}{estimate_tokens(output):>8}  {output.strip()[:60]!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="format_weather 吞吐量与 token 基准")
+    parser.add_argument("--iterations", type=int, default=200000)
+    main(parser.parse_args().iterations)
@@ -0,0 +1,62 @@
+"""
+预报 / 历史序列基准：
+1. 逐小时数据按天汇总的耗时，对比 numpy（reduceat 整列计算）与纯 Python 实现；
+2. 返回给大模型的字节数与估算 token 数：上游原始 JSON、逐小时一行、按天汇总、分页后的首页。
+
+运行：python -m benchmarks.weather_series --days 31 --iterations 200
+"""
+import argparse
+import json
+import time
+from benchmarks.stub_openweather import sample_series
+from conversation import estimate_tokens
+import weather_series
+from weather_series import WeatherSeries, aggregate, paginate, render_page
+
+
+def per_call_ms(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(days: int, iterations: int):
+    raw = sample_series("Beijing", 1704067200, days * 24, 3600)
+    info = raw["city"]
+    series = WeatherSeries.from_items(raw["list"], info["name"], info["country"], info["timezone"])
+
+    print(f"{days} 天逐小时数据，共 {len(series)} 个时间点")
+    print(f"{'实现':<10}{'按天 ms':>10}{'每 6 小时 ms':>14}")
+    results = {}
+    for name in ("numpy", "python"):
+        weather_series._np = None if name == "numpy" else False
+        if name == "numpy" and weather_series._numpy() is None:
+            print(f"{name:<10}{'未安装':>10}")
+            continue
+        results[name] = aggregate(series, 24)
+        print(f"{name:<10}{per_call_ms(lambda: aggregate(series, 24), iterations):>10.3f}"
+              f"{per_call_ms(lambda: aggregate(series, 6), iterations):>14.3f}")
+    if len(results) == 2:
+        print("两种实现结果一致" if results["numpy"] == results["python"] else "⚠ 两种实现结果不一致")
+
+    hourly = aggregate(series, 1)
+    daily = aggregate(series, 24)
+    first_page, page, pages = paginate(daily, 1)
+    outputs = {
+        "原始 JSON": json.dumps(raw, ensure_ascii=False),
+        "逐小时": render_page(series, "历史天气", hourly, 1, 1, 1),
+        "按天": render_page(series, "历史天气", daily, 24, 1, 1),
+        "按天首页": render_page(series, "历史天气", first_page, 24, page, pages),
+    }
+    print(f"\n{'结果':<10}{'字节':>10}{'tokens':>10}")
+    for name, text in outputs.items():
+        print(f"{name:<10}{len(text.encode('utf-8')):>10}{estimate_tokens(text):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预报 / 历史序列汇总与结果大小基准")
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    main(args.days, args.iterations)
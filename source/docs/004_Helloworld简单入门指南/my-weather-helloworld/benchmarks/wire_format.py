@@ -0,0 +1,132 @@
+"""
+/call_tool 与 /list_tools 的线上编码基准：JSON、JSON+gzip、MessagePack、MessagePack+gzip。
+1. 离线：典型载荷（call_tool 请求、单城市结果、20 个城市的批量结果、31 天逐小时的历史页、工具列表）
+   编码后的字节数，以及一次编码加一次解码的耗时；
+2. --live：启动桩上游与 HTTP 服务器，以各编码分别发起请求，统计响应在线上的字节数与客户端、服务器的 CPU 时间。
+
+运行：python -m benchmarks.wire_format --iterations 2000 --live --requests 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import zlib
+import aiohttp
+from benchmarks.stub_openweather import sample_series, sample_weather, start_stub
+from benchmarks.suite import process_usage
+from benchmarks.worker_scaling import wait_ready
+from weather_format import format_weather, format_weather_many
+from weather_series import WeatherSeries, aggregate, render_page
+import wire_codec
+from wire_codec import JSON, MSGPACK, decode, encode, gzip_compress
+
+VARIANTS = (("json", JSON, False), ("json+gzip", JSON, True), ("msgpack", MSGPACK, False), ("msgpack+gzip", MSGPACK, True))
+
+
+def available_variants():
+    return [variant for variant in VARIANTS if variant[1] == JSON or wire_codec.msgpack is not None]
+
+
+async def sample_payloads() -> dict[str, object]:
+    from http_with_sse_transport_server import get_list_tools_data
+
+    raw = sample_series("Beijing", 1704067200, 31 * 24, 3600)
+    info = raw["city"]
+    series = WeatherSeries.from_items(raw["list"], info["name"], info["country"], info["timezone"])
+    cities = [f"City{i}" for i in range(20)]
+    return {
+        "call_tool 请求": {"tool_name": "query_weather", "tool_args": {"city": "Beijing"}},
+        "单城市结果": {"result": format_weather(sample_weather("Beijing"))},
+        "20 城市结果": {"result": format_weather_many({city: sample_weather(city, i) for i, city in enumerate(cities)})},
+        "历史页（逐小时）": {"result": render_page(series, "历史天气", aggregate(series, 1), 1, 1, 1)},
+        "工具列表": await get_list_tools_data(),
+    }
+
+
+def roundtrip_us(obj, content_type: str, compress: bool, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = encode(obj, content_type)
+        if compress:
+            body = gzip_compress(body)
+            # 解压与 aiohttp 自动解压一致，计入客户端开销
+            body = zlib.decompress(body, 31)
+        decode(body, content_type)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def offline(iterations: int):
+    variants = available_variants()
+    if wire_codec.msgpack is None:
+        print("未安装 msgpack，只比较 JSON")
+    print(f"{'载荷':<16}" + "".join(f"{name + ' B':>16}{'µs':>8}" for name, _, _ in variants))
+    for name, obj in (await sample_payloads()).items():
+        row = f"{name:<16}"
+        for _, content_type, compress in variants:
+            body = encode(obj, content_type)
+            size = len(gzip_compress(body)) if compress else len(body)
+            row += f"{size:>16}{roundtrip_us(obj, content_type, compress, iterations):>8.1f}"
+        print(row)
+
+
+async def live(args):
+    runner, upstream_url, _ = await start_stub()
+    env = {
+        **os.environ,
+        "OPENWEATHER_API_BASE": upstream_url,
+        "OPENWEATHER_HISTORY_API_BASE": upstream_url.replace("/weather", "/history/city"),
+        "OPEN_WEATHER_API_KEY": "benchmark",
+        "LOG_LEVEL": "WARNING",
+    }
+    url = f"http://127.0.0.1:{args.port}"
+    server = await asyncio.create_subprocess_exec(
+        sys.executable, "http_with_sse_transport_server.py", "--host", "127.0.0.1", "--port", str(args.port),
+        env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    calls = {
+        "query_weather": {"city": "Beijing"},
+        "query_weather_many": {"cities": [f"City{i}" for i in range(20)]},
+    }
+    try:
+        await wait_ready(url)
+        print(f"\n实时：每种编码 {args.requests} 次 /call_tool（结果已缓存，只比较编码与传输）")
+        print(f"{'工具':<20}{'编码':<14}{'响应 B':>10}{'客户端 ms/次':>14}{'服务器 ms/次':>14}")
+        async with aiohttp.ClientSession() as session:
+            for tool_name, tool_args in calls.items():
+                for name, content_type, compress in available_variants():
+                    body = encode({"tool_name": tool_name, "tool_args": tool_args}, content_type)
+                    headers = {"Content-Type": content_type, "Accept": content_type,
+                               "Accept-Encoding": "gzip" if compress else "identity"}
+
+                    async def one() -> int:
+                        async with session.post(f"{url}/call_tool", data=body, headers=headers) as response:
+                            size = response.content_length or 0
+                            decode(await response.read(), response.headers.get("Content-Type"))
+                        return size
+
+                    await one()  # 预热缓存与连接
+                    client_cpu, server_cpu = time.process_time(), process_usage(server.pid)[0]
+                    sizes = [await one() for _ in range(args.requests)]
+                    client_ms = (time.process_time() - client_cpu) / args.requests * 1000
+                    server_ms = (process_usage(server.pid)[0] - server_cpu) / args.requests * 1000
+                    print(f"{tool_name:<20}{name:<14}{sizes[-1]:>10}{client_ms:>14.3f}{server_ms:>14.3f}")
+    finally:
+        server.terminate()
+        await server.wait()
+        await runner.cleanup()
+
+
+async def main(args):
+    await offline(args.iterations)
+    if args.live:
+        await live(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/call_tool 线上编码基准")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--live", action="store_true", help="启动 HTTP 服务器测量线上字节数与 CPU 时间")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8766)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+多 worker 扩展基准：依次以 1..N 个 worker 启动 http_with_sse_transport_server.py（上游指向本地桩服务器），
+压测 /call_tool 的吞吐量，并统计各配置下实际到达上游的请求数，验证共享缓存跨进程生效。
+
+运行：python -m benchmarks.worker_scaling --workers 1 2 4 --requests 4000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import aiohttp
+from benchmarks.stub_openweather import start_stub
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/list_tools") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("服务器启动超时")
+
+
+async def load(url: str, requests: int, concurrency: int, cities: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def one():
+            data = {"tool_name": "query_weather", "tool_args": {"city": f"City{random.randrange(cities)}"}}
+            async with semaphore:
+                async with session.post(f"{url}/call_tool", json=data) as response:
+                    await response.read()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+async def main(workers: list[int], requests: int, concurrency: int, cities: int, port: int, latency: float):
+    runner, upstream_url, stats = await start_stub(latency=latency)
+    url = f"http://127.0.0.1:{port}"
+    print(f"{'workers':>8}{'req/s':>10}{'上游请求数':>12}")
+    try:
+        for count in workers:
+            stats.reset()
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {
+                    **os.environ,
+                    "OPENWEATHER_API_BASE": upstream_url,
+                    "WEATHER_SHARED_CACHE": os.path.join(tmp, "weather_cache.sqlite3"),
+                }
+                server = await asyncio.create_subprocess_exec(
+                    sys.executable, "http_with_sse_transport_server.py",
+                    "--host", "127.0.0.1", "--port", str(port), "--workers", str(count),
+                    env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+                )
+                try:
+                    await wait_ready(url)
+                    rps = await load(url, requests, concurrency, cities)
+                finally:
+                    server.terminate()
+                    await server.wait()
+            print(f"{count:>8}{rps:>10.1f}{stats.requests:>12}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多 worker 扩展基准")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器固定延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.requests, args.concurrency, args.cities, args.port, args.latency))
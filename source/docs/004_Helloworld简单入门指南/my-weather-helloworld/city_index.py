@@ -0,0 +1,322 @@
+import os
+import sys
+import gzip
+import json
+import mmap
+import struct
+import bisect
+import logging
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Iterable, NamedTuple, Optional
+from dotenv import load_dotenv
+from metrics import REGISTRY
+
+# 加载.env文件
+load_dotenv()
+
+# 城市索引配置
+# OpenWeather 的城市列表（http://bulk.openweathermap.org/sample/city.list.json.gz），未设置时只使用内置别名表
+CITY_LIST_PATH = os.getenv("WEATHER_CITY_LIST")
+# 额外的别名 JSON 文件：{"别名": "Name,CC" 或城市 ID}，与内置别名合并
+CITY_ALIASES_PATH = os.getenv("WEATHER_CITY_ALIASES")
+CITY_FUZZY = os.getenv("WEATHER_CITY_FUZZY", "1").lower() in ("1", "true", "yes")  # 精确匹配失败时是否尝试编辑距离为 1 的匹配
+FUZZY_MIN_CHARS = 4  # 短于该长度的名称不做模糊匹配，避免误匹配
+FUZZY_CACHE_SIZE = 1024  # 模糊匹配结果的 LRU 条目数
+# 模糊匹配时尝试替换或插入的字符（名称归一化后只包含小写字母、数字与空格）
+FUZZY_ALPHABET = "abcdefghijklmnopqrstuvwxyz "
+
+# 编译后的索引文件格式：头部 + 名称偏移 (uint32 × n+1) + 城市 ID (uint32 × n) + 国家代码 (2 字节 × n) + 名称区
+# 各条目按 (归一化名称, 国家代码, ID) 排序，按名称二分查找；文件通过 mmap 只读映射，只有访问到的页才占用内存
+INDEX_MAGIC = b"CITYIDX1"
+INDEX_HEADER = struct.Struct("=8sII")  # magic, 城市数, 名称区字节数
+INDEX_SUFFIX = ".idx"
+# 每隔多少个条目在内存中保留一个名称作为一级索引：先在这些名称上用 bisect 定位块，再在块内二分
+INDEX_BLOCK = 64
+
+# 常见城市的中文名，值为 OpenWeather 的 "城市名,国家代码"
+BUILTIN_ALIASES: dict[str, str] = {
+    "北京": "Beijing,CN", "上海": "Shanghai,CN", "广州": "Guangzhou,CN", "深圳": "Shenzhen,CN",
+    "天津": "Tianjin,CN", "重庆": "Chongqing,CN", "成都": "Chengdu,CN", "杭州": "Hangzhou,CN",
+    "武汉": "Wuhan,CN", "西安": "Xi'an,CN", "南京": "Nanjing,CN", "苏州": "Suzhou,CN",
+    "长沙": "Changsha,CN", "郑州": "Zhengzhou,CN", "沈阳": "Shenyang,CN", "青岛": "Qingdao,CN",
+    "大连": "Dalian,CN", "厦门": "Xiamen,CN", "昆明": "Kunming,CN", "哈尔滨": "Harbin,CN",
+    "济南": "Jinan,CN", "福州": "Fuzhou,CN", "合肥": "Hefei,CN", "南宁": "Nanning,CN",
+    "贵阳": "Guiyang,CN", "拉萨": "Lhasa,CN", "乌鲁木齐": "Urumqi,CN", "兰州": "Lanzhou,CN",
+    "海口": "Haikou,CN", "三亚": "Sanya,CN", "香港": "Hong Kong,HK", "澳门": "Macau,MO",
+    "台北": "Taipei,TW", "东京": "Tokyo,JP", "大阪": "Osaka,JP", "首尔": "Seoul,KR",
+    "新加坡": "Singapore,SG", "曼谷": "Bangkok,TH", "悉尼": "Sydney,AU", "伦敦": "London,GB",
+    "巴黎": "Paris,FR", "柏林": "Berlin,DE", "莫斯科": "Moscow,RU", "纽约": "New York,US",
+    "洛杉矶": "Los Angeles,US", "旧金山": "San Francisco,US", "多伦多": "Toronto,CA",
+}
+# 中文地名常带的行政区划后缀，别名查找失败时去掉后重试
+ALIAS_SUFFIXES = ("市", "省")
+
+
+class CityMatch(NamedTuple):
+    query: str  # 发给上游的 q 参数（city_id 为空时使用）
+    city_id: Optional[int]  # 唯一匹配到的 OpenWeather 城市 ID，同时用作缓存键
+    kind: str  # id / exact / alias / fuzzy
+
+
+def normalize_name(name: str) -> str:
+    """去掉变音符号、大小写、连字符与撇号：" São-Paulo " 与 "sao paulo" 归一化成同一个名称"""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.casefold().replace("-", " ").replace("'", "").replace("’", "")
+    return " ".join(text.split())
+
+
+def split_country(city: str) -> tuple[str, Optional[str]]:
+    """拆分 OpenWeather 的 "城市名,国家代码" 写法（"城市名,州,国家代码" 时忽略州）"""
+    parts = [part.strip() for part in city.split(",")]
+    if len(parts) > 1 and len(parts[-1]) == 2 and parts[-1].isalpha():
+        return parts[0], parts[-1].upper()
+    return city, None
+
+
+def build_index(source: str, target: str) -> int:
+    """
+    把 OpenWeather 的 city.list.json(.gz) 编译成紧凑的索引文件。
+    :return: 城市数
+    """
+    opener = gzip.open if source.endswith(".gz") else open
+    with opener(source, "rt", encoding="utf-8") as f:
+        cities = json.load(f)
+    rows = sorted({
+        (normalize_name(city["name"]).encode("utf-8"), (city.get("country") or "").upper().encode("ascii", "ignore")[:2].ljust(2), int(city["id"]))
+        for city in cities if city.get("name")
+    })
+    del cities
+    offsets, ids, countries, names = array("I", [0]), array("I"), bytearray(), bytearray()
+    for name, country, city_id in rows:
+        names += name
+        offsets.append(len(names))
+        ids.append(city_id)
+        countries += country
+    tmp = f"{target}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(ids), len(names)))
+        f.write(offsets.tobytes())
+        f.write(ids.tobytes())
+        f.write(countries)
+        f.write(names)
+    os.replace(tmp, target)
+    return len(ids)
+
+
+class CityIndex:
+    """mmap 映射的城市索引，按归一化名称二分查找，不在 Python 堆上为每个城市创建对象"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, names_size = INDEX_HEADER.unpack_from(self._mmap)
+        if magic != INDEX_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是城市索引文件: {path}")
+        self.count = count
+        view = memoryview(self._mmap)
+        pos = INDEX_HEADER.size
+        self._offsets = view[pos:pos + (count + 1) * 4].cast("I")
+        pos += (count + 1) * 4
+        self._ids = view[pos:pos + count * 4].cast("I")
+        pos += count * 4
+        self._countries = view[pos:pos + count * 2]
+        pos += count * 2
+        self._names = view[pos:pos + names_size]
+        self._block_keys = [self.name_at(i) for i in range(0, count, INDEX_BLOCK)]
+
+    @classmethod
+    def load(cls, source: str) -> "CityIndex":
+        """加载 source 对应的索引文件，不存在或比城市列表旧时先编译"""
+        target = source if source.endswith(INDEX_SUFFIX) else source + INDEX_SUFFIX
+        if target != source and (not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source)):
+            logging.info("正在编译城市索引 %s", target)
+            build_index(source, target)
+        return cls(target)
+
+    def name_at(self, i: int) -> bytes:
+        return bytes(self._names[self._offsets[i]:self._offsets[i + 1]])
+
+    def country_at(self, i: int) -> str:
+        return bytes(self._countries[i * 2:i * 2 + 2]).decode("ascii").strip()
+
+    def _lower_bound(self, key: bytes) -> int:
+        block = bisect.bisect_left(self._block_keys, key)
+        lo, hi = max(block - 1, 0) * INDEX_BLOCK, min(block * INDEX_BLOCK, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, name: str, country: Optional[str] = None) -> list[int]:
+        """:return: 归一化名称（及国家代码）完全相同的城市 ID 列表"""
+        key = normalize_name(name).encode("utf-8")
+        ids = []
+        i = self._lower_bound(key)
+        while i < self.count and self.name_at(i) == key:
+            if country is None or self.country_at(i) == country:
+                ids.append(self._ids[i])
+            i += 1
+        return ids
+
+    def contains(self, key: bytes) -> bool:
+        i = self._lower_bound(key)
+        return i < self.count and self.name_at(i) == key
+
+    def close(self):
+        for view in (self._offsets, self._ids, self._countries, self._names):
+            view.release()
+        self._mmap.close()
+
+
+def edits1(name: str) -> Iterable[str]:
+    """编辑距离为 1 的全部写法，按常见程度排序：相邻交换、删除、替换、插入"""
+    splits = [(name[:i], name[i:]) for i in range(len(name) + 1)]
+    for left, right in splits:
+        if len(right) > 1:
+            yield left + right[1] + right[0] + right[2:]
+    for left, right in splits:
+        if right:
+            yield left + right[1:]
+    for left, right in splits:
+        if right:
+            for ch in FUZZY_ALPHABET:
+                if ch != right[0]:
+                    yield left + ch + right[1:]
+    for left, right in splits:
+        for ch in FUZZY_ALPHABET:
+            yield left + ch + right
+
+
+class CityResolver:
+    """
+    把大模型给出的城市名解析为 OpenWeather 城市 ID：纯数字 ID、别名（含中文名）、精确匹配、编辑距离为 1 的模糊匹配。
+    同名城市有多个时（如 London 在 GB 与 CA 都有）不猜测，返回 None，由上游按名称查询。
+    """
+
+    def __init__(self, index: Optional[CityIndex] = None, aliases: Optional[dict[str, str]] = None, fuzzy: bool = CITY_FUZZY):
+        self.index = index
+        self.aliases = {normalize_name(alias): str(target) for alias, target in (aliases or BUILTIN_ALIASES).items()}
+        self.fuzzy = fuzzy and index is not None
+        self._fuzzy_cache: OrderedDict[str, Optional[str]] = OrderedDict()
+        self.counts = {"id": 0, "alias": 0, "exact": 0, "fuzzy": 0, "ambiguous": 0, "unresolved": 0}
+
+    def _unique(self, name: str, country: Optional[str]) -> Optional[int]:
+        ids = self.index.lookup(name, country)
+        if len(ids) == 1:
+            return ids[0]
+        if ids:
+            self.counts["ambiguous"] += 1
+        return None
+
+    def _alias(self, key: str) -> Optional[str]:
+        target = self.aliases.get(key)
+        if target is None:
+            for suffix in ALIAS_SUFFIXES:
+                if key.endswith(suffix):
+                    target = self.aliases.get(key[:-len(suffix)])
+                    break
+        return target
+
+    def _correct(self, name: str) -> Optional[str]:
+        """返回与 name 编辑距离为 1 的城市名（归一化后），结果缓存"""
+        key = normalize_name(name)
+        if key in self._fuzzy_cache:
+            self._fuzzy_cache.move_to_end(key)
+            return self._fuzzy_cache[key]
+        corrected = None
+        if len(key) >= FUZZY_MIN_CHARS:
+            corrected = next((candidate for candidate in edits1(key) if self.index.contains(candidate.encode("utf-8"))), None)
+        self._fuzzy_cache[key] = corrected
+        if len(self._fuzzy_cache) > FUZZY_CACHE_SIZE:
+            self._fuzzy_cache.popitem(last=False)
+        return corrected
+
+    def resolve(self, city: str) -> Optional[CityMatch]:
+        """:return: 解析结果；无法识别时返回 None，调用方按原名称查询"""
+        city = city.strip()
+        if city.isdigit():
+            self.counts["id"] += 1
+            return CityMatch(city, int(city), "id")
+
+        target = self._alias(normalize_name(city))
+        if target is not None:
+            self.counts["alias"] += 1
+            if target.isdigit():
+                return CityMatch(target, int(target), "alias")
+            name, country = split_country(target)
+            return CityMatch(target, self._unique(name, country) if self.index else None, "alias")
+
+        if self.index is None:
+            self.counts["unresolved"] += 1
+            return None
+        name, country = split_country(city)
+        ids = self.index.lookup(name, country)
+        if ids:
+            self.counts["exact"] += 1
+            if len(ids) > 1:
+                self.counts["ambiguous"] += 1
+            return CityMatch(city, ids[0] if len(ids) == 1 else None, "exact")
+        if country is not None and self.index.contains(normalize_name(name).encode("utf-8")):
+            # 名称存在但国家代码不匹配（如 London,FR）：不做模糊匹配，避免纠正成另一个城市，由上游按原名称查询
+            self.counts["unresolved"] += 1
+            return None
+
+        corrected = self._correct(name) if self.fuzzy else None
+        if corrected is None:
+            self.counts["unresolved"] += 1
+            return None
+        self.counts["fuzzy"] += 1
+        query = f"{corrected},{country}" if country else corrected
+        return CityMatch(query, self._unique(corrected, country), "fuzzy")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "cities": self.index.count if self.index else 0,
+            "aliases": len(self.aliases),
+            "fuzzy_enabled": self.fuzzy,
+            **self.counts,
+        }
+
+    def metrics(self) -> Iterable[tuple[str, str, str, float, dict[str, str]]]:
+        for kind, count in self.counts.items():
+            yield "weather_city_resolutions_total", "counter", "城市名解析次数（按匹配方式分类）", count, {"kind": kind}
+
+
+def load_aliases(path: Optional[str] = CITY_ALIASES_PATH) -> dict[str, str]:
+    aliases = dict(BUILTIN_ALIASES)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            aliases.update(json.load(f))
+    return aliases
+
+
+_resolver: Optional[CityResolver] = None
+
+
+def city_resolver() -> CityResolver:
+    """进程级单例，首次使用时才加载索引，不影响服务器冷启动"""
+    global _resolver
+    if _resolver is None:
+        index = CityIndex.load(CITY_LIST_PATH) if CITY_LIST_PATH else None
+        _resolver = CityResolver(index, load_aliases())
+        REGISTRY.add_collector(_resolver.metrics)
+    return _resolver
+
+
+def resolve_city(city: str) -> Optional[CityMatch]:
+    return city_resolver().resolve(city)
+
+
+if __name__ == "__main__":
+    # 预先编译索引：python city_index.py city.list.json.gz
+    if len(sys.argv) != 2:
+        print("Usage: python city_index.py <city.list.json[.gz]>")
+        sys.exit(1)
+    print(f"已编译 {build_index(sys.argv[1], sys.argv[1] + INDEX_SUFFIX)} 个城市")
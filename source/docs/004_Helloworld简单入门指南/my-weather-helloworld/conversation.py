@@ -0,0 +1,189 @@
+import os
+import hashlib
+from typing import Any, Optional
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+# 对话记忆配置
+MEMORY_TOKENS = int(os.getenv("MCP_MEMORY_TOKENS", "4000"))  # 历史对话占用的 token 预算，0 表示每次查询都不带历史
+MEMORY_RECENT_TURNS = int(os.getenv("MCP_MEMORY_RECENT_TURNS", "2"))  # 最近几轮对话原样保留
+MEMORY_SUMMARY_CHARS = int(os.getenv("MCP_MEMORY_SUMMARY_CHARS", "80"))  # 较早轮次的工具结果压缩后保留的字符数
+# 可选的系统提示词，放在每次请求的最前面，作为稳定前缀
+SYSTEM_PROMPT = os.getenv("MCP_SYSTEM_PROMPT", "")
+# 超出预算时一次删除到预算的这个比例以下，避免每轮都删除最早的一轮导致前缀频繁变化
+LOW_WATERMARK = 0.7
+# 短于该长度的工具结果不做去重
+DEDUPE_MIN_CHARS = 40
+
+Message = dict[str, Any]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 个字符一个 token，中文等非 ASCII 字符约一个字符一个 token"""
+    non_ascii = sum(1 for ch in text if ch > "\x7f")
+    return (len(text) - non_ascii) // 4 + non_ascii
+
+
+def message_tokens(message: Message) -> int:
+    tokens = 4  # 角色与分隔符的开销
+    if message.get("content"):
+        tokens += estimate_tokens(message["content"])
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += estimate_tokens(function.get("name", "")) + estimate_tokens(function.get("arguments", ""))
+    return tokens
+
+
+def summarize_tool_result(content: str, limit: int = MEMORY_SUMMARY_CHARS) -> str:
+    """把工具结果压缩成一行：合并换行，超出 limit 的部分省略"""
+    text = " ".join((content or "").split())
+    return text if len(text) <= limit else text[:limit] + "…（已省略）"
+
+
+class Turn:
+    """一轮对话：从用户问题到最终回答的全部消息"""
+
+    __slots__ = ("messages", "tokens", "compacted", "compacted_tokens")
+
+    def __init__(self, messages: list[Message]):
+        self.messages = messages
+        self.tokens = sum(message_tokens(message) for message in messages)
+        self.compacted: Optional[list[Message]] = None
+        self.compacted_tokens = 0
+
+
+class ConversationMemory:
+    """
+    多轮对话记忆，按 token 预算裁剪：
+    - 最近 recent_turns 轮原样保留；
+    - 更早的轮次把工具结果压缩为一行摘要，压缩结果计算一次后不再变化，使请求前缀保持稳定，命中服务端的 prompt 缓存；
+    - 内容完全相同的工具结果只保留第一份，之后的引用它的 tool_call_id；
+    - 超出预算时一次删除若干最早的轮次，直到低于预算的 LOW_WATERMARK。
+    """
+
+    def __init__(
+        self,
+        budget: int = MEMORY_TOKENS,
+        recent_turns: int = MEMORY_RECENT_TURNS,
+        summary_chars: int = MEMORY_SUMMARY_CHARS,
+        system_prompt: str = SYSTEM_PROMPT,
+    ):
+        self.budget = budget
+        self.recent_turns = recent_turns
+        self.summary_chars = summary_chars
+        self.prefix: list[Message] = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        self.recent: list[Turn] = []  # 原样保留的最近轮次
+        self.older: list[Turn] = []  # 已压缩的较早轮次
+        self.dropped_turns = 0
+        self.prompt_tokens: list[int] = []  # 最近一次查询中每次大模型调用的 prompt tokens
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    @staticmethod
+    def _dedupe(message: Message, seen: dict[str, str]) -> Optional[str]:
+        """内容与之前的工具结果完全相同时，返回引用文本；否则记录并返回 None"""
+        content = message.get("content") or ""
+        if len(content) < DEDUPE_MIN_CHARS:
+            return None
+        digest = hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+        if digest in seen:
+            return f"（与 {seen[digest]} 的结果相同）"
+        seen[digest] = message.get("tool_call_id", "")
+        return None
+
+    def _render(self, turn: Turn, seen: dict[str, str], compact: bool) -> list[Message]:
+        rendered = []
+        for message in turn.messages:
+            if message.get("role") == "tool":
+                content = self._dedupe(message, seen)
+                if content is None and compact:
+                    content = summarize_tool_result(message.get("content", ""), self.summary_chars)
+                if content is not None:
+                    message = {**message, "content": content}
+            rendered.append(message)
+        return rendered
+
+    def _compact_older(self):
+        """重新计算所有较早轮次的压缩结果；只在轮次被压缩或删除时调用，平时前缀保持不变"""
+        seen: dict[str, str] = {}
+        for turn in self.older:
+            turn.compacted = self._render(turn, seen, compact=True)
+            turn.compacted_tokens = sum(message_tokens(message) for message in turn.compacted)
+
+    def history_tokens(self) -> int:
+        return sum(turn.compacted_tokens for turn in self.older) + sum(turn.tokens for turn in self.recent)
+
+    def raw_tokens(self) -> int:
+        """不做压缩时保留下来的历史对话的 token 数"""
+        return sum(turn.tokens for turn in self.older) + sum(turn.tokens for turn in self.recent)
+
+    def build(self, query: str) -> list[Message]:
+        """:return: 本次查询的 messages：稳定前缀 + 已压缩的轮次 + 最近轮次 + 当前问题"""
+        self.prompt_tokens = []
+        messages = list(self.prefix)
+        if self.enabled:
+            for turn in self.older:
+                messages.extend(turn.compacted)
+            # 最近轮次原样保留，只把与其他最近轮次重复的工具结果替换为引用
+            seen: dict[str, str] = {}
+            for turn in self.recent:
+                messages.extend(self._render(turn, seen, compact=False))
+        messages.append({"role": "user", "content": query})
+        return messages
+
+    def record_prompt(self, messages: list[Message], usage: Any = None):
+        """记录一次大模型调用的 prompt tokens，优先使用服务端返回的 usage"""
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        if prompt_tokens is None:
+            prompt_tokens = sum(message_tokens(message) for message in messages)
+        self.prompt_tokens.append(prompt_tokens)
+
+    def commit(self, messages: list[Message]):
+        """查询成功结束后保存这一轮（从用户问题到最终回答的全部消息）"""
+        if not self.enabled:
+            return
+        self.recent.append(Turn(messages))
+        changed = False
+        while len(self.recent) > self.recent_turns:
+            self.older.append(self.recent.pop(0))
+            changed = True
+        if changed:
+            self._compact_older()
+        self._fit()
+
+    def _fit(self):
+        if self.history_tokens() <= self.budget:
+            return
+        target = self.budget * LOW_WATERMARK
+        while self.history_tokens() > target:
+            if self.older:
+                self.older.pop(0)
+                self.dropped_turns += 1
+            elif len(self.recent) > 1:
+                self.older.append(self.recent.pop(0))
+            elif self.recent:
+                self.recent.pop(0)
+                self.dropped_turns += 1
+            else:
+                break
+            # 删除最早的轮次后，去重引用可能指向已删除的结果，重新计算压缩结果
+            self._compact_older()
+
+    def clear(self):
+        self.recent.clear()
+        self.older.clear()
+        self.dropped_turns = 0
+
+    def report(self) -> str:
+        prompts = ", ".join(str(tokens) for tokens in self.prompt_tokens) or "N/A"
+        if not self.enabled:
+            return f"[prompt tokens: {prompts}]"
+        turns = len(self.older) + len(self.recent)
+        return (
+            f"[prompt tokens: {prompts}; 历史 {turns} 轮（压缩 {len(self.older)} 轮，删除 {self.dropped_turns} 轮），"
+            f"历史 {self.history_tokens()} tokens / 未压缩 {self.raw_tokens()} tokens]"
+        )
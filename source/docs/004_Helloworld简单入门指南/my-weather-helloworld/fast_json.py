@@ -0,0 +1,26 @@
+import json
+from typing import Any
+
+# 优先使用 orjson（uv add orjson），未安装时回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 编码的紧凑 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """序列化为紧凑 JSON 字符串，可作为 aiohttp 的 json_serialize"""
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
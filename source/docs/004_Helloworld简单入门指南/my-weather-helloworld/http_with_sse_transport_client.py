@@ -1,15 +1,46 @@
 import asyncio
 import os
-import json
-from typing import Optional
+import time
+import uuid
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Optional
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import aiohttp
+import fast_json
+from tool_calls import MAX_ITERATIONS, TOOL_CONCURRENCY, TOOL_TIMEOUT, make_tool_runner, print_progress, run_tool_calls, tool_names
+from llm_stream import STREAM_OUTPUT, StreamTiming, StreamedTurn
+from metrics import CLIENT_LLM_SECONDS, QueryBreakdown
+from conversation import ConversationMemory
+from tool_cache import ToolResultCache
+from admission import TIMEOUT_HEADER
+from wire_codec import WIRE_FORMAT, accept_headers, read_response, request_body
+from weather_series import SERIES_TOOLS
+import profiling
 
 
 # 加载.env文件，确保API Key受到保护
 load_dotenv()
 
+# MCP HTTP 服务器地址；需要同时使用多个服务器时见 mcp_router.py
+SERVER_URL = os.getenv("MCP_HTTP_SERVER_URL", "http://localhost:8000").rstrip("/")
+# 与 MCP 服务器之间的 HTTP 连接池配置
+HTTP_LIMIT = int(os.getenv("MCP_HTTP_LIMIT", "100"))  # 连接池总连接数上限
+HTTP_LIMIT_PER_HOST = int(os.getenv("MCP_HTTP_LIMIT_PER_HOST", "20"))  # 单个主机的连接数上限（含 SSE 长连接）
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("MCP_HTTP_KEEPALIVE_TIMEOUT", "30"))  # 空闲连接保留秒数
+HTTP_DNS_CACHE_TTL = int(os.getenv("MCP_HTTP_DNS_CACHE_TTL", "300"))  # DNS 解析结果缓存秒数
+# 每次查询前，距上次获取工具列表超过该秒数时用 ETag 重新验证（未变化时服务器返回 304），0 表示每次查询都验证
+TOOLS_REVALIDATE_INTERVAL = float(os.getenv("MCP_TOOLS_REVALIDATE_INTERVAL", "30"))
+# 预报 / 历史工具分块读取时最多拼接给大模型的页数，剩余的页由大模型按末页提示的 page=N 再取
+STREAM_MAX_PAGES = int(os.getenv("MCP_STREAM_MAX_PAGES", "4"))
+
+
+def check_admission(response: aiohttp.ClientResponse):
+    """服务器因过载拒绝调用（429 / 503）时抛出异常，错误信息中带上建议的重试间隔，供大模型决定是否稍后重试"""
+    if response.status in (429, 503):
+        retry_after = response.headers.get("Retry-After", "1")
+        raise ValueError(f"服务器繁忙（HTTP {response.status}），请 {retry_after} 秒后重试")
+
 
 class MCPClient:
     def __init__(self):
@@ -21,34 +52,83 @@ class MCPClient:
             raise ValueError("未找到OpenAI API Key，请在.env文件中设置OPENAI_API_KEY")
 
         self.client = AsyncOpenAI(api_key=self.openai_api_key, base_url=self.base_url)
-        self.session = aiohttp.ClientSession()
+        # aiohttp.ClientSession 需要在事件循环中创建，见 open_session()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.server_url = SERVER_URL
         self.tools = []
+        self.tools_etag: Optional[str] = None  # /list_tools 的 ETag，用于条件请求
+        self.tools_checked_at = 0.0  # 上次获取或验证工具列表的时间（time.monotonic()）
+        self.tools_revalidate_interval = TOOLS_REVALIDATE_INTERVAL
+        self.available_tools: list[dict] = []  # 转换好的 OpenAI 工具格式
+        self.stream: Optional[aiohttp.ClientResponse] = None  # /connect 的 SSE 长连接
+        self.session_id: Optional[str] = None
+        self.listener: Optional[asyncio.Task] = None
+        self.pending: dict[str, asyncio.Future] = {}  # request_id -> 等待推送结果的 future
+        self.streams: dict[str, asyncio.Queue] = {}  # request_id -> stream_tool 接收分块结果的队列
+        self.on_progress: Optional[Callable[[str, float, Optional[float]], None]] = None  # 工具进度回调 (工具名, 已完成, 总数)
+        self.max_iterations = MAX_ITERATIONS  # 最多进行的工具调用轮数
+        self.tool_concurrency = TOOL_CONCURRENCY  # 同一轮中并发执行的工具调用数上限
+        self.tool_timeout = TOOL_TIMEOUT  # 单个工具调用超时（秒）
+        self.stream_output = STREAM_OUTPUT  # chat_loop 是否流式输出回答
+        self.last_timing: Optional[StreamTiming] = None
+        self.last_breakdown: Optional[QueryBreakdown] = None  # process_query 最近一次查询的分阶段耗时
+        self.memory = ConversationMemory()  # 多轮对话记忆，MCP_MEMORY_TOKENS=0 时关闭
+        # 工具结果缓存：TTL 来自 /list_tools 中工具 annotations 的 cacheTtl，MCP_TOOL_RESULT_CACHE=0 时关闭
+        self.tool_cache = ToolResultCache()
+        self.wire_format = WIRE_FORMAT  # /call_tool 与 /list_tools 使用的编码：json 或 msgpack
+        self.stream_max_pages = STREAM_MAX_PAGES
+
+    def open_session(self) -> aiohttp.ClientSession:
+        """在事件循环中创建共享的 aiohttp 会话，使用可配置的连接池与更快的 JSON 序列化"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_LIMIT,
+                limit_per_host=HTTP_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            )
+            self.session = aiohttp.ClientSession(connector=connector, json_serialize=fast_json.dumps_str)
+        return self.session
 
     async def connect_to_server(self):
-        """连接到MCP服务器并列出可用工具"""
-        async with self.session.get("http://localhost:8000/connect") as resp:
-            async for line in resp.content:
-                line = line.decode('utf-8').strip()
-                if line.startswith('data:'):
-                    data = json.loads(line[5:])
-                    if data.get("message") == "Connected":
-                        # 获取可用工具
-                        response = await self.session.get("http://localhost:8000/list_tools")
-                        try:
-                            tools_data = await response.json()
-                            self.tools = tools_data.get("tools", [])
-                            print("\n已连接到服务器，支持以下工具:", [tool.get("name") for tool in self.tools])
-                        except json.JSONDecodeError:
-                            print("无法解析服务器返回的工具列表数据")
-                        break
+        """连接到MCP服务器并列出可用工具，SSE 长连接保持打开以接收工具结果推送"""
+        self.open_session()
+        # SSE 长连接不设置总超时，空闲时由服务器心跳保活
+        self.stream = await self.session.get(
+            f"{self.server_url}/connect", timeout=aiohttp.ClientTimeout(total=None)
+        )
+        events = self.read_events(self.stream)
+        async for _, data in events:
+            if data.get("message") == "Connected":
+                self.session_id = data.get("session_id")
+                break
+        # 后台持续读取服务器推送的事件
+        self.listener = asyncio.create_task(self.listen(events))
 
-    async def process_query(self, query: str) -> str:
+        # 获取可用工具
+        try:
+            await self.refresh_tools()
+            print("\n已连接到服务器，支持以下工具:", [tool.get("name") for tool in self.tools])
+        except ValueError:
+            print("无法解析服务器返回的工具列表数据")
+
+    async def refresh_tools(self) -> bool:
         """
-        使用大模型处理查询并调用可用的MCP工具 (Function Calling)
+        重新获取工具列表。携带上次的 ETag 发起条件请求，服务器返回 304 时直接复用已有结果。
+        :return: 工具列表是否发生了变化
         """
-        messages = [{"role": "user", "content": query}]
-
-        available_tools = [{
+        headers = accept_headers(self.wire_format)
+        if self.tools_etag:
+            headers["If-None-Match"] = self.tools_etag
+        async with self.session.get(f"{self.server_url}/list_tools", headers=headers) as response:
+            if response.status == 304:
+                self.tools_checked_at = time.monotonic()
+                return False
+            tools_data = await read_response(response)
+            self.tools_etag = response.headers.get("ETag")
+        self.tools_checked_at = time.monotonic()
+        self.tools = tools_data.get("tools", [])
+        self.available_tools = [{
             "type": "function",
             "function": {
                 "name": tool.get("name"),
@@ -56,82 +136,297 @@ class MCPClient:
                 "parameters": tool.get("inputSchema")
             }
         } for tool in self.tools]
+        self.tool_cache.configure(self.tools)
+        return True
+
+    @staticmethod
+    async def read_events(resp: aiohttp.ClientResponse):
+        """解析 SSE 响应流，依次产出 (event, data)；心跳等没有数据的事件会被跳过"""
+        event, data_lines = "message", []
+        async for line in resp.content:
+            line = line.decode('utf-8').rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[5:].strip())
+            elif not line:
+                data = "\n".join(data_lines)
+                if data:
+                    yield event, fast_json.loads(data)
+                event, data_lines = "message", []
 
+    async def listen(self, events):
+        """把服务器推送的工具结果交给等待中的 call_tool"""
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=available_tools
-            )
-        except Exception as e:
-            print(f"调用OpenAI API出错: {str(e)}")
-            return ""
+            async for event, data in events:
+                if event in ("tool_chunk", "tool_progress", "tool_result"):
+                    queue = self.streams.get(data.get("request_id"))
+                    if queue is not None:
+                        queue.put_nowait((event, data))
+                        continue
+                if event == "tool_result":
+                    future = self.pending.get(data.get("request_id"))
+                    if future is not None and not future.done():
+                        future.set_result(data)
+        finally:
+            # 连接断开后回退到同步 POST，并通知所有等待中的调用
+            self.session_id = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("SSE 连接已断开"))
+            for queue in self.streams.values():
+                queue.put_nowait(("disconnected", {}))
 
-        # 处理返回的内容
-        content = response.choices[0]
-        if content.finish_reason == "tool_calls":
-            # 如果是需要使用工具，就解析工具
-            tool_call = content.message.tool_calls[0]
-            tool_name = tool_call.function.name
-            tool_args = json.loads(tool_call.function.arguments)
+    async def call_tool(self, tool_name: str, tool_args: dict, use_cache: bool = True) -> str:
+        """
+        执行单个工具并返回文本结果，只读工具的结果在其 cacheTtl 内直接复用。
+        :param use_cache: 为 False 时跳过工具结果缓存，直接调用服务器并刷新缓存
+        """
+        return await self.tool_cache.get_or_call(
+            tool_name, tool_args, lambda: self.call_tool_uncached(tool_name, tool_args), bypass=not use_cache
+        )
+
+    def post_call_tool(self, data: dict):
+        """
+        POST /call_tool：按 MCP_WIRE_FORMAT 编码请求体（JSON 或 MessagePack），响应按其 Content-Type 解码。
+        把本地的工具超时作为截止时间告诉服务器，排队等不到执行时服务器直接返回 503，而不是占用执行槽。
+        """
+        body, headers = request_body(data, self.wire_format)
+        headers[TIMEOUT_HEADER] = str(self.tool_timeout)
+        return self.session.post(f"{self.server_url}/call_tool", data=body, headers=headers)
 
-            # 执行工具
-            data = {"tool_name": tool_name, "tool_args": tool_args}
+    async def call_tool_uncached(self, tool_name: str, tool_args: dict) -> str:
+        """
+        执行单个工具并返回文本结果。已建立 SSE 会话时，未指定 page 的预报 / 历史查询通过 stream_tool 分块读取：
+        分段请求历史数据期间的进度交给 on_progress，前 stream_max_pages 页拼接后返回。
+        """
+        if tool_name in SERIES_TOOLS and "page" not in tool_args and self.session_id is not None:
+            pages = []
+            # 提前停止读取时立即关闭生成器，注销 request_id 对应的队列
+            async with aclosing(self.stream_tool(tool_name, tool_args)) as stream:
+                async for page in stream:
+                    pages.append(page)
+                    if len(pages) >= self.stream_max_pages:
+                        break
+            if not pages or pages[0] is None:
+                raise ValueError("服务器返回的工具执行结果中'result'为null")
+            return "\n\n".join(pages)
+        return await self.call_tool_once(tool_name, tool_args)
+
+    async def call_tool_once(self, tool_name: str, tool_args: dict) -> str:
+        """
+        通过 /call_tool 执行单个工具并返回文本结果。
+        已建立 SSE 会话时，服务器立即返回 202，结果通过 SSE 连接推送回来；
+        若请求被其他 worker 处理，则返回 200 并直接携带结果。
+        """
+        data = {"tool_name": tool_name, "tool_args": tool_args}
+        if self.session_id is None:
+            async with self.post_call_tool(data) as result_resp:
+                check_admission(result_resp)
+                result_data = await read_response(result_resp)
+        else:
+            request_id = uuid.uuid4().hex
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request_id] = future
             try:
-                result_resp = await self.session.post("http://localhost:8000/call_tool", json=data)
-                result_data = await result_resp.json()
-                print(f"\n\n[Calling tool {tool_name} with args {tool_args}]\n\n")
-
-                # 检查工具执行结果是否有效
-                if result_data.get("result") is not None:
-                    # 将模型返回的调用哪个工具数据和工具执行完成后的数据都存入messages中
-                    messages.append(content.message.model_dump())
-                    messages.append({
-                        "role": "tool",
-                        "content": result_data.get("result"),
-                        "tool_call_id": tool_call.id,
-                    })
-                else:
-                    print("服务器返回的工具执行结果中'result'为null")
-                    return ""  # 避免再次调用OpenAI API
-
-            except json.JSONDecodeError:
-                print("无法解析服务器返回的工具执行结果数据")
-                return ""
+                data.update(session_id=self.session_id, request_id=request_id)
+                async with self.post_call_tool(data) as result_resp:
+                    check_admission(result_resp)
+                    if result_resp.status == 202:
+                        result_data = None
+                    elif result_resp.status == 200:
+                        # 多 worker 部署时请求落到了不持有该会话的进程，结果直接随响应返回
+                        result_data = await read_response(result_resp)
+                    else:
+                        raise ValueError(f"服务器拒绝了工具调用: HTTP {result_resp.status}")
+                if result_data is None:
+                    result_data = await future
+            finally:
+                self.pending.pop(request_id, None)
+            if result_data.get("error"):
+                raise ValueError(result_data.get("error"))
+        # 检查工具执行结果是否有效
+        if result_data.get("result") is None:
+            raise ValueError("服务器返回的工具执行结果中'result'为null")
+        return result_data.get("result")
+
+    async def stream_tool(self, tool_name: str, tool_args: dict) -> AsyncIterator[str]:
+        """
+        以分块方式调用 query_forecast / query_history，每收到一页就产出一页文本，不必等待完整结果或逐页调用工具。
+        没有 SSE 会话时回退为普通调用，只产出第一页。
+        """
+        if self.session_id is None:
+            yield await self.call_tool_once(tool_name, tool_args)
+            return
+        request_id = uuid.uuid4().hex
+        queue = self.streams[request_id] = asyncio.Queue()
+        data = {"tool_name": tool_name, "tool_args": tool_args, "session_id": self.session_id,
+                "request_id": request_id, "stream": True}
+        try:
+            async with self.post_call_tool(data) as result_resp:
+                check_admission(result_resp)
+                if result_resp.status == 200:
+                    result_data = await read_response(result_resp)
+                    yield result_data.get("result")
+                    return
+                if result_resp.status != 202:
+                    raise ValueError(f"服务器拒绝了工具调用: HTTP {result_resp.status}")
+            while True:
+                event, message = await queue.get()
+                if event == "tool_chunk":
+                    yield message.get("text")
+                elif event == "tool_progress" and message.get("status") == "running":
+                    if self.on_progress is not None:
+                        self.on_progress(tool_name, message.get("progress"), message.get("total"))
+                elif event == "tool_result":
+                    if message.get("error"):
+                        raise ValueError(message.get("error"))
+                    # 服务器不支持分块的工具只推送 tool_result
+                    if not message.get("chunks"):
+                        yield message.get("result")
+                    return
+                elif event == "disconnected":
+                    raise ConnectionError("SSE 连接已断开")
+        finally:
+            self.streams.pop(request_id, None)
+
+    def get_available_tools(self) -> list[dict]:
+        """返回 refresh_tools 时转换好的 OpenAI 工具格式"""
+        return self.available_tools
+
+    async def revalidate_tools(self):
+        """
+        查询开始前按 tools_revalidate_interval 重新验证工具列表（服务器重启或升级后工具可能变化）。
+        验证失败时继续使用已有的工具列表。
+        """
+        if time.monotonic() - self.tools_checked_at < self.tools_revalidate_interval:
+            return
+        try:
+            if await self.refresh_tools():
+                print("\n工具列表已更新:", [tool.get("name") for tool in self.tools])
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"\n重新获取工具列表失败，继续使用已有列表: {str(e)}")
+
+    @profiling.traced("process_query")
+    async def process_query(self, query: str) -> str:
+        """
+        使用大模型处理查询并调用可用的MCP工具 (Function Calling)
+        模型一次返回多个 tool_calls 时并发执行，最多进行 max_iterations 轮工具调用
+        """
+        messages = self.memory.build(query)
+        turn_start = len(messages) - 1  # 本轮消息（从用户问题开始）在 messages 中的位置
+        self.last_breakdown = breakdown = QueryBreakdown()
+
+        with breakdown.stage("list_tools"):
+            await self.revalidate_tools()
+        available_tools = self.get_available_tools()
+
+        for iteration in range(1, self.max_iterations + 1):
+            try:
+                with breakdown.stage(f"llm#{iteration}"), CLIENT_LLM_SECONDS.time():
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        tools=available_tools
+                    )
             except Exception as e:
-                print(f"调用服务器工具出错: {str(e)}")
+                print(f"调用OpenAI API出错: {str(e)}")
                 return ""
+            self.memory.record_prompt(messages, response.usage)
 
-            # 将上面的结果再返回给大模型用于生成最终的结果
-            try:
+            # 处理返回的内容
+            content = response.choices[0]
+            if content.finish_reason != "tool_calls" or not content.message.tool_calls:
+                self.memory.commit(messages[turn_start:] + [{"role": "assistant", "content": content.message.content}])
+                return content.message.content
+
+            # 将模型返回的调用哪些工具数据和所有工具执行完成后的数据都存入messages中
+            messages.append(content.message.model_dump())
+            with breakdown.stage(f"tools#{iteration}"):
+                messages.extend(await run_tool_calls(
+                    content.message.tool_calls,
+                    self.call_tool,
+                    concurrency=self.tool_concurrency,
+                    timeout=self.tool_timeout,
+                    known_tools=tool_names(available_tools),
+                ))
+
+        # 达到最大轮数后不再提供工具，让大模型基于已有结果生成最终的结果
+        try:
+            with breakdown.stage("llm#final"), CLIENT_LLM_SECONDS.time():
                 response = await self.client.chat.completions.create(
                     model=self.model,
                     messages=messages,
                 )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(f"再次调用OpenAI API出错: {str(e)}")
-                return ""
+            self.memory.record_prompt(messages, response.usage)
+            answer = response.choices[0].message.content
+            self.memory.commit(messages[turn_start:] + [{"role": "assistant", "content": answer}])
+            return answer
+        except Exception as e:
+            print(f"再次调用OpenAI API出错: {str(e)}")
+            return ""
 
-        return content.message.content
+    async def stream_query(self, query: str) -> AsyncIterator[str]:
+        """
+        流式版本的 process_query：以异步生成器逐个产出最终回答的 token。
+        工具参数一旦拼接完整就开始执行，各次大模型调用的 TTFT 与耗时记录在 self.last_timing 中。
+        """
+        messages = self.memory.build(query)
+        turn_start = len(messages) - 1
+
+        await self.revalidate_tools()
+        available_tools = self.get_available_tools()
+        run_tool = make_tool_runner(self.call_tool, self.tool_concurrency, self.tool_timeout, tool_names(available_tools))
+        self.last_timing = timing = StreamTiming()
+
+        for iteration in range(self.max_iterations + 1):
+            turn = StreamedTurn(run_tool, timing)
+            # 达到最大轮数后不再提供工具，让大模型基于已有结果生成最终的结果
+            tools = {"tools": available_tools} if iteration < self.max_iterations else {}
+            self.memory.record_prompt(messages)
+            async for token in turn.stream(self.client, model=self.model, messages=messages, **tools):
+                yield token
+            if not turn.tool_calls:
+                self.memory.commit(messages[turn_start:] + [{"role": "assistant", "content": "".join(turn.content_parts)}])
+                return
+
+            # 将模型返回的调用哪些工具数据和所有工具执行完成后的数据都存入messages中
+            messages.append(turn.assistant_message())
+            messages.extend(await turn.tool_results())
 
     async def chat_loop(self):
         """运行交互式聊天循环"""
         print("\n🤖 MCP客户端已启动！输入'quit'退出")
+        self.on_progress = print_progress
         while True:
             try:
                 query = input("\n你: ").strip()
                 if query.lower() == 'quit':
                     break
 
+                if self.stream_output:
+                    print("\n🤖 OpenAI: ", end="", flush=True)
+                    async for token in self.stream_query(query):  # 边生成边输出
+                        print(token, end="", flush=True)
+                    print(f"\n{self.last_timing.summary()}")
+                    print(self.memory.report())
+                    continue
+
                 response = await self.process_query(query)  # 发送用户输入到OpenAI API
                 print(f"\n🤖 OpenAI: {response}")
+                print(self.last_breakdown.summary())
+                print(self.memory.report())
             except Exception as e:
                 print(f"\n⚠发生错误: {str(e)}")
 
     async def cleanup(self):
         """清理资源"""
-        await self.session.close()
+        if self.listener is not None:
+            self.listener.cancel()
+        if self.stream is not None:
+            self.stream.release()
+        if self.session is not None:
+            await self.session.close()
 
 
 async def main():
@@ -144,4 +439,10 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())    
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="天气 MCP HTTP 客户端")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    with profiling.profile("http_client", args.profile):
+        asyncio.run(main())    
\ No newline at end of file
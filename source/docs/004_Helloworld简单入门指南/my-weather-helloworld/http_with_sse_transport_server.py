@@ -1,141 +1,381 @@
 import json
+import uuid
+import hashlib
 import asyncio
-import httpx
-from typing import Any
 from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.responses import PlainTextResponse
 from sse_starlette.sse import EventSourceResponse
-from mcp.server.fastmcp import FastMCP
 import os
 from dotenv import load_dotenv
+from weather_refresh import refresher, weather_lifespan
+from upstream_guard import TokenBucket, guard
+from weather_cache import cached_fetch_weather, weather_cache
+from city_index import city_resolver
+from weather_batch import fetch_weather_many
+from sse_sessions import SSE_SEND_TIMEOUT, sse_sessions
+from admission import Admission, AdmissionSlot, Rejected, admission
+from metrics import CALL_TOOL_ERRORS, CALL_TOOL_SECONDS, FORMAT_WEATHER_SECONDS, REGISTRY
+from log_config import setup_logging
+import profiling
+from tool_annotations import AnnotatedFastMCP
+from wire_codec import accepts_gzip, decode, encode_body, negotiate
+from weather_format import format_weather, format_weather_many
+from weather_series import SERIES_TOOLS, context_progress, forecast_page, history_page, series_pages
+from mcp.server.fastmcp import Context
+import fast_json
 import logging
 
-# 配置日志
-logging.basicConfig(level=logging.DEBUG)
+# 配置日志：级别由 LOG_LEVEL 控制，LOG_QUEUE=1 时通过后台线程写日志
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # 加载.env文件，确保API Key受到保护
 load_dotenv()
 
 # 初始化 MCP 服务器
-mcp = FastMCP("WeatherServer")
-app = FastAPI()
+# 通过 lifespan 在服务器运行期间刷新热点城市，退出时关闭共享的上游连接池；工具列表附带只读与建议缓存时长的 annotations
+mcp = AnnotatedFastMCP("WeatherServer", lifespan=weather_lifespan)
+app = FastAPI(lifespan=weather_lifespan)
 
-# OpenWeather API 配置
-OPENWEATHER_API_BASE = os.getenv("OPENWEATHER_API_BASE")  
-OPEN_WEATHER_API_KEY = os.getenv("OPEN_WEATHER_API_KEY")  
-USER_AGENT = os.getenv("OPEN_WEATHER_USER_AGENT")  
+# 通过 SSE 推送结果的后台任务，保存引用避免被垃圾回收
+background_tasks: set[asyncio.Task] = set()
+# 多 worker 模式下默认的共享缓存文件
+DEFAULT_SHARED_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".weather_cache.sqlite3")
+# /list_tools 的工具列表，以及按 (Content-Type, 是否 gzip) 预先编码好的响应体、ETag 与响应头
+list_tools_data: dict | None = None
+tool_names: frozenset[str] | None = None
+list_tools_payloads: dict[tuple[str, bool], tuple[bytes, str, dict[str, str]]] = {}
+# sse_starlette 的 ping 间隔，设为一天相当于关闭
+IDLE_PING_DISABLED = 24 * 60 * 60
 
 
-async def fetch_weather(city: str) -> dict[str, Any] | None:
+@mcp.tool()
+async def query_weather(city: str) -> str:
     """
-    从 OpenWeather API 获取天气信息。
-    :param city: 城市名称（需使用英文，如 Beijing）
-    :return: 天气数据字典；若出错返回包含 error 信息的字典
+    输入指定城市的名称，返回今日天气查询结果。
+    :param city: 城市英文名称，可附加国家代码（如 Paris,FR）；常见城市也可以使用中文名
+    :return: 天气信息，格式由 WEATHER_OUTPUT_FORMAT 决定（text / llm / json）
     """
-    params = {
-        "q": city,
-        "appid": OPEN_WEATHER_API_KEY,
-        "units": "metric",
-        "lang": "zh_cn"
-    }
-    headers = {"User-Agent": USER_AGENT}
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(OPENWEATHER_API_BASE, params=params, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()  # 返回字典类型
-        except httpx.HTTPStatusError as e:
-            return {"error": f"HTTP 错误: {e.response.status_code}"}
-        except Exception as e:
-            return {"error": f"请求失败: {str(e)}"}
+    data = await cached_fetch_weather(city)
+    with FORMAT_WEATHER_SECONDS.time():
+        return format_weather(data)
 
 
-def format_weather(data: dict[str, Any] | str) -> str:
-    if isinstance(data, str):
-        try:
-            data = json.loads(data)
-        except Exception as e:
-            return f"无法解析天气数据: {e}"
-    # 如果数据中包含错误信息，直接返回错误提示
-    if "error" in data:
-        return f"⚠ {data['error']}"
-    # 提取数据时做容错处理
-    city = data.get("name", "未知")
-    country = data.get("sys", {}).get("country", "未知")
-    temp = data.get("main", {}).get("temp", "N/A")
-    humidity = data.get("main", {}).get("humidity", "N/A")
-    wind_speed = data.get("wind", {}).get("speed", "N/A")
-    # weather 可能为空列表，因此用 [0] 前先提供默认字典
-    weather_list = data.get("weather", [{}])
-    description = weather_list[0].get("description", "未知")
-    return (
-        f"🌍 {city}, {country}\n"
-        f"🌡 温度: {temp}°C\n"
-        f"💧 湿度: {humidity}%\n"
-        f"🌬 风速: {wind_speed} m/s\n"
-        f"⛅ 天气: {description}\n"
-    )
+@mcp.tool()
+async def query_weather_many(cities: list[str]) -> str:
+    """
+    一次查询多个城市的今日天气，城市之间并发查询，重复的城市只查询一次。
+    :param cities: 城市名称列表（写法同 query_weather），也可以直接传入 OpenWeather 城市 ID（纯数字）
+    :return: 每个城市的格式化天气信息，单个城市失败不影响其他城市
+    """
+    try:
+        results = await fetch_weather_many(cities)
+    except ValueError as e:
+        return f"⚠ {e}"
+    with FORMAT_WEATHER_SECONDS.time():
+        return format_weather_many(results)
 
 
 @mcp.tool()
-async def query_weather(city: str) -> str:
+async def query_forecast(city: str, days: int = 3, step_hours: int = 24, page: int = 1, ctx: Context = None) -> str:
+    """
+    查询未来几天的天气预报，按当地时间汇总为每天（或每 step_hours 小时）一行的最低、最高、平均气温等。
+    :param city: 城市名称，写法同 query_weather
+    :param days: 预报天数，1~5
+    :param step_hours: 汇总粒度（小时），24 为按天汇总，3 为原始的 3 小时粒度
+    :param page: 页码，结果行数较多时分页返回，结果末尾会提示下一页
+    :return: 预报汇总表，格式由 WEATHER_OUTPUT_FORMAT 决定
     """
-    输入指定城市的英文名称，返回今日天气查询结果。
-    :param city: 城市名称（需使用英文）
-    :return: 格式化后的天气信息
+    return await forecast_page(city, days, step_hours, page, on_progress=context_progress(ctx))
+
+
+@mcp.tool()
+async def query_history(city: str, start: str, end: str, step_hours: int = 24, page: int = 1, ctx: Context = None) -> str:
     """
-    data = await fetch_weather(city)
-    return format_weather(data)
+    查询一段日期内的历史天气（逐小时数据），按天（或每 step_hours 小时）汇总后分页返回。
+    :param city: 城市名称，写法同 query_weather
+    :param start: 开始日期，格式 YYYY-MM-DD（UTC）
+    :param end: 结束日期（含当天），格式 YYYY-MM-DD，最多查询 WEATHER_HISTORY_MAX_DAYS 天
+    :param step_hours: 汇总粒度（小时），24 为按天汇总
+    :param page: 页码，结果末尾会提示下一页
+    :return: 历史天气汇总表；范围较长时按周分段请求，每完成一段发送一次进度通知
+    """
+    return await history_page(city, start, end, step_hours, page, on_progress=context_progress(ctx))
+
+
+@mcp.resource("weather://cache/stats")
+def cache_stats() -> str:
+    """天气缓存的命中、未命中、合并与淘汰计数，用于评估缓存容量"""
+    return json.dumps(weather_cache.stats())
+
+
+@mcp.resource("weather://upstream/stats")
+def upstream_stats() -> str:
+    """上游限流器、熔断器与重试预算的状态，熔断打开时 circuit_breaker.state 为 open"""
+    return json.dumps(guard.stats())
 
 
 @app.get("/connect")
 async def connect(request: Request):
+    """
+    建立 SSE 长连接。首个事件返回 session_id，之后该会话的工具结果与进度通知都通过这个连接推送，
+    断开时由事件生成器的 finally 清理会话，不再轮询连接状态。
+    """
+    session = sse_sessions.create()
+
     async def event_generator():
-        while True:
-            if await request.is_disconnected():
-                break
-            yield {"data": json.dumps({"message": "Connected"})}
-            await asyncio.sleep(1)
-    return EventSourceResponse(event_generator())
+        try:
+            yield {"data": fast_json.dumps_str({"message": "Connected", "session_id": session.id})}
+            async for event in session.events():
+                yield event
+        finally:
+            sse_sessions.close(session.id)
+
+    # 心跳由会话在空闲时发送，关闭 sse_starlette 的固定间隔 ping；send_timeout 用于断开读取过慢的客户端
+    return EventSourceResponse(event_generator(), ping=IDLE_PING_DISABLED, send_timeout=SSE_SEND_TIMEOUT)
+
+
+def tool_label(tool_name) -> str:
+    """指标中的 tool 标签：只使用已注册的工具名，其余归为 unknown，避免客户端传入的名称让序列数无限增长"""
+    return tool_name if isinstance(tool_name, str) and tool_names is not None and tool_name in tool_names else "unknown"
+
+
+async def execute_tool(tool_name: str, tool_args: dict) -> str | None:
+    """执行工具并返回第一段文本结果，结果为空时返回 None"""
+    # 使用 %s 占位符，日志级别高于 DEBUG 时不会格式化参数与结果
+    logger.debug("调用工具: %s, 参数: %s", tool_name, tool_args)
+    try:
+        with CALL_TOOL_SECONDS.time(tool=tool_label(tool_name)):
+            result = await mcp.call_tool(tool_name, tool_args)
+    except Exception:
+        CALL_TOOL_ERRORS.inc(tool=tool_label(tool_name))
+        raise
+    logger.debug("工具调用结果: %s", result)
+    if result and isinstance(result, list) and len(result) > 0 and hasattr(result[0], 'text'):
+        return result[0].text
+    CALL_TOOL_ERRORS.inc(tool=tool_label(tool_name))
+    logger.error("工具执行结果为空")
+    return None
+
+
+async def push_tool_result(session, request_id: str, tool_name: str, tool_args: dict, slot: AdmissionSlot, deadline: float):
+    """在后台执行工具，把进度与结果推送到对应的 SSE 会话；执行结束（或超过截止时间）后释放准入槽"""
+    try:
+        await session.send("tool_progress", {"request_id": request_id, "status": "started"})
+        async with asyncio.timeout_at(deadline):
+            result = await execute_tool(tool_name, tool_args)
+        await session.send("tool_result", {"request_id": request_id, "result": result})
+    except TimeoutError:
+        CALL_TOOL_ERRORS.inc(tool=tool_label(tool_name))
+        await session.send("tool_result", {"request_id": request_id, "error": "工具执行超过请求的截止时间"})
+    except Exception as e:
+        logger.error("调用工具时出错: %s", e)
+        await session.send("tool_result", {"request_id": request_id, "error": str(e)})
+    finally:
+        slot.release()
+
+
+async def push_tool_chunks(session, request_id: str, tool_name: str, tool_args: dict, slot: AdmissionSlot, deadline: float):
+    """
+    分块推送预报 / 历史结果：每渲染完一页就发送一个 tool_chunk 事件，分段请求历史数据时同时推送进度，
+    最后以 tool_result 结束（result 为首页内容，chunks 为分块数）。客户端不需要等完整结果，也不需要再按页调用工具。
+    """
+    seq = 0
+    first = None
+
+    async def on_progress(progress: float, total: float | None = None):
+        await session.send("tool_progress", {"request_id": request_id, "status": "running", "progress": progress, "total": total})
+
+    try:
+        await session.send("tool_progress", {"request_id": request_id, "status": "started"})
+        async with asyncio.timeout_at(deadline):
+            with CALL_TOOL_SECONDS.time(tool=tool_label(tool_name)):
+                async for text in series_pages(tool_name, tool_args, on_progress):
+                    first = text if first is None else first
+                    await session.send("tool_chunk", {"request_id": request_id, "seq": seq, "text": text})
+                    seq += 1
+        await session.send("tool_result", {"request_id": request_id, "result": first, "chunks": seq})
+    except Exception as e:
+        CALL_TOOL_ERRORS.inc(tool=tool_label(tool_name))
+        error = "工具执行超过请求的截止时间" if isinstance(e, TimeoutError) else str(e)
+        logger.error("调用工具时出错: %s", error)
+        await session.send("tool_result", {"request_id": request_id, "error": error, "chunks": seq})
+    finally:
+        slot.release()
+
+
+def encoded_response(request: Request, data: dict, status_code: int = 200, headers: dict[str, str] | None = None) -> Response:
+    """按请求的 Accept 与 Accept-Encoding 编码响应（JSON 或 MessagePack，较大的响应 gzip 压缩）"""
+    body, encoding_headers = encode_body(data, request.headers.get("accept"), request.headers.get("accept-encoding"))
+    return Response(content=body, status_code=status_code, headers={**encoding_headers, **(headers or {})})
+
+
+async def read_request_data(request: Request) -> dict:
+    """按 Content-Type 解析请求体（JSON 或 MessagePack）"""
+    try:
+        data = decode(await request.body(), request.headers.get("content-type"))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"无法解析请求体: {e}")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="请求体应为对象")
+    return data
+
+
+def rejected_response(request: Request, e: Rejected) -> Response:
+    return encoded_response(request, {"error": e.reason}, e.status, {"Retry-After": str(e.retry_after)})
 
 
 @app.post("/call_tool")
-async def call_tool(data: dict):
+async def call_tool(request: Request):
+    # 请求体可以是 JSON 或 MessagePack（Content-Type: application/msgpack），响应编码按 Accept 协商
+    data = await read_request_data(request)
     tool_name = data.get("tool_name")
     tool_args = data.get("tool_args")
+    session_id = data.get("session_id")
+    # 未注册的工具在准入之前拒绝，避免任意工具名在准入控制与指标中各自占用一份状态
+    if not isinstance(tool_name, str) or tool_name not in await get_tool_names():
+        raise HTTPException(status_code=404, detail=f"未知工具: {tool_name}")
+    # 准入控制：每个工具有并发上限与有界等待队列。截止时间来自 X-Request-Timeout（覆盖排队与执行），
+    # 队列满时返回 429，预计等不到执行或排队超时返回 503，两者都带 Retry-After；X-Priority: batch 的请求让位于 interactive
+    deadline = Admission.deadline(request.headers)
     try:
-        logging.debug(f"调用工具: {tool_name}, 参数: {tool_args}")
-        result = await mcp.call_tool(tool_name, tool_args)
-        logging.debug(f"工具调用结果: {result}")
-        if result and isinstance(result, list) and len(result) > 0 and hasattr(result[0], 'text'):
-            response_data = {"result": result[0].text}
-        else:
-            logging.error("工具执行结果为空")
-            response_data = {"result": None}
-        # 设置正确的 Content-Type 头
-        return Response(content=json.dumps(response_data), media_type="application/json")
+        slot = await admission.acquire(tool_name, Admission.lane(request.headers, data), deadline)
+    except Rejected as e:
+        return rejected_response(request, e)
+
+    # 携带 session_id 且会话就在当前进程时立即返回 202，结果稍后通过 SSE 连接推送。
+    # 多 worker 部署下请求可能落到不持有该会话的进程，此时直接同步执行并在响应中返回结果
+    session = sse_sessions.get(session_id) if session_id else None
+    if session is not None:
+        request_id = data.get("request_id") or uuid.uuid4().hex
+        # stream=true 时预报 / 历史工具的结果按页分块推送
+        push = push_tool_chunks if data.get("stream") and tool_name in SERIES_TOOLS else push_tool_result
+        task = asyncio.create_task(push(session, request_id, tool_name, tool_args, slot, deadline))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        return encoded_response(request, {"accepted": True, "request_id": request_id}, 202)
+
+    try:
+        async with asyncio.timeout_at(deadline):
+            response_data = {"result": await execute_tool(tool_name, tool_args)}
+        return encoded_response(request, response_data)
+    except TimeoutError:
+        CALL_TOOL_ERRORS.inc(tool=tool_label(tool_name))
+        raise HTTPException(status_code=504, detail="工具执行超过请求的截止时间")
     except Exception as e:
-        logging.error(f"调用工具时出错: {str(e)}")
+        logger.error("调用工具时出错: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        slot.release()
 
 
-@app.get("/list_tools")
-async def list_tools():
-    try:
+async def get_list_tools_data() -> dict:
+    global list_tools_data
+    if list_tools_data is None:
         tools = []
         # 使用 await 等待 mcp.list_tools() 协程执行完毕
-        tool_instances = await mcp.list_tools()  
+        tool_instances = await mcp.list_tools()
         for tool in tool_instances:
             tool_info = {
                 "name": tool.name,
                 "description": tool.description,
-                "inputSchema": tool.inputSchema
+                "inputSchema": tool.inputSchema,
+                "annotations": mcp.tool_annotations.get(tool.name, {}),
             }
             tools.append(tool_info)
-        return {"tools": tools}
+        list_tools_data = {"tools": tools}
+    return list_tools_data
+
+
+async def get_tool_names() -> frozenset[str]:
+    """已注册的工具名称，与 /list_tools 返回的列表一致"""
+    global tool_names
+    if tool_names is None:
+        tool_names = frozenset(tool["name"] for tool in (await get_list_tools_data())["tools"])
+    return tool_names
+
+
+async def get_list_tools_payload(accept: str | None, accept_encoding: str | None) -> tuple[bytes, str, dict[str, str]]:
+    """
+    工具列表在启动后不会变化，每种编码（JSON / MessagePack，是否 gzip）首次请求时编码一次并计算 ETag，之后直接复用字节串。
+    :return: (响应体, ETag, 响应头)
+    """
+    key = (negotiate(accept), accepts_gzip(accept_encoding))
+    payload = list_tools_payloads.get(key)
+    if payload is None:
+        body, headers = encode_body(await get_list_tools_data(), accept, accept_encoding)
+        payload = list_tools_payloads[key] = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', headers)
+    return payload
+
+
+@app.get("/list_tools")
+async def list_tools(request: Request):
+    try:
+        body, etag, encoding_headers = await get_list_tools_payload(
+            request.headers.get("accept"), request.headers.get("accept-encoding")
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": encoding_headers["Vary"]}
+    # 客户端携带的 ETag 未变化时返回 304，不再传输工具列表
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, headers={**encoding_headers, **headers})
+
+
+@app.get("/cache_stats")
+async def cache_stats_endpoint():
+    return weather_cache.stats()
+
+
+@app.get("/upstream_stats")
+async def upstream_stats_endpoint():
+    return guard.stats()
+
+
+@app.get("/refresh_stats")
+async def refresh_stats_endpoint():
+    return refresher.stats()
+
+
+@app.get("/admission_stats")
+async def admission_stats_endpoint():
+    return admission.stats()
+
+
+@app.get("/city_stats")
+async def city_stats_endpoint():
+    return city_resolver().stats()
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 文本格式的指标；多 worker 部署时每个进程各自统计，由抓取端按实例汇总"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="天气 MCP HTTP 服务器")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEATHER_WORKERS", "1")),
+                        help="worker 进程数，大于 1 时各进程通过共享 SQLite 文件复用天气缓存")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if profiling.parse_modes(args.profile):
+            logger.warning("性能分析只支持单个 worker（--workers 1），本次不开启")
+        # worker 进程会重新导入本模块，通过环境变量把共享缓存路径与进程数（用于平分上游配额）传给它们
+        os.environ.setdefault("WEATHER_SHARED_CACHE", DEFAULT_SHARED_CACHE_PATH)
+        os.environ["WEATHER_WORKERS"] = str(args.workers)
+        uvicorn.run("http_with_sse_transport_server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        if guard.limiter.workers != 1:
+            # 环境中的 WEATHER_WORKERS 与 --workers 1 不一致时，单进程使用全部配额
+            guard.limiter = TokenBucket(workers=1)
+        with profiling.profile("http_server", args.profile):
+            uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
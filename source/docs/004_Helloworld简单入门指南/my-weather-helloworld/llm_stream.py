@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Awaitable, Callable
+from dotenv import load_dotenv
+from metrics import CLIENT_LLM_SECONDS
+
+# 加载.env文件
+load_dotenv()
+
+# 是否在 chat_loop 中流式输出最终回答
+STREAM_OUTPUT = os.getenv("MCP_STREAM", "1").lower() in ("1", "true", "yes")
+
+
+class StreamTiming:
+    """一次查询中各次大模型调用的首 token 时间（TTFT）与总耗时"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at: float | None = None
+        self.completions: list[dict[str, float]] = []
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    @property
+    def ttft(self) -> float | None:
+        return None if self.first_token_at is None else self.first_token_at - self.start
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.start
+
+    def summary(self) -> str:
+        ttft = "N/A" if self.ttft is None else f"{self.ttft:.3f}s"
+        rounds = ", ".join(f"#{i + 1} 首包 {c['first_chunk']:.3f}s / 完成 {c['total']:.3f}s" for i, c in enumerate(self.completions))
+        return f"[TTFT {ttft}, 总耗时 {self.total:.3f}s; 大模型调用: {rounds}]"
+
+
+class StreamedTurn:
+    """
+    流式调用一次大模型：逐个产出回答 token，同时拼接 tool_calls 的增量。
+    某个 tool_call 的参数拼接完成（出现下一个 index 或流结束）后立即开始执行该工具，不必等整个回复结束。
+    """
+
+    def __init__(self, run_tool: Callable[[Any], Awaitable[dict[str, Any]]], timing: StreamTiming):
+        self.run_tool = run_tool
+        self.timing = timing
+        self.content_parts: list[str] = []
+        self.tool_calls: list[SimpleNamespace] = []
+        self.tool_tasks: list[asyncio.Task] = []
+        self.finish_reason: str | None = None
+
+    def _start_ready_tools(self, upto: int):
+        """启动 index < upto 且尚未启动的工具调用"""
+        while len(self.tool_tasks) < min(upto, len(self.tool_calls)):
+            tool_call = self.tool_calls[len(self.tool_tasks)]
+            self.tool_tasks.append(asyncio.create_task(self.run_tool(tool_call)))
+
+    async def stream(self, client, **kwargs) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        first_chunk = None
+        try:
+            response = await client.chat.completions.create(stream=True, **kwargs)
+            async for chunk in response:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta
+                if delta.content:
+                    self.timing.mark_first_token()
+                    self.content_parts.append(delta.content)
+                    yield delta.content
+                for tool_delta in delta.tool_calls or []:
+                    # 出现新的 index 说明之前的 tool_call 参数已经完整
+                    self._start_ready_tools(tool_delta.index)
+                    while len(self.tool_calls) <= tool_delta.index:
+                        self.tool_calls.append(SimpleNamespace(
+                            id=None, type="function", function=SimpleNamespace(name="", arguments="")
+                        ))
+                    tool_call = self.tool_calls[tool_delta.index]
+                    if tool_delta.id:
+                        tool_call.id = tool_delta.id
+                    if tool_delta.function is not None:
+                        if tool_delta.function.name:
+                            tool_call.function.name += tool_delta.function.name
+                        if tool_delta.function.arguments:
+                            tool_call.function.arguments += tool_delta.function.arguments
+                if choice.finish_reason:
+                    self.finish_reason = choice.finish_reason
+        except BaseException:
+            # 流中途出错、被取消或调用方提前停止迭代时，已经启动的工具不再需要，取消并等待它们结束
+            await self.cancel_tools()
+            raise
+        self._start_ready_tools(len(self.tool_calls))
+        total = time.perf_counter() - start
+        CLIENT_LLM_SECONDS.observe(total)
+        self.timing.completions.append({"first_chunk": first_chunk or 0.0, "total": total})
+
+    async def cancel_tools(self):
+        for task in self.tool_tasks:
+            task.cancel()
+        await asyncio.gather(*self.tool_tasks, return_exceptions=True)
+
+    def assistant_message(self) -> dict[str, Any]:
+        """拼接完成的 assistant 消息，格式与 message.model_dump() 一致"""
+        return {
+            "role": "assistant",
+            "content": "".join(self.content_parts) or None,
+            "tool_calls": [{
+                "id": tool_call.id,
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+            } for tool_call in self.tool_calls] or None,
+        }
+
+    async def tool_results(self) -> list[dict[str, Any]]:
+        """按 tool_calls 顺序返回所有工具的 role=tool 消息"""
+        return list(await asyncio.gather(*self.tool_tasks))
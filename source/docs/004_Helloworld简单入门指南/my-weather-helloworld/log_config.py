@@ -0,0 +1,29 @@
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+# 日志级别，排查问题时设置为 DEBUG；默认 INFO，调试日志在热路径上不产生任何格式化开销
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 开启后日志记录只把 LogRecord 放入内存队列，由后台线程写入 stderr，事件循环不会阻塞在 I/O 上
+LOG_QUEUE = os.getenv("LOG_QUEUE", "0").lower() in ("1", "true", "yes")
+
+
+def setup_logging(level: str = LOG_LEVEL, use_queue: bool = LOG_QUEUE) -> None:
+    handler: logging.Handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    if use_queue:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = logging.handlers.QueueHandler(log_queue)
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+    if logging.getLogger().getEffectiveLevel() > logging.DEBUG:
+        # httpx 在 INFO 级别会为每个请求打印一行日志（URL 中还带着 appid），非调试模式下关闭
+        logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -0,0 +1,333 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Optional, TypeVar
+import aiohttp
+from dotenv import load_dotenv
+from mcp import StdioServerParameters, types
+import fast_json
+from wire_codec import WIRE_FORMAT, accept_headers, read_response, request_body
+from stdio_pool import POOL_SIZE, StdioServerPool
+
+# 加载.env文件
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 多服务器路由配置
+# 要连接的服务器，逗号分隔的 名称=地址：以 .py / .js 结尾的是 stdio 服务器脚本，其余为 HTTP 服务器地址，
+# 如 weather=stdio_transport_server.py,remote=http://localhost:8000
+MCP_SERVERS = os.getenv("MCP_SERVERS", "")
+ROUTER_CONNECT_TIMEOUT = float(os.getenv("MCP_ROUTER_CONNECT_TIMEOUT", "15"))  # 单个服务器的连接超时（秒）
+ROUTER_LIST_TIMEOUT = float(os.getenv("MCP_ROUTER_LIST_TIMEOUT", "5"))  # 单个服务器 list_tools 的超时（秒）
+ROUTER_RECONNECT_DELAY = float(os.getenv("MCP_ROUTER_RECONNECT_DELAY", "5"))  # 连接失败后重试的初始间隔（秒），之后每次翻倍
+ROUTER_RECONNECT_MAX_DELAY = 60.0
+# 工具名的命名空间分隔符：OpenAI 的函数名只允许字母、数字、_ 与 -，因此不能用 "." 或 "/"
+NAMESPACE_SEPARATOR = "__"
+
+T = TypeVar("T")
+
+
+def parse_servers(specs: list[str]) -> list[tuple[str, str]]:
+    """
+    解析服务器列表，每项为 名称=地址 或只有地址（名称取脚本文件名或主机名）。
+    :return: [(名称, 地址)]
+    """
+    servers = []
+    for spec in specs:
+        spec = spec.strip()
+        if not spec:
+            continue
+        name, sep, target = spec.partition("=")
+        if not sep:
+            target = spec
+            name = os.path.splitext(os.path.basename(spec.rstrip("/")))[0] if is_script(spec) else spec.split("://")[-1].split(":")[0].split("/")[0]
+            name = name.replace("-", "_").replace(".", "_")
+        if NAMESPACE_SEPARATOR in name:
+            raise ValueError(f"服务器名称不能包含 {NAMESPACE_SEPARATOR}: {name}")
+        if any(name == existing for existing, _ in servers):
+            raise ValueError(f"服务器名称重复: {name}")
+        servers.append((name, target))
+    return servers
+
+
+def is_script(target: str) -> bool:
+    return target.endswith(".py") or target.endswith(".js")
+
+
+def split_tool_name(name: str) -> tuple[str, str]:
+    """:return: (服务器名称, 服务器上的工具名)"""
+    server, sep, tool = name.partition(NAMESPACE_SEPARATOR)
+    if not sep:
+        raise ValueError(f"工具名缺少服务器前缀: {name}")
+    return server, tool
+
+
+class ServerUnavailable(ConnectionError):
+    pass
+
+
+class StdioBackend:
+    """stdio 服务器：复用 StdioServerPool，子进程崩溃后由进程池自动重启"""
+
+    kind = "stdio"
+
+    def __init__(self, target: str, env: Optional[dict[str, str]] = None, message_handler=None, pool_size: int = POOL_SIZE):
+        self.params = StdioServerParameters(command="python" if target.endswith(".py") else "node", args=[target], env=env)
+        self.message_handler = message_handler
+        self.pool_size = pool_size
+        self.pool: Optional[StdioServerPool] = None
+
+    async def connect(self):
+        pool = StdioServerPool(self.params, self.pool_size, message_handler=self.message_handler)
+        try:
+            self.pool = await pool.start()
+        except BaseException:
+            # 超时被取消时同样结束已启动的子进程
+            await asyncio.shield(pool.aclose())
+            raise
+
+    async def list_tools(self) -> list[types.Tool]:
+        return (await self.pool.list_tools()).tools
+
+    async def call_tool(self, name: str, arguments: Optional[dict[str, Any]]) -> types.CallToolResult:
+        return await self.pool.call_tool(name, arguments)
+
+    async def send_request(self, request: types.ClientRequest, result_type: type[T]) -> T:
+        return await self.pool.send_request(request, result_type)
+
+    async def aclose(self):
+        if self.pool is not None:
+            await self.pool.aclose()
+            self.pool = None
+
+
+class HttpBackend:
+    """HTTP 服务器（http_with_sse_transport_server.py）：通过 /list_tools 与同步的 /call_tool 访问，不建立 SSE 长连接"""
+
+    kind = "http"
+
+    def __init__(self, target: str, session: aiohttp.ClientSession):
+        self.url = target.rstrip("/")
+        self.session = session
+
+    async def connect(self):
+        await self.list_tools()
+
+    async def list_tools(self) -> list[types.Tool]:
+        async with self.session.get(f"{self.url}/list_tools", headers=accept_headers(WIRE_FORMAT)) as response:
+            response.raise_for_status()
+            data = await read_response(response)
+        return [types.Tool(
+            name=tool["name"],
+            description=tool.get("description"),
+            inputSchema=tool.get("inputSchema") or {},
+            annotations=tool.get("annotations") or None,
+        ) for tool in data.get("tools", [])]
+
+    async def call_tool(self, name: str, arguments: Optional[dict[str, Any]]) -> types.CallToolResult:
+        # 请求与响应按 MCP_WIRE_FORMAT 编码（JSON 或 MessagePack）
+        body, headers = request_body({"tool_name": name, "tool_args": arguments or {}}, WIRE_FORMAT)
+        async with self.session.post(f"{self.url}/call_tool", data=body, headers=headers) as response:
+            data = await read_response(response)
+        if response.status in (429, 503):
+            text, is_error = f"服务器繁忙（HTTP {response.status}），请 {response.headers.get('Retry-After', '1')} 秒后重试", True
+        elif response.status != 200:
+            text, is_error = str(data.get("detail", data)), True
+        else:
+            text, is_error = data.get("result"), data.get("result") is None
+        return types.CallToolResult(content=[types.TextContent(type="text", text=text or "")], isError=is_error)
+
+    async def send_request(self, request: types.ClientRequest, result_type: type[T]) -> T:
+        # HTTP 服务器不转发进度通知，直接同步调用
+        params = request.root.params
+        return await self.call_tool(params.name, params.arguments)
+
+    async def aclose(self):
+        pass
+
+
+class RoutedServer:
+    def __init__(self, name: str, target: str, backend: StdioBackend | HttpBackend):
+        self.name = name
+        self.target = target
+        self.backend = backend
+        self.connected = False
+        self.connect_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.tools = 0
+        self.calls = 0
+        self.failures = 0
+        self.reconnects = 0
+
+
+class MCPRouter:
+    """
+    同时连接多个 MCP 服务器（stdio 与 HTTP），对外表现为一个会话：
+    - connect 并发连接所有服务器，总耗时取决于最慢的一个而不是所有服务器之和；单个服务器超时或失败不影响其他服务器，
+      失败的服务器在后台按指数退避重连，连上后其工具在下一次 list_tools 时出现；
+    - list_tools 合并各服务器的工具，工具名加上 服务器名__ 前缀，避免不同服务器的同名工具冲突；
+    - call_tool / send_request 去掉前缀后分派给所属服务器。
+    """
+
+    def __init__(
+        self,
+        servers: list[tuple[str, str]],
+        env: Optional[dict[str, str]] = None,
+        message_handler=None,
+        connect_timeout: float = ROUTER_CONNECT_TIMEOUT,
+        list_timeout: float = ROUTER_LIST_TIMEOUT,
+        reconnect_delay: float = ROUTER_RECONNECT_DELAY,
+    ):
+        self.connect_timeout = connect_timeout
+        self.list_timeout = list_timeout
+        self.reconnect_delay = reconnect_delay
+        self.http: Optional[aiohttp.ClientSession] = None
+        self.servers: dict[str, RoutedServer] = {}
+        self.connect_seconds: Optional[float] = None
+        self._env = env
+        self._message_handler = message_handler
+        self._specs = servers
+        self._reconnect_tasks: set[asyncio.Task] = set()
+
+    def _backend(self, target: str) -> StdioBackend | HttpBackend:
+        if is_script(target):
+            return StdioBackend(target, self._env, self._message_handler)
+        if self.http is None:
+            self.http = aiohttp.ClientSession(
+                json_serialize=fast_json.dumps_str, timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout)
+            )
+        return HttpBackend(target, self.http)
+
+    async def _connect(self, server: RoutedServer) -> bool:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(server.backend.connect(), self.connect_timeout)
+        except Exception as e:
+            server.error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            logger.warning("MCP 服务器 %s 连接失败: %s", server.name, server.error)
+            return False
+        server.connect_seconds = time.perf_counter() - start
+        server.connected = True
+        server.error = None
+        return True
+
+    async def start(self) -> "MCPRouter":
+        start = time.perf_counter()
+        self.servers = {name: RoutedServer(name, target, self._backend(target)) for name, target in self._specs}
+        results = await asyncio.gather(*(self._connect(server) for server in self.servers.values()))
+        self.connect_seconds = time.perf_counter() - start
+        for server, ok in zip(self.servers.values(), results):
+            if not ok:
+                self._schedule_reconnect(server)
+        if not any(results):
+            logger.warning("所有 MCP 服务器均未连接成功，将在后台重试")
+        return self
+
+    async def __aenter__(self) -> "MCPRouter":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _schedule_reconnect(self, server: RoutedServer):
+        task = asyncio.create_task(self._reconnect(server))
+        self._reconnect_tasks.add(task)
+        task.add_done_callback(self._reconnect_tasks.discard)
+
+    async def _reconnect(self, server: RoutedServer):
+        delay = self.reconnect_delay
+        while not server.connected:
+            await asyncio.sleep(delay)
+            server.reconnects += 1
+            if await self._connect(server):
+                logger.info("MCP 服务器 %s 已重新连接", server.name)
+                return
+            delay = min(delay * 2, ROUTER_RECONNECT_MAX_DELAY)
+
+    async def _list_server_tools(self, server: RoutedServer) -> list[types.Tool]:
+        try:
+            tools = await asyncio.wait_for(server.backend.list_tools(), self.list_timeout)
+        except Exception as e:
+            # 慢或不可用的服务器本次不提供工具，不阻塞其他服务器
+            server.failures += 1
+            server.error = f"list_tools: {type(e).__name__}: {e}"
+            logger.warning("MCP 服务器 %s 获取工具列表失败: %s", server.name, e)
+            return []
+        server.tools = len(tools)
+        return [tool.model_copy(update={
+            "name": f"{server.name}{NAMESPACE_SEPARATOR}{tool.name}",
+            "description": f"[{server.name}] {tool.description or ''}",
+        }) for tool in tools]
+
+    async def list_tools(self) -> types.ListToolsResult:
+        """并发获取所有已连接服务器的工具列表并加上命名空间前缀"""
+        connected = [server for server in self.servers.values() if server.connected]
+        results = await asyncio.gather(*(self._list_server_tools(server) for server in connected))
+        return types.ListToolsResult(tools=[tool for tools in results for tool in tools])
+
+    def _route(self, name: str) -> tuple[RoutedServer, str]:
+        server_name, tool_name = split_tool_name(name)
+        server = self.servers.get(server_name)
+        if server is None:
+            raise ValueError(f"未知的 MCP 服务器: {server_name}")
+        if not server.connected:
+            raise ServerUnavailable(f"MCP 服务器 {server_name} 未连接: {server.error}")
+        server.calls += 1
+        return server, tool_name
+
+    async def call_tool(self, name: str, arguments: Optional[dict[str, Any]] = None) -> types.CallToolResult:
+        server, tool_name = self._route(name)
+        try:
+            return await server.backend.call_tool(tool_name, arguments)
+        except Exception:
+            server.failures += 1
+            raise
+
+    async def send_request(self, request: types.ClientRequest, result_type: type[T]) -> T:
+        """转发携带 _meta 的 tools/call 请求（用于进度通知），只改写其中的工具名"""
+        params = request.root.params
+        server, tool_name = self._route(params.name)
+        routed = types.ClientRequest(types.CallToolRequest(
+            method="tools/call", params=params.model_copy(update={"name": tool_name})
+        ))
+        try:
+            return await server.backend.send_request(routed, result_type)
+        except Exception:
+            server.failures += 1
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "connect_seconds": None if self.connect_seconds is None else round(self.connect_seconds, 3),
+            "servers": [{
+                "name": server.name,
+                "kind": server.backend.kind,
+                "target": server.target,
+                "connected": server.connected,
+                "connect_seconds": None if server.connect_seconds is None else round(server.connect_seconds, 3),
+                "tools": server.tools,
+                "calls": server.calls,
+                "failures": server.failures,
+                "reconnects": server.reconnects,
+                "error": server.error,
+            } for server in self.servers.values()],
+        }
+
+    def summary(self) -> str:
+        connected = [server for server in self.servers.values() if server.connected]
+        slowest = max((server.connect_seconds for server in connected), default=0.0)
+        lines = [f"已连接 {len(connected)}/{len(self.servers)} 个 MCP 服务器，总耗时 {self.connect_seconds:.2f}s（最慢的服务器 {slowest:.2f}s）"]
+        for server in self.servers.values():
+            state = f"{server.connect_seconds:.2f}s" if server.connected else f"未连接（{server.error}），后台重试中"
+            lines.append(f"  {server.name} [{server.backend.kind}] {server.target}: {state}")
+        return "\n".join(lines)
+
+    async def aclose(self):
+        for task in list(self._reconnect_tasks):
+            task.cancel()
+        await asyncio.gather(*self._reconnect_tasks, return_exceptions=True)
+        await asyncio.gather(*(server.backend.aclose() for server in self.servers.values()), return_exceptions=True)
+        if self.http is not None:
+            await self.http.close()
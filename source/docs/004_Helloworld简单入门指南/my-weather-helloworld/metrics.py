@@ -0,0 +1,170 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Optional
+import profiling
+
+# 默认的延迟分桶（秒），覆盖从微秒级的格式化到秒级的大模型调用
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _escape_label_value(value: str) -> str:
+    # Prometheus 文本格式要求标签值中的反斜杠、双引号与换行转义
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """只增计数器，与 Prometheus counter 语义一致"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Histogram:
+    """
+    固定分桶的延迟直方图，observe 只做一次二分查找与几次加法。
+    span 为性能分析模式下 time() 同时记录的 span 名称，可以引用标签，如 "fetch_{endpoint}"；为 None 时不记录。
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+                 span: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.span = span
+        # labels -> [各桶计数..., +Inf 计数, 总和]
+        self._values: dict[LabelKey, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """with HISTOGRAM.time(tool="query_weather"): ... 记录代码块耗时"""
+        span = profiling.span(self.span.format(**labels)) if self.span and profiling.is_enabled() else profiling.NOOP
+        start = time.perf_counter()
+        try:
+            with span:
+                yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, values in sorted(self._values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(labels, (('le', repr(bound)),))} {cumulative}"
+            cumulative += values[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {values[-1]}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+        # 渲染时才读取的外部状态，例如缓存命中数、熔断器状态
+        self.collectors: list[Callable[[], Iterable[tuple[str, str, str, float, dict[str, str]]]]] = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+                  span: Optional[str] = None) -> Histogram:
+        metric = Histogram(name, documentation, buckets, span)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple[str, str, str, float, dict[str, str]]]]):
+        """collector 返回 (name, type, help, value, labels) 序列"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        described = set()
+        for collector in self.collectors:
+            for name, metric_type, documentation, value, labels in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# 服务器端
+UPSTREAM_FETCH_SECONDS = REGISTRY.histogram("weather_upstream_fetch_seconds", "OpenWeather 请求耗时（含重试）", span="fetch_{endpoint}")
+UPSTREAM_ERRORS = REGISTRY.counter("weather_upstream_errors_total", "OpenWeather 请求失败次数")
+FORMAT_WEATHER_SECONDS = REGISTRY.histogram("weather_format_seconds", "format_weather 耗时", span="format_weather")
+CALL_TOOL_SECONDS = REGISTRY.histogram("mcp_call_tool_seconds", "服务器执行 MCP 工具的耗时", span="{tool}")
+CALL_TOOL_ERRORS = REGISTRY.counter("mcp_call_tool_errors_total", "服务器执行 MCP 工具失败次数")
+
+# 客户端
+CLIENT_LLM_SECONDS = REGISTRY.histogram("mcp_client_llm_completion_seconds", "客户端每次大模型调用的耗时")
+CLIENT_CALL_TOOL_SECONDS = REGISTRY.histogram("mcp_client_call_tool_seconds", "客户端视角的工具调用耗时", span="call_tool:{tool}")
+
+
+class QueryBreakdown:
+    """客户端单次查询的分阶段耗时，例如 llm#1 → tools#1 → llm#2"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: list[tuple[str, float]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            with profiling.span(name):
+                yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def summary(self) -> str:
+        stages = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.stages)
+        return f"[耗时 {time.perf_counter() - self.start:.3f}s: {stages}]"
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"total": time.perf_counter() - self.start, "stages": self.stages}
@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import json
+import bisect
+import asyncio
+import cProfile
+import logging
+import threading
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Iterator, Optional
+from dotenv import load_dotenv
+
+# 加载.env文件
+load_dotenv()
+
+# 性能分析模式，默认关闭；可以组合，如 sample,cprofile（1 等同于 sample）：
+#   sample   —— 后台线程定时采样事件循环线程的调用栈，退出时写出火焰图格式（collapsed stacks）
+#   cprofile —— 用 cProfile 记录事件循环线程的函数耗时，退出时写出 .prof 文件
+# 两种模式都会记录慢回调（附带任务名）与每个请求的分阶段耗时（span）
+PROFILE = os.getenv("MCP_PROFILE", "")
+PROFILE_DIR = os.getenv("MCP_PROFILE_DIR", "profiles")  # 输出目录
+SAMPLE_INTERVAL = float(os.getenv("MCP_PROFILE_INTERVAL", "0.01"))  # 采样间隔（秒）
+SLOW_CALLBACK = float(os.getenv("MCP_PROFILE_SLOW_CALLBACK", "0.05"))  # 单个回调阻塞事件循环超过该秒数时记录
+MAX_TRACES = int(os.getenv("MCP_PROFILE_MAX_TRACES", "2000"))  # 保留最近多少个请求的 span 明细
+
+MODES = ("sample", "cprofile")
+# span 耗时的分桶上界（秒）：10 µs 到约 170 秒，相邻桶相差 10%，汇总中的分位数误差不超过一个桶
+SPAN_BUCKETS = tuple(1e-5 * 1.1 ** i for i in range(176))
+
+logger = logging.getLogger(__name__)
+
+
+def parse_modes(value: Optional[str]) -> set[str]:
+    modes = set()
+    for mode in (value or "").lower().split(","):
+        mode = mode.strip()
+        if mode in ("1", "true", "yes", "on"):
+            modes.add("sample")
+        elif mode in MODES:
+            modes.add(mode)
+    return modes
+
+
+def add_argument(parser):
+    """为各入口的 argparse 增加 --profile [sample|cprofile|sample,cprofile]，缺省值取 MCP_PROFILE"""
+    parser.add_argument("--profile", nargs="?", const="sample", default=PROFILE, metavar="MODE",
+                        help="开启性能分析：sample（事件循环采样，输出火焰图）、cprofile，可用逗号组合")
+
+
+class SpanStats:
+    """
+    一个 span 名称的耗时统计：固定分桶计数加总和与最大值，内存不随调用次数增长（与 metrics.Histogram 相同的思路）。
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(SPAN_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, elapsed: float):
+        self.counts[bisect.bisect_left(SPAN_BUCKETS, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def quantile(self, q: float) -> float:
+        """按分桶估算分位数：返回所在桶的上界，不超过观察到的最大值"""
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(SPAN_BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank and cumulative > 0:
+                return min(bound, self.max)
+        return self.max
+
+
+class Trace:
+    """一个请求（最外层 span）内的所有 span"""
+
+    __slots__ = ("index", "name", "spans", "tasks", "closed")
+
+    def __init__(self, index: int, name: str):
+        self.index = index
+        self.name = name
+        self.spans: list[tuple[str, float, float, int]] = []  # (名称, 开始时间, 耗时, 任务序号)
+        self.tasks: dict[int, int] = {}  # id(task) -> 序号，trace 查看器中并发的子任务显示在不同的行
+        self.closed = False
+
+    def task_index(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return self.tasks.setdefault(id(task), len(self.tasks))
+
+
+# 当前请求；asyncio 任务创建时复制上下文，gather 出的子任务仍属于同一个请求
+_current: ContextVar[Optional[Trace]] = ContextVar("profiling_trace", default=None)
+
+
+class Span:
+    __slots__ = ("profiler", "name", "trace", "root", "task", "start", "token")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        trace = _current.get()
+        # 没有进行中的请求（或所在请求已结束，如请求中启动的后台任务）时，本 span 作为新请求的根
+        self.root = trace is None or trace.closed
+        if self.root:
+            trace = self.profiler.new_trace(self.name)
+        self.trace = trace
+        self.task = trace.task_index()
+        self.token = _current.set(trace)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # 在其他上下文中退出（如跨任务的异步生成器）
+            pass
+        self.trace.spans.append((self.name, self.start, elapsed, self.task))
+        self.profiler.durations[self.name].observe(elapsed)
+        if self.root:
+            self.trace.closed = True
+        return False
+
+
+class Profiler:
+    """
+    一次运行期间的性能分析：事件循环采样、cProfile、慢回调与每个请求的 span，stop() 时写出文件并打印汇总。
+    采样与慢回调都只针对调用 start() 的线程（事件循环所在线程）。
+    """
+
+    def __init__(self, name: str, modes: set[str], output_dir: str = PROFILE_DIR,
+                 interval: float = SAMPLE_INTERVAL, slow_callback: float = SLOW_CALLBACK, max_traces: int = MAX_TRACES):
+        self.name = name
+        self.modes = modes
+        self.output_dir = output_dir
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.started_at = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.samples: Counter[str] = Counter()
+        self.durations: defaultdict[str, SpanStats] = defaultdict(SpanStats)
+        self.traces: deque[Trace] = deque(maxlen=max_traces)
+        self.trace_count = 0
+        self.slow_callbacks: list[tuple[float, str]] = []  # (耗时, 描述)
+        self.cprofile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._handle_run: Optional[Callable] = None
+
+    def new_trace(self, name: str) -> Trace:
+        self.trace_count += 1
+        trace = Trace(self.trace_count, name)
+        self.traces.append(trace)
+        return trace
+
+    def start(self) -> "Profiler":
+        self._patch_handle_run()
+        if "cprofile" in self.modes:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        if "sample" in self.modes:
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiling-sampler", daemon=True)
+            self._sampler.start()
+        logger.warning("性能分析已开启（%s），退出时写入 %s", ",".join(sorted(self.modes)), os.path.abspath(self.output_dir))
+        return self
+
+    def _sample_loop(self):
+        current_frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+
+    def _patch_handle_run(self):
+        """
+        包装 asyncio 的 Handle._run（事件循环执行每个回调的入口，与 asyncio 调试模式的慢回调检测相同），
+        不开启调试模式的其他检查，只记录超过阈值的回调及其所属任务。
+        """
+        handle_run = self._handle_run = asyncio.events.Handle._run
+        threshold = self.slow_callback
+        profiler = self
+
+        def _run(handle):
+            start = time.perf_counter()
+            handle_run(handle)
+            elapsed = time.perf_counter() - start
+            if elapsed >= threshold:
+                profiler.record_slow_callback(handle, elapsed)
+
+        asyncio.events.Handle._run = _run
+
+    def record_slow_callback(self, handle: asyncio.Handle, elapsed: float):
+        callback = getattr(handle, "_callback", None)
+        task = getattr(callback, "__self__", None)
+        if isinstance(task, asyncio.Task):
+            coro = task.get_coro()
+            description = f"任务 {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        else:
+            description = f"回调 {getattr(callback, '__qualname__', callback)}"
+        self.slow_callbacks.append((elapsed, description))
+        logger.warning("慢回调阻塞事件循环 %.1f ms: %s", elapsed * 1000, description)
+
+    def stop(self) -> list[str]:
+        """停止分析，写出文件并打印汇总，返回写出的文件路径"""
+        if self._handle_run is not None:
+            asyncio.events.Handle._run = self._handle_run
+            self._handle_run = None
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"{self.name}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+        paths = []
+        if self.samples:
+            # collapsed stacks：每行“栈帧;栈帧;... 采样数”，可直接交给 flamegraph.pl 或 speedscope
+            paths.append(f"{prefix}.collapsed")
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+        if self.cprofile is not None:
+            paths.append(f"{prefix}.prof")
+            self.cprofile.dump_stats(paths[-1])
+        if self.traces:
+            # Chrome trace event 格式，可在 chrome://tracing 或 Perfetto 中打开：每个请求一组，并发的子任务各占一行
+            paths.append(f"{prefix}.trace.json")
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": list(self.trace_events()), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        logger.warning("%s", self.summary(paths))
+        return paths
+
+    def trace_events(self) -> Iterator[dict[str, Any]]:
+        for trace in self.traces:
+            yield {"ph": "M", "name": "process_name", "pid": trace.index, "args": {"name": f"#{trace.index} {trace.name}"}}
+            for name, start, elapsed, task in trace.spans:
+                yield {"ph": "X", "name": name, "pid": trace.index, "tid": task,
+                       "ts": round((start - self.started_at) * 1e6, 1), "dur": round(elapsed * 1e6, 1)}
+
+    def summary(self, paths: list[str]) -> str:
+        lines = [f"性能分析汇总（{self.name}，{time.perf_counter() - self.started_at:.1f} 秒）"]
+        if self.samples:
+            total = sum(self.samples.values())
+            idle = sum(count for stack, count in self.samples.items() if stack.rsplit(";", 1)[-1].startswith(("select ", "poll ")))
+            lines.append(f"事件循环采样 {total} 次，空闲（等待 I/O）{idle / total:.0%}")
+        if self.durations:
+            lines.append(f"{'span':<28}{'次数':>8}{'平均 ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'最大 ms':>10}")
+            for name, stats in sorted(self.durations.items(), key=lambda item: -item[1].total):
+                lines.append(f"{name:<28}{stats.count:>8}{stats.total / stats.count * 1000:>10.2f}"
+                             f"{stats.quantile(0.5) * 1000:>10.2f}{stats.quantile(0.99) * 1000:>10.2f}{stats.max * 1000:>10.2f}")
+        lines.append(f"慢回调（≥ {self.slow_callback * 1000:.0f} ms）{len(self.slow_callbacks)} 次")
+        for elapsed, description in sorted(self.slow_callbacks, reverse=True)[:5]:
+            lines.append(f"  {elapsed * 1000:.1f} ms  {description}")
+        lines.extend(f"已写入 {path}" for path in paths)
+        return "\n".join(lines)
+
+
+# 当前运行中的 Profiler；为 None 时 span() 直接返回空的上下文管理器，关闭时几乎没有开销
+_profiler: Optional[Profiler] = None
+NOOP = nullcontext()
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def span(name: str):
+    """with span("fetch_weather"): ... 记录一个阶段的耗时；最外层的 span 即一个请求"""
+    if _profiler is None:
+        return NOOP
+    return Span(_profiler, name)
+
+
+def traced(name: str):
+    """async 函数的装饰器：整个调用作为一个 span，如 @traced("process_query")"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return await func(*args, **kwargs)
+            with Span(_profiler, name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start(name: str, modes: str = PROFILE, output_dir: str = PROFILE_DIR) -> Optional[Profiler]:
+    """在事件循环所在线程调用（asyncio.run / uvicorn.run / anyio.run 之前），modes 为空时不做任何事"""
+    global _profiler
+    parsed = parse_modes(modes)
+    if not parsed or _profiler is not None:
+        return None
+    _profiler = Profiler(name, parsed, output_dir).start()
+    return _profiler
+
+
+def stop():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+
+
+@contextmanager
+def profile(name: str, modes: str = PROFILE, output_dir: str = PROFILE_DIR):
+    """with profile("stdio_server", args.profile): 运行服务器或客户端，退出时写出分析结果"""
+    profiler = start(name, modes, output_dir)
+    try:
+        yield profiler
+    finally:
+        if profiler is not None:
+            stop()
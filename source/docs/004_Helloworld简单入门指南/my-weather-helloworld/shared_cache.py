@@ -0,0 +1,108 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Any
+import fast_json
+
+
+class SQLiteWeatherStore:
+    """
+    基于本地 SQLite 文件（WAL 模式）的跨进程天气缓存，供多个 worker 进程共享。
+    除缓存条目外还维护一张租约表：某个键正在被一个进程请求上游时，其他进程等待其结果而不是重复请求。
+    所有方法都是阻塞调用，在事件循环中应通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, path: str, lease_ttl: float = 10.0):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.owner = f"{os.getpid()}"
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weather_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weather_lease ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程使用，每个线程各自持有一个连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key: tuple[str, ...]) -> str:
+        return "\x1f".join(key)
+
+    def get(self, key: tuple[str, ...]) -> tuple[dict[str, Any], float] | None:
+        """:return: (数据, 剩余有效秒数)；不存在或已过期时返回 None"""
+        row = self._connect().execute(
+            "SELECT expires_at, data FROM weather_cache WHERE key = ?", (self._key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        remaining = row[0] - time.time()
+        if remaining <= 0:
+            return None
+        return fast_json.loads(row[1]), remaining
+
+    def set(self, key: tuple[str, ...], data: dict[str, Any], ttl: float) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO weather_cache (key, expires_at, data) VALUES (?, ?, ?)",
+            (self._key(key), time.time() + ttl, fast_json.dumps(data)),
+        )
+
+    def acquire_lease(self, key: tuple[str, ...]) -> bool:
+        """尝试成为该键的上游请求方；已有未过期的租约时返回 False"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM weather_lease WHERE key = ? AND expires_at <= ?", (self._key(key), now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO weather_lease (key, owner, expires_at) VALUES (?, ?, ?)",
+            (self._key(key), self.owner, now + self.lease_ttl),
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, key: tuple[str, ...]) -> None:
+        self._connect().execute(
+            "DELETE FROM weather_lease WHERE key = ? AND owner = ?", (self._key(key), self.owner)
+        )
+
+    def get_or_lease_many(
+        self, keys: list[tuple[str, ...]]
+    ) -> tuple[dict[tuple[str, ...], tuple[dict[str, Any], float]], list[tuple[str, ...]], list[tuple[str, ...]]]:
+        """
+        批量查询时在一次线程切换中处理多个键：命中的直接返回，未命中的尝试取得租约。
+        :return: (命中的键 -> (数据, 剩余有效秒数), 取得租约的键, 其他进程正在请求的键)
+        """
+        found, leased, busy = {}, [], []
+        for key in keys:
+            entry = self.get(key)
+            if entry is not None:
+                found[key] = entry
+            elif self.acquire_lease(key):
+                leased.append(key)
+            else:
+                busy.append(key)
+        return found, leased, busy
+
+    def set_many(self, items: list[tuple[tuple[str, ...], dict[str, Any], float]]) -> None:
+        """:param items: (键, 数据, ttl) 列表"""
+        for key, data, ttl in items:
+            self.set(key, data, ttl)
+
+    def release_leases(self, keys: list[tuple[str, ...]]) -> None:
+        for key in keys:
+            self.release_lease(key)
+
+    def purge_expired(self) -> int:
+        cursor = self._connect().execute("DELETE FROM weather_cache WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
@@ -0,0 +1,82 @@
+import os
+import uuid
+import asyncio
+from typing import Any, AsyncIterator
+from dotenv import load_dotenv
+import fast_json
+
+# 加载.env文件
+load_dotenv()
+
+# SSE 会话配置
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))  # 空闲多少秒后发送一次心跳
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "64"))  # 每个会话待发送事件的队列长度
+SSE_SEND_TIMEOUT = float(os.getenv("SSE_SEND_TIMEOUT", "5"))  # 队列满时最多等待多少秒，超时视为慢客户端并断开
+
+
+class SSESession:
+    """
+    一个 /connect 长连接对应的会话。
+    服务器把工具结果与进度通知放入有界队列，由该连接的事件生成器推送给客户端。
+    """
+
+    def __init__(self, session_id: str, queue_size: int = SSE_QUEUE_SIZE):
+        self.id = session_id
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    async def send(self, event: str, data: dict[str, Any], timeout: float = SSE_SEND_TIMEOUT) -> bool:
+        """
+        把事件放入会话队列。队列已满时等待客户端读取（背压），超时则关闭会话。
+        :return: 事件是否成功入队
+        """
+        if self.closed:
+            return False
+        try:
+            await asyncio.wait_for(self.queue.put({"event": event, "data": fast_json.dumps_str(data)}), timeout)
+        except asyncio.TimeoutError:
+            self.closed = True
+            return False
+        return True
+
+    async def events(self, heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL) -> AsyncIterator[dict[str, Any]]:
+        """依次产出待发送事件；只有空闲超过 heartbeat_interval 时才发送心跳"""
+        while not self.closed:
+            try:
+                yield await asyncio.wait_for(self.queue.get(), heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield {"event": "ping", "data": ""}
+
+
+class SessionManager:
+    """按 session_id 管理所有已连接的 SSE 会话"""
+
+    def __init__(self):
+        self.sessions: dict[str, SSESession] = {}
+
+    def create(self) -> SSESession:
+        # 以进程号作前缀，多 worker 部署时可以看出会话属于哪个进程
+        session = SSESession(f"{os.getpid()}-{uuid.uuid4().hex}")
+        self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> SSESession | None:
+        session = self.sessions.get(session_id)
+        if session is not None and session.closed:
+            self.close(session_id)
+            return None
+        return session
+
+    def close(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.closed = True
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "queued_events": sum(session.queue.qsize() for session in self.sessions.values()),
+        }
+
+
+sse_sessions = SessionManager()
@@ -0,0 +1,166 @@
+import os
+import sys
+import stat
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import anyio
+from dotenv import load_dotenv
+from mcp import types
+from mcp.server.fastmcp import FastMCP
+from mcp.server.stdio import stdio_server
+
+# mcp>=1.9 的读写流传递 SessionMessage；1.6 直接传递 JSONRPCMessage
+try:
+    from mcp.shared.message import SessionMessage
+except ImportError:
+    SessionMessage = None
+
+# 加载.env文件
+load_dotenv()
+
+# 使用批量读写的 stdio 传输（默认开启）；0 时使用 mcp 自带的 stdio_server
+PIPELINE = os.getenv("MCP_STDIO_PIPELINE", "1").lower() in ("1", "true", "yes")
+WRITE_BATCH = int(os.getenv("MCP_STDIO_WRITE_BATCH", "64"))  # 一次写入 stdout 的最多消息数
+STREAM_BUFFER = int(os.getenv("MCP_STDIO_STREAM_BUFFER", "256"))  # 已解析的请求与待写出的响应各自最多缓冲的消息数
+READ_CHUNK = 64 * 1024
+
+
+class ThreadPipes:
+    """
+    在线程中读写 stdin / stdout（Windows，或 stdin 不是管道时）。
+    与 mcp 自带的 stdio_server 不同，按块读取而不是逐行读取，写出时一批消息只切换一次线程、flush 一次。
+    """
+
+    def __init__(self):
+        self.stdin = sys.stdin.buffer
+        self.stdout = sys.stdout.buffer
+
+    async def read(self) -> bytes:
+        read1 = getattr(self.stdin, "read1", self.stdin.read)
+        return await anyio.to_thread.run_sync(read1, READ_CHUNK)
+
+    def _write(self, data: bytes):
+        self.stdout.write(data)
+        self.stdout.flush()
+
+    async def write(self, data: bytes):
+        await anyio.to_thread.run_sync(self._write, data)
+
+    def close(self):
+        pass
+
+
+class AsyncioPipes:
+    """通过事件循环直接读写 stdin / stdout 管道，不经过线程"""
+
+    def __init__(self, reader: asyncio.StreamReader, read_transport: asyncio.ReadTransport, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.read_transport = read_transport
+        self.writer = writer
+
+    @staticmethod
+    def supported(fd: int) -> bool:
+        # 只接管管道与套接字；普通文件与终端使用 ThreadPipes。
+        # 终端（字符设备）会被 asyncio 设为非阻塞且退出后不恢复，手动在终端运行服务器后 shell 会出错
+        mode = os.fstat(fd).st_mode
+        return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+
+    @classmethod
+    async def open(cls) -> Optional["AsyncioPipes"]:
+        """:return: stdin / stdout 不是管道或平台不支持时返回 None"""
+        if sys.platform == "win32" or not (cls.supported(sys.stdin.fileno()) and cls.supported(sys.stdout.fileno())):
+            return None
+        loop = asyncio.get_running_loop()
+        # 复制文件描述符，关闭传输时不会关闭进程的 stdin / stdout
+        stdin = os.fdopen(os.dup(sys.stdin.fileno()), "rb", buffering=0)
+        stdout = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+        reader = asyncio.StreamReader(limit=2 ** 32, loop=loop)
+        read_transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop), stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, stdout)
+        return cls(reader, read_transport, asyncio.StreamWriter(transport, protocol, reader, loop))
+
+    async def read(self) -> bytes:
+        return await self.reader.read(READ_CHUNK)
+
+    async def write(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def close(self):
+        self.read_transport.close()
+        self.writer.close()
+
+
+async def open_pipes():
+    try:
+        pipes = await AsyncioPipes.open()
+    except (NotImplementedError, RuntimeError):
+        # 不是 asyncio 事件循环（如 trio）
+        pipes = None
+    return pipes or ThreadPipes()
+
+
+@asynccontextmanager
+async def pipelined_stdio_server() -> AsyncIterator[tuple]:
+    """
+    与 mcp.server.stdio.stdio_server 接口相同的 stdio 传输，适合同一条管道上有大量未完成请求的场景：
+    - 按块读取 stdin，一次解析其中所有完整的行，而不是每行一次线程切换；
+    - 写出时取走所有已就绪的响应（最多 WRITE_BATCH 条），拼接后一次写入、一次 flush；
+    - 读写两端都有缓冲，工具处理完成后不必等待上一条响应写出。
+    请求仍由 mcp 的 Server 分别在独立任务中处理，响应按完成顺序写出，客户端按 id 匹配。
+    """
+    read_stream_writer, read_stream = anyio.create_memory_object_stream(STREAM_BUFFER)
+    write_stream, write_stream_reader = anyio.create_memory_object_stream(STREAM_BUFFER)
+    pipes = await open_pipes()
+
+    async def send_line(line: bytes):
+        if not line.strip():
+            return
+        try:
+            message = types.JSONRPCMessage.model_validate_json(line)
+        except Exception as exc:
+            await read_stream_writer.send(exc)
+            return
+        await read_stream_writer.send(SessionMessage(message) if SessionMessage else message)
+
+    async def stdin_reader():
+        pending = b""
+        async with read_stream_writer:
+            while chunk := await pipes.read():
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    await send_line(line)
+            # stdin 关闭前最后一条消息可能没有换行符，与 mcp 的 stdio_server 一样仍然处理
+            await send_line(pending)
+
+    async def stdout_writer():
+        async with write_stream_reader:
+            async for item in write_stream_reader:
+                batch = [item]
+                while len(batch) < WRITE_BATCH:
+                    try:
+                        batch.append(write_stream_reader.receive_nowait())
+                    except (anyio.WouldBlock, anyio.EndOfStream):
+                        break
+                lines = [
+                    (queued.message if SessionMessage else queued).model_dump_json(by_alias=True, exclude_none=True)
+                    for queued in batch
+                ]
+                lines.append("")
+                await pipes.write("\n".join(lines).encode("utf-8"))
+
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(stdin_reader)
+            tg.start_soon(stdout_writer)
+            yield read_stream, write_stream
+    finally:
+        pipes.close()
+
+
+async def run_stdio(server: FastMCP, pipeline: bool = PIPELINE):
+    """以 stdio 方式运行 FastMCP 服务器，等同于 server.run(transport="stdio")，pipeline 为 True 时使用批量读写的传输"""
+    transport = pipelined_stdio_server if pipeline else stdio_server
+    async with transport() as (read_stream, write_stream):
+        await server._mcp_server.run(read_stream, write_stream, server._mcp_server.create_initialization_options())
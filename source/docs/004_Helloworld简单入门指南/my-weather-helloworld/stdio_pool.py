@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+import anyio
+from dotenv import load_dotenv
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.stdio import stdio_client
+
+# 加载.env文件
+load_dotenv()
+
+# 常驻 stdio 服务器进程数，1 表示不使用进程池（与原来的单进程行为一致）
+POOL_SIZE = int(os.getenv("MCP_STDIO_POOL_SIZE", "1"))
+POOL_RESTART_DELAY = float(os.getenv("MCP_STDIO_POOL_RESTART_DELAY", "0.5"))  # 子进程崩溃后重启前的初始等待（秒），之后每次翻倍
+POOL_RESTART_MAX_DELAY = 30.0
+# 连续重启失败（如 .env 错误、导入失败）达到该次数后不再重启，该进程标记为不可用
+POOL_RESTART_ATTEMPTS = int(os.getenv("MCP_STDIO_POOL_RESTART_ATTEMPTS", "5"))
+POOL_READY_TIMEOUT = float(os.getenv("MCP_STDIO_POOL_READY_TIMEOUT", "30"))  # 没有可用进程时最多等待多少秒
+
+# 子进程退出后读写流被关闭，此后的调用会抛出这些异常
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, BrokenPipeError, ConnectionError)
+
+T = TypeVar("T")
+
+
+class PooledServer:
+    """
+    进程池中的一个 stdio 服务器进程。
+    stdio_client 与 ClientSession 在独立任务中进入和退出，保证 anyio 的 cancel scope 不会跨任务关闭。
+    """
+
+    def __init__(self, index: int, params: StdioServerParameters, message_handler=None):
+        self.index = index
+        self.params = params
+        self.message_handler = message_handler
+        self.session: Optional[ClientSession] = None
+        self.outstanding = 0  # 正在执行的请求数
+        self.calls = 0
+        self.restarts = 0
+        self.restarting = False
+        self.dead = False  # 连续重启失败次数用尽，不再重启
+        self.startup_seconds: Optional[float] = None  # 启动进程到完成 initialize 的耗时
+        self.error: Optional[BaseException] = None
+        self.ready = asyncio.Event()
+        self.closed: asyncio.Future = asyncio.get_running_loop().create_future()  # 进程退出时完成
+        self.on_exit: Optional[Callable[["PooledServer"], None]] = None  # 非主动停止（崩溃、启动失败）时调用
+        self._stop = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.session is not None and not self.restarting
+
+    def start(self):
+        self.ready = asyncio.Event()
+        self.closed = asyncio.get_running_loop().create_future()
+        self._stop = asyncio.Event()
+        self._stopping = False
+        self.error = None
+        self._task = asyncio.create_task(self._run())
+
+    async def _relay(self, source, sink):
+        """转发服务器消息；子进程退出使 stdout 结束时立即关闭该连接，而不是等到下一次调用才发现"""
+        async with sink:
+            async for message in source:
+                await sink.send(message)
+        self._stop.set()
+
+    async def _initialize(self, session: ClientSession):
+        """子进程在响应 initialize 之前退出（脚本不存在、导入失败）时立即失败，而不是一直等待响应"""
+        initialize = asyncio.ensure_future(session.initialize())
+        stopped = asyncio.ensure_future(self._stop.wait())
+        try:
+            await asyncio.wait((initialize, stopped), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopped.cancel()
+            if not initialize.done():
+                initialize.cancel()
+        if initialize.cancelled():
+            raise ConnectionResetError(f"stdio 服务器进程 #{self.index} 在初始化完成前退出")
+        initialize.result()
+
+    async def _run(self):
+        start = time.perf_counter()
+        try:
+            async with stdio_client(self.params) as (read, write):
+                relay_writer, relay_reader = anyio.create_memory_object_stream(0)
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(self._relay, read, relay_writer)
+                    async with ClientSession(relay_reader, write, message_handler=self.message_handler) as session:
+                        await self._initialize(session)
+                        self.startup_seconds = time.perf_counter() - start
+                        self.session = session
+                        self.ready.set()
+                        await self._stop.wait()
+                    tg.cancel_scope.cancel()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.session = None
+            # 启动失败时同样唤醒等待者，由其检查 healthy
+            self.ready.set()
+            if not self.closed.done():
+                self.closed.set_result(None)
+            if not self._stopping and self.on_exit is not None:
+                self.on_exit(self)
+
+    async def call(self, operation: Callable[[ClientSession], Awaitable[T]]) -> T:
+        """执行一次请求；进程在请求完成前退出时抛出 ConnectionResetError，而不是一直等待响应"""
+        call = asyncio.ensure_future(operation(self.session))
+        try:
+            await asyncio.wait((call, self.closed), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        if call.done():
+            return call.result()
+        call.cancel()
+        raise ConnectionResetError(f"stdio 服务器进程 #{self.index} 已退出")
+
+    async def wait_ready(self) -> bool:
+        await self.ready.wait()
+        return self.session is not None
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._stop.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+class StdioServerPool:
+    """
+    常驻的 stdio 服务器进程池：连接时并发启动 size 个进程，之后的 call_tool 分派到未完成请求最少的进程，
+    避免每个客户端都冷启动一个子进程；子进程崩溃后在后台重启，期间请求由其他进程处理。
+    """
+
+    def __init__(
+        self,
+        params: StdioServerParameters,
+        size: int = POOL_SIZE,
+        message_handler=None,
+        restart_delay: float = POOL_RESTART_DELAY,
+        ready_timeout: float = POOL_READY_TIMEOUT,
+        restart_attempts: int = POOL_RESTART_ATTEMPTS,
+    ):
+        self.workers = [PooledServer(i, params, message_handler) for i in range(max(size, 1))]
+        for worker in self.workers:
+            worker.on_exit = self._schedule_restart
+        self.restart_delay = restart_delay
+        self.ready_timeout = ready_timeout
+        self.restart_attempts = restart_attempts
+        self.restarts = 0
+        self._restart_tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> "StdioServerPool":
+        for worker in self.workers:
+            worker.start()
+        ready = await asyncio.gather(*(worker.wait_ready() for worker in self.workers))
+        if not any(ready):
+            await self.aclose()
+            raise RuntimeError("stdio 服务器进程全部启动失败") from self.workers[0].error
+        for worker, ok in zip(self.workers, ready):
+            if not ok:
+                self._schedule_restart(worker)
+        return self
+
+    async def __aenter__(self) -> "StdioServerPool":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _pick(self) -> Optional[PooledServer]:
+        """最少未完成请求（least outstanding requests）"""
+        return min((worker for worker in self.workers if worker.healthy), key=lambda worker: worker.outstanding, default=None)
+
+    async def _acquire(self) -> PooledServer:
+        worker = self._pick()
+        deadline = time.monotonic() + self.ready_timeout
+        while worker is None:
+            if all(server.dead for server in self.workers):
+                raise RuntimeError("stdio 服务器进程多次重启失败，已全部停用")
+            if time.monotonic() >= deadline:
+                raise RuntimeError("没有可用的 stdio 服务器进程")
+            await asyncio.sleep(0.05)
+            worker = self._pick()
+        return worker
+
+    async def _dispatch(self, operation: Callable[[ClientSession], Awaitable[T]]) -> T:
+        # 天气工具都是只读查询，子进程在处理中崩溃时换一个进程重试一次
+        for attempt in range(2):
+            worker = await self._acquire()
+            worker.outstanding += 1
+            worker.calls += 1
+            try:
+                return await worker.call(operation)
+            except CONNECTION_ERRORS:
+                self._schedule_restart(worker)
+                if attempt:
+                    raise
+            finally:
+                worker.outstanding -= 1
+        raise AssertionError("unreachable")
+
+    async def call_tool(self, name: str, arguments: Optional[dict[str, Any]] = None) -> types.CallToolResult:
+        return await self._dispatch(lambda session: session.call_tool(name, arguments))
+
+    async def list_tools(self) -> types.ListToolsResult:
+        return await self._dispatch(lambda session: session.list_tools())
+
+    async def send_request(self, request: types.ClientRequest, result_type: type[T]) -> T:
+        """发送任意请求（如携带 _meta.progressToken 的 tools/call），服务器的进度通知经 message_handler 转发"""
+        return await self._dispatch(lambda session: session.send_request(request, result_type))
+
+    def _schedule_restart(self, worker: PooledServer):
+        if worker.restarting or worker.dead:
+            return
+        logging.warning("stdio 服务器进程 #%d 已断开，正在重启", worker.index)
+        worker.restarting = True
+        task = asyncio.create_task(self._restart(worker))
+        self._restart_tasks.add(task)
+        task.add_done_callback(self._restart_tasks.discard)
+
+    async def _restart(self, worker: PooledServer):
+        """按带上限的指数退避重启；连续失败 restart_attempts 次后标记为 dead，请求不再等待它"""
+        try:
+            await worker.stop()
+            delay = self.restart_delay
+            for attempt in range(1, self.restart_attempts + 1):
+                await asyncio.sleep(delay)
+                worker.restarts += 1
+                self.restarts += 1
+                worker.start()
+                if await worker.wait_ready():
+                    return
+                logging.warning("stdio 服务器进程 #%d 第 %d 次重启失败: %s", worker.index, attempt, worker.error)
+                delay = min(delay * 2, POOL_RESTART_MAX_DELAY)
+            worker.dead = True
+            logging.error("stdio 服务器进程 #%d 连续 %d 次重启失败，不再重启", worker.index, self.restart_attempts)
+        finally:
+            worker.restarting = False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self.workers),
+            "healthy": sum(worker.healthy for worker in self.workers),
+            "dead": sum(worker.dead for worker in self.workers),
+            "restarts": self.restarts,
+            "workers": [{
+                "index": worker.index,
+                "healthy": worker.healthy,
+                "dead": worker.dead,
+                "outstanding": worker.outstanding,
+                "calls": worker.calls,
+                "restarts": worker.restarts,
+                "startup_seconds": None if worker.startup_seconds is None else round(worker.startup_seconds, 3),
+            } for worker in self.workers],
+        }
+
+    async def aclose(self):
+        for task in list(self._restart_tasks):
+            task.cancel()
+        await asyncio.gather(*self._restart_tasks, return_exceptions=True)
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
@@ -1,12 +1,22 @@
 import asyncio
+import itertools
 import os
-import json
-from typing import Optional
+import time
+from typing import AsyncIterator, Callable, Optional
 from contextlib import AsyncExitStack
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+from tool_calls import MAX_ITERATIONS, TOOL_CONCURRENCY, TOOL_TIMEOUT, make_tool_runner, print_progress, run_tool_calls, tool_names
+from llm_stream import STREAM_OUTPUT, StreamTiming, StreamedTurn
+from metrics import CLIENT_LLM_SECONDS, QueryBreakdown
+from conversation import ConversationMemory
+from stdio_pool import POOL_SIZE, StdioServerPool
+from mcp_router import MCP_SERVERS, MCPRouter, parse_servers
+from tool_cache import ToolResultCache
+from weather_format import ERROR_MARK
+import profiling
 
 
 # 加载.env文件，确保API Key受到保护
@@ -24,12 +34,35 @@ class MCPClient:
             raise ValueError("未找到OpenAI API Key，请在.env文件中设置OPENAI_API_KEY")
 
         self.client = AsyncOpenAI(api_key=self.openai_api_key, base_url=self.base_url)  # 使用异步客户端
+        self.max_iterations = MAX_ITERATIONS  # 最多进行的工具调用轮数
+        self.tool_concurrency = TOOL_CONCURRENCY  # 同一轮中并发执行的工具调用数上限
+        self.tool_timeout = TOOL_TIMEOUT  # 单个工具调用超时（秒）
+        self.stream_output = STREAM_OUTPUT  # chat_loop 是否流式输出回答
+        self.last_timing: Optional[StreamTiming] = None
+        self.last_breakdown: Optional[QueryBreakdown] = None  # process_query 最近一次查询的分阶段耗时
+        self.memory = ConversationMemory()  # 多轮对话记忆，MCP_MEMORY_TOKENS=0 时关闭
+        # 工具列表缓存：连接时构建一次，收到 tools/list_changed 通知或超过 TTL 后才重新获取
+        self.tools_cache_ttl = float(os.getenv("MCP_TOOLS_CACHE_TTL", "0"))  # 0 表示只依赖通知失效
+        self.available_tools: Optional[list[dict]] = None
+        self.tools_fetched_at = 0.0
+        # 工具结果缓存：TTL 来自服务器在工具 annotations 中声明的 cacheTtl，MCP_TOOL_RESULT_CACHE=0 时关闭
+        self.tool_cache = ToolResultCache()
+        # 工具进度回调 (工具名, 已完成, 总数)；设置后工具调用携带 progressToken，服务器据此发送进度通知
+        self.on_progress: Optional[Callable[[str, float, Optional[float]], None]] = None
+        self.progress_tokens: dict[str, str] = {}  # progressToken -> 工具名
+        self._token_counter = itertools.count(1)
         # 创建OpenAI client
         self.session: Optional[ClientSession] = None
+        self.pool_size = POOL_SIZE  # 常驻 stdio 服务器进程数，大于 1 时使用进程池
+        self.pool: Optional[StdioServerPool] = None
+        self.router: Optional[MCPRouter] = None  # 连接多个服务器时使用，工具名带 服务器名__ 前缀
         self.exit_stack = AsyncExitStack()
 
-    async def connect_to_server(self, server_script_path: str):
-        """连接到MCP服务器并列出可用工具"""
+    async def connect_to_server(self, server_script_path: str, env: Optional[dict[str, str]] = None):
+        """
+        连接到MCP服务器并列出可用工具
+        :param env: 服务器进程的环境变量，默认只继承 mcp 的安全子集（HOME、PATH 等）
+        """
         is_python = server_script_path.endswith('.py')
         is_js = server_script_path.endswith('.js')
 
@@ -40,84 +73,197 @@ class MCPClient:
         server_params = StdioServerParameters(
             command=command,
             args=[server_script_path],
-            env=None
+            env=env
         )
 
-        # 启动MCP服务器并建立通信
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-        await self.session.initialize()
+        if self.pool_size > 1:
+            # 并发启动多个常驻服务器进程，工具调用分派到未完成请求最少的进程
+            self.pool = await self.exit_stack.enter_async_context(
+                StdioServerPool(server_params, self.pool_size, message_handler=self.handle_message)
+            )
+        else:
+            # 启动MCP服务器并建立通信
+            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
+            self.stdio, self.write = stdio_transport
+            self.session = await self.exit_stack.enter_async_context(
+                ClientSession(self.stdio, self.write, message_handler=self.handle_message)
+            )
+            await self.session.initialize()
 
-        # 列出MCP服务器上的工具
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\n已连接到服务器，支持以下工具:", [tool.name for tool in tools])
+        # 列出MCP服务器上的工具，并缓存转换好的 OpenAI 工具格式
+        available_tools = await self.get_available_tools()
+        print("\n已连接到服务器，支持以下工具:", [tool["function"]["name"] for tool in available_tools])
 
+    async def connect_to_servers(self, specs: list[str], env: Optional[dict[str, str]] = None):
+        """
+        并发连接多个 MCP 服务器（stdio 脚本或 HTTP 地址），合并它们的工具；
+        连接失败或超时的服务器不影响其他服务器，并在后台重试。
+        :param specs: 名称=地址 或地址，见 mcp_router.MCP_SERVERS
+        """
+        self.router = await self.exit_stack.enter_async_context(
+            MCPRouter(parse_servers(specs), env=env, message_handler=self.handle_message)
+        )
+        # 路由器提供与 ClientSession 相同的 list_tools / call_tool / send_request
+        self.pool = self.router
+        print(self.router.summary())
+        available_tools = await self.get_available_tools()
+        print("\n已连接到服务器，支持以下工具:", [tool["function"]["name"] for tool in available_tools])
+
+    async def handle_message(self, message) -> None:
+        """处理服务器主动发送的消息：工具列表变化时使缓存失效，进度通知转给 on_progress"""
+        if not isinstance(message, types.ServerNotification):
+            return
+        if isinstance(message.root, types.ToolListChangedNotification):
+            self.available_tools = None
+        elif isinstance(message.root, types.ProgressNotification):
+            params = message.root.params
+            tool_name = self.progress_tokens.get(str(params.progressToken))
+            if tool_name is not None and self.on_progress is not None:
+                self.on_progress(tool_name, params.progress, params.total)
+
+    async def get_available_tools(self) -> list[dict]:
+        """返回缓存的 OpenAI 工具格式，缓存为空或过期时重新调用 list_tools"""
+        expired = self.tools_cache_ttl > 0 and time.monotonic() - self.tools_fetched_at > self.tools_cache_ttl
+        if self.available_tools is None or expired:
+            response = await (self.pool or self.session).list_tools()
+            self.available_tools = [{
+                "type": "function",
+                "function": {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "parameters": tool.inputSchema
+                }
+            } for tool in response.tools]
+            self.tool_cache.configure(response.tools)
+            self.tools_fetched_at = time.monotonic()
+        return self.available_tools
+
+    async def call_tool(self, tool_name: str, tool_args: dict, use_cache: bool = True) -> str:
+        """
+        执行单个MCP工具并返回文本结果
+        :param use_cache: 为 False 时跳过工具结果缓存，直接调用服务器并刷新缓存
+        """
+        return await self.tool_cache.get_or_call(
+            tool_name, tool_args, lambda: self.call_tool_uncached(tool_name, tool_args), bypass=not use_cache
+        )
+
+    async def call_tool_uncached(self, tool_name: str, tool_args: dict) -> str:
+        target = self.pool or self.session
+        if self.on_progress is None:
+            result = await target.call_tool(tool_name, tool_args)
+        else:
+            # ClientSession.call_tool 不能附带 _meta，直接构造 tools/call 请求以携带 progressToken
+            token = f"progress-{next(self._token_counter)}"
+            self.progress_tokens[token] = tool_name
+            try:
+                params = types.CallToolRequestParams(name=tool_name, arguments=tool_args, _meta={"progressToken": token})
+                request = types.ClientRequest(types.CallToolRequest(method="tools/call", params=params))
+                result = await target.send_request(request, types.CallToolResult)
+            finally:
+                self.progress_tokens.pop(token, None)
+        text = result.content[0].text
+        # 工具执行失败时加上错误标记，避免被缓存
+        return f"{ERROR_MARK} {text}" if result.isError else text
+
+    @profiling.traced("process_query")
     async def process_query(self, query: str) -> str:
         """
         使用大模型处理查询并调用可用的MCP工具 (Function Calling)
+        模型一次返回多个 tool_calls 时并发执行，最多进行 max_iterations 轮工具调用
         """
-        messages = [{"role": "user", "content": query}]
-
-        response = await self.session.list_tools()
-
-        available_tools = [{
-            "type": "function",
-            "function": {
-                "name": tool.name,
-                "description": tool.description,
-                "parameters": tool.inputSchema
-            }
-        } for tool in response.tools]
-        # print(available_tools)
-
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=available_tools
-        )
+        messages = self.memory.build(query)
+        turn_start = len(messages) - 1  # 本轮消息（从用户问题开始）在 messages 中的位置
+        self.last_breakdown = breakdown = QueryBreakdown()
+
+        with breakdown.stage("list_tools"):
+            available_tools = await self.get_available_tools()
 
-        # 处理返回的内容
-        content = response.choices[0]
-        if content.finish_reason == "tool_calls":
-            # 如果是需要使用工具，就解析工具
-            tool_call = content.message.tool_calls[0]
-            tool_name = tool_call.function.name
-            tool_args = json.loads(tool_call.function.arguments)
+        for iteration in range(1, self.max_iterations + 1):
+            with breakdown.stage(f"llm#{iteration}"), CLIENT_LLM_SECONDS.time():
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    tools=available_tools
+                )
+            self.memory.record_prompt(messages, response.usage)
 
-            # 执行工具
-            result = await self.session.call_tool(tool_name, tool_args)
-            print(f"\n\n[Calling tool {tool_name} with args {tool_args}]\n\n")
+            # 处理返回的内容
+            content = response.choices[0]
+            if content.finish_reason != "tool_calls" or not content.message.tool_calls:
+                self.memory.commit(messages[turn_start:] + [{"role": "assistant", "content": content.message.content}])
+                return content.message.content
 
-            # 将模型返回的调用哪个工具数据和工具执行完成后的数据都存入messages中
+            # 将模型返回的调用哪些工具数据和所有工具执行完成后的数据都存入messages中
             messages.append(content.message.model_dump())
-            messages.append({
-                "role": "tool",
-                "content": result.content[0].text,
-                "tool_call_id": tool_call.id,
-            })
+            with breakdown.stage(f"tools#{iteration}"):
+                messages.extend(await run_tool_calls(
+                    content.message.tool_calls,
+                    self.call_tool,
+                    concurrency=self.tool_concurrency,
+                    timeout=self.tool_timeout,
+                    known_tools=tool_names(available_tools),
+                ))
 
-            # 将上面的结果再返回给大模型用于生成最终的结果
+        # 达到最大轮数后不再提供工具，让大模型基于已有结果生成最终的结果
+        with breakdown.stage("llm#final"), CLIENT_LLM_SECONDS.time():
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
             )
-            return response.choices[0].message.content
+        self.memory.record_prompt(messages, response.usage)
+        answer = response.choices[0].message.content
+        self.memory.commit(messages[turn_start:] + [{"role": "assistant", "content": answer}])
+        return answer
+
+    async def stream_query(self, query: str) -> AsyncIterator[str]:
+        """
+        流式版本的 process_query：以异步生成器逐个产出最终回答的 token。
+        工具参数一旦拼接完整就开始执行，各次大模型调用的 TTFT 与耗时记录在 self.last_timing 中。
+        """
+        messages = self.memory.build(query)
+        turn_start = len(messages) - 1
+
+        available_tools = await self.get_available_tools()
+        run_tool = make_tool_runner(self.call_tool, self.tool_concurrency, self.tool_timeout, tool_names(available_tools))
+        self.last_timing = timing = StreamTiming()
 
-        return content.message.content
+        for iteration in range(self.max_iterations + 1):
+            turn = StreamedTurn(run_tool, timing)
+            # 达到最大轮数后不再提供工具，让大模型基于已有结果生成最终的结果
+            tools = {"tools": available_tools} if iteration < self.max_iterations else {}
+            self.memory.record_prompt(messages)
+            async for token in turn.stream(self.client, model=self.model, messages=messages, **tools):
+                yield token
+            if not turn.tool_calls:
+                self.memory.commit(messages[turn_start:] + [{"role": "assistant", "content": "".join(turn.content_parts)}])
+                return
+
+            # 将模型返回的调用哪些工具数据和所有工具执行完成后的数据都存入messages中
+            messages.append(turn.assistant_message())
+            messages.extend(await turn.tool_results())
 
     async def chat_loop(self):
         """运行交互式聊天循环"""
         print("\n MCP客户端已启动！输入'quit'退出")
+        self.on_progress = print_progress
         while True:
             try:
                 query = input("\n你: ").strip()
                 if query.lower() == 'quit':
                     break
 
+                if self.stream_output:
+                    print("\n OpenAI: ", end="", flush=True)
+                    async for token in self.stream_query(query):  # 边生成边输出
+                        print(token, end="", flush=True)
+                    print(f"\n{self.last_timing.summary()}")
+                    print(self.memory.report())
+                    continue
+
                 response = await self.process_query(query)  # 发送用户输入到OpenAI API
                 print(f"\n OpenAI: {response}")
+                print(self.last_breakdown.summary())
+                print(self.memory.report())
             except Exception as e:
                 print(f"\n发生错误: {str(e)}")
 
@@ -126,13 +272,18 @@ class MCPClient:
         await self.exit_stack.aclose()
 
 
-async def main():
-    if len(sys.argv) < 2:
-        print("Usage: python client.py <path_to_server_script>")
+async def main(servers: list[str]):
+    specs = servers or [spec for spec in MCP_SERVERS.split(",") if spec.strip()]
+    if not specs:
+        print("Usage: python client.py <path_to_server_script> | [name=]<script_or_url> ...")
         sys.exit(1)
     client = MCPClient()
     try:
-        await client.connect_to_server(sys.argv[1])
+        # 只有一个服务器脚本时保持原来的行为（工具名不加前缀），否则通过路由器连接多个服务器
+        if len(specs) == 1 and "=" not in specs[0] and specs[0].endswith((".py", ".js")):
+            await client.connect_to_server(specs[0])
+        else:
+            await client.connect_to_servers(specs)
         await client.chat_loop()
     finally:
         await client.cleanup()
@@ -140,4 +291,11 @@ async def main():
 
 if __name__ == "__main__":
     import sys
-    asyncio.run(main())
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="天气 MCP stdio 客户端")
+    parser.add_argument("servers", nargs="*", help="服务器脚本路径，或多个 [名称=]脚本/URL，缺省时使用 MCP_SERVERS")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    with profiling.profile("stdio_client", args.profile):
+        asyncio.run(main(args.servers))
\ No newline at end of file
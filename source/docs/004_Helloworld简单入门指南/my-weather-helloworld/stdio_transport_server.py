@@ -1,84 +1,124 @@
 import json
-import httpx
-from typing import Any
-from mcp.server.fastmcp import FastMCP
-import os
+import anyio
 from dotenv import load_dotenv
+from weather_refresh import refresher, weather_lifespan
+from upstream_guard import guard
+from weather_cache import cached_fetch_weather, weather_cache
+from city_index import city_resolver
+from metrics import CALL_TOOL_SECONDS, FORMAT_WEATHER_SECONDS, REGISTRY
+from tool_annotations import AnnotatedFastMCP
+from stdio_pipeline import run_stdio
+import profiling
+from weather_format import format_weather, format_weather_many
+from weather_series import context_progress, forecast_page, history_page
+from mcp.server.fastmcp import Context
 
 # 加载.env文件，确保API Key受到保护
 load_dotenv()
 
-# OpenWeather API 配置
-OPENWEATHER_API_BASE = os.getenv("OPENWEATHER_API_BASE")  
-OPEN_WEATHER_API_KEY = os.getenv("OPEN_WEATHER_API_KEY")  
-USER_AGENT = os.getenv("OPEN_WEATHER_USER_AGENT")  
-
 # 初始化 MCP 服务器
-mcp = FastMCP("WeatherServer")
+# 通过 lifespan 在服务器运行期间刷新热点城市，退出时关闭共享的上游连接池；工具列表附带只读与建议缓存时长的 annotations
+mcp = AnnotatedFastMCP("WeatherServer", lifespan=weather_lifespan)
 
 
-async def fetch_weather(city: str) -> dict[str, Any] | None:
+@mcp.tool()
+async def query_weather(city: str) -> str:
     """
-    从 OpenWeather API 获取天气信息。
-    :param city: 城市名称（需使用英文，如 Beijing）
-    :return: 天气数据字典；若出错返回包含 error 信息的字典
+    输入指定城市的名称，返回今日天气查询结果。
+    :param city: 城市英文名称，可附加国家代码（如 Paris,FR）；常见城市也可以使用中文名
+    :return: 天气信息，格式由 WEATHER_OUTPUT_FORMAT 决定（text / llm / json）
     """
-    params = {
-        "q": city,
-        "appid": OPEN_WEATHER_API_KEY,
-        "units": "metric",
-        "lang": "zh_cn"
-    }
-    headers = {"User-Agent": USER_AGENT}
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(OPENWEATHER_API_BASE, params=params, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()  # 返回字典类型
-        except httpx.HTTPStatusError as e:
-            return {"error": f"HTTP 错误: {e.response.status_code}"}
-        except Exception as e:
-            return {"error": f"请求失败: {str(e)}"}
+    with CALL_TOOL_SECONDS.time(tool="query_weather"):
+        data = await cached_fetch_weather(city)
+        with FORMAT_WEATHER_SECONDS.time():
+            return format_weather(data)
 
 
-def format_weather(data: dict[str, Any] | str) -> str:
-    if isinstance(data, str):
+@mcp.tool()
+async def query_weather_many(cities: list[str]) -> str:
+    """
+    一次查询多个城市的今日天气，城市之间并发查询，重复的城市只查询一次。
+    :param cities: 城市名称列表（写法同 query_weather），也可以直接传入 OpenWeather 城市 ID（纯数字）
+    :return: 每个城市的格式化天气信息，单个城市失败不影响其他城市
+    """
+    # 批量查询只在被调用时才导入，缩短服务器冷启动时间
+    from weather_batch import fetch_weather_many
+
+    with CALL_TOOL_SECONDS.time(tool="query_weather_many"):
         try:
-            data = json.loads(data)
-        except Exception as e:
-            return f"无法解析天气数据: {e}"
-    # 如果数据中包含错误信息，直接返回错误提示
-    if "error" in data:
-        return f"{data['error']}"
-    # 提取数据时做容错处理
-    city = data.get("name", "未知")
-    country = data.get("sys", {}).get("country", "未知")
-    temp = data.get("main", {}).get("temp", "N/A")
-    humidity = data.get("main", {}).get("humidity", "N/A")
-    wind_speed = data.get("wind", {}).get("speed", "N/A")
-    # weather 可能为空列表，因此用 [0] 前先提供默认字典
-    weather_list = data.get("weather", [{}])
-    description = weather_list[0].get("description", "未知")
-    return (
-        f"🌍 {city}, {country}\n"
-        f"🌡 温度: {temp}°C\n"
-        f"💧 湿度: {humidity}%\n"
-        f"🌬 风速: {wind_speed} m/s\n"
-        f"⛅ 天气: {description}\n"
-    )
+            results = await fetch_weather_many(cities)
+        except ValueError as e:
+            return f"⚠ {e}"
+        with FORMAT_WEATHER_SECONDS.time():
+            return format_weather_many(results)
 
 
 @mcp.tool()
-async def query_weather(city: str) -> str:
+async def query_forecast(city: str, days: int = 3, step_hours: int = 24, page: int = 1, ctx: Context = None) -> str:
     """
-    输入指定城市的英文名称，返回今日天气查询结果。
-    :param city: 城市名称（需使用英文）
-    :return: 格式化后的天气信息
+    查询未来几天的天气预报，按当地时间汇总为每天（或每 step_hours 小时）一行的最低、最高、平均气温等。
+    :param city: 城市名称，写法同 query_weather
+    :param days: 预报天数，1~5
+    :param step_hours: 汇总粒度（小时），24 为按天汇总，3 为原始的 3 小时粒度
+    :param page: 页码，结果行数较多时分页返回，结果末尾会提示下一页
+    :return: 预报汇总表，格式由 WEATHER_OUTPUT_FORMAT 决定
     """
-    data = await fetch_weather(city)
-    return format_weather(data)
+    with CALL_TOOL_SECONDS.time(tool="query_forecast"):
+        return await forecast_page(city, days, step_hours, page, on_progress=context_progress(ctx))
+
+
+@mcp.tool()
+async def query_history(city: str, start: str, end: str, step_hours: int = 24, page: int = 1, ctx: Context = None) -> str:
+    """
+    查询一段日期内的历史天气（逐小时数据），按天（或每 step_hours 小时）汇总后分页返回。
+    :param city: 城市名称，写法同 query_weather
+    :param start: 开始日期，格式 YYYY-MM-DD（UTC）
+    :param end: 结束日期（含当天），格式 YYYY-MM-DD，最多查询 WEATHER_HISTORY_MAX_DAYS 天
+    :param step_hours: 汇总粒度（小时），24 为按天汇总
+    :param page: 页码，结果末尾会提示下一页
+    :return: 历史天气汇总表；范围较长时按周分段请求，每完成一段发送一次进度通知
+    """
+    with CALL_TOOL_SECONDS.time(tool="query_history"):
+        return await history_page(city, start, end, step_hours, page, on_progress=context_progress(ctx))
+
+
+@mcp.resource("weather://cache/stats")
+def cache_stats() -> str:
+    """天气缓存的命中、未命中、合并与淘汰计数，用于评估缓存容量"""
+    return json.dumps(weather_cache.stats())
+
+
+@mcp.resource("weather://upstream/stats")
+def upstream_stats() -> str:
+    """上游限流器、熔断器与重试预算的状态，熔断打开时 circuit_breaker.state 为 open"""
+    return json.dumps(guard.stats())
+
+
+@mcp.resource("weather://refresh/stats")
+def refresh_stats() -> str:
+    """热点城市（按衰减后的请求次数排列）及其剩余 TTL，以及提前刷新的次数、失败数与每分钟预算"""
+    return json.dumps(refresher.stats())
+
+
+@mcp.resource("weather://cities/stats")
+def city_stats() -> str:
+    """城市索引的城市数、别名数，以及按匹配方式（ID、别名、精确、模糊、同名、未识别）统计的解析次数"""
+    return json.dumps(city_resolver().stats())
+
+
+@mcp.resource("weather://metrics", mime_type="text/plain")
+def metrics() -> str:
+    """Prometheus 文本格式的延迟直方图与计数器，与 HTTP 服务器的 /metrics 内容一致"""
+    return REGISTRY.render()
 
 
 if __name__ == "__main__":
-    # 以标准 I/O 方式运行 MCP 服务器
-    mcp.run(transport='stdio')
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="天气 MCP stdio 服务器")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    # 以标准 I/O 方式运行 MCP 服务器；默认使用批量读写的 stdio 传输，MCP_STDIO_PIPELINE=0 时使用 mcp 自带的传输
+    # 性能分析结果写入文件，汇总打印到 stderr，不会混入 stdout 上的 JSON-RPC 消息
+    with profiling.profile("stdio_server", args.profile):
+        anyio.run(run_stdio, mcp)
\ No newline at end of file
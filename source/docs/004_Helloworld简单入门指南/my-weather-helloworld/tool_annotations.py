@@ -0,0 +1,35 @@
+from typing import Any
+from mcp import types
+from mcp.server.fastmcp import FastMCP
+from weather_cache import CACHE_TTL
+from weather_series import SERIES_CACHE_TTL
+
+# mcp>=1.7 提供 ToolAnnotations；1.6 的 Tool 允许额外字段，直接使用字典
+ToolAnnotations = getattr(types, "ToolAnnotations", None)
+
+# 天气工具都是只读查询。cacheTtl 是本项目的扩展字段：建议客户端缓存工具结果的秒数，与服务器缓存的 TTL 一致。
+# 客户端缓存叠加在服务器缓存之上，服务器返回的结果本身可能已缓存了接近一个 TTL，因此客户端看到的数据最多约为 2 × TTL 之前的
+
+WEATHER_TOOL_ANNOTATIONS: dict[str, dict[str, Any]] = {
+    "query_weather": {"readOnlyHint": True, "openWorldHint": True, "cacheTtl": CACHE_TTL},
+    "query_weather_many": {"readOnlyHint": True, "openWorldHint": True, "cacheTtl": CACHE_TTL},
+    "query_forecast": {"readOnlyHint": True, "openWorldHint": True, "cacheTtl": SERIES_CACHE_TTL},
+    "query_history": {"readOnlyHint": True, "openWorldHint": True, "cacheTtl": SERIES_CACHE_TTL},
+}
+
+
+class AnnotatedFastMCP(FastMCP):
+    """在 tools/list 的结果中为工具附加 annotations，客户端据此决定是否缓存以及缓存多久"""
+
+    def __init__(self, name: str, tool_annotations: dict[str, dict[str, Any]] = WEATHER_TOOL_ANNOTATIONS, **settings):
+        super().__init__(name, **settings)
+        self.tool_annotations = tool_annotations
+
+    async def list_tools(self) -> list[types.Tool]:
+        tools = await super().list_tools()
+        for tool in tools:
+            hints = self.tool_annotations.get(tool.name)
+            if hints:
+                tool.annotations = ToolAnnotations(**hints) if ToolAnnotations else dict(hints)
+        return tools
+
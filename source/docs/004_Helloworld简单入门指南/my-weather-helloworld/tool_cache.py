@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from dotenv import load_dotenv
+from weather_format import ERROR_MARK
+
+# 加载.env文件
+load_dotenv()
+
+# 客户端工具结果缓存配置
+TOOL_RESULT_CACHE = os.getenv("MCP_TOOL_RESULT_CACHE", "1").lower() in ("1", "true", "yes")  # 总开关
+TOOL_RESULT_CACHE_SIZE = int(os.getenv("MCP_TOOL_RESULT_CACHE_SIZE", "512"))  # LRU 最大条目数
+# 服务器没有在 annotations 中声明 cacheTtl 的工具使用的 TTL，默认 0 表示不缓存
+TOOL_RESULT_DEFAULT_TTL = float(os.getenv("MCP_TOOL_RESULT_DEFAULT_TTL", "0"))
+
+ToolKey = tuple[str, str]
+
+
+def canonical_args(tool_args: dict[str, Any] | None) -> str:
+    """键排序、无多余空白的 JSON，使 {"city": "Beijing"} 与 { "city":"Beijing" } 得到同一个缓存键"""
+    return json.dumps(tool_args or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def annotations_dict(tool: Any) -> dict[str, Any]:
+    """读取工具的 annotations（ToolAnnotations 对象、字典或不存在）为普通字典"""
+    annotations = tool.get("annotations") if isinstance(tool, dict) else getattr(tool, "annotations", None)
+    if annotations is None:
+        return {}
+    if hasattr(annotations, "model_dump"):
+        return annotations.model_dump(exclude_none=True)
+    return dict(annotations)
+
+
+class ToolResultCache:
+    """
+    客户端的工具结果缓存：键为 (tool_name, 规范化的参数 JSON)，TTL 取自服务器在工具 annotations 中声明的 cacheTtl。
+    同一个键的并发调用只向服务器发起一次请求（single-flight）。
+    """
+
+    def __init__(
+        self,
+        max_size: int = TOOL_RESULT_CACHE_SIZE,
+        default_ttl: float = TOOL_RESULT_DEFAULT_TTL,
+        enabled: bool = TOOL_RESULT_CACHE,
+    ):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self.ttls: dict[str, float] = {}
+        self._entries: OrderedDict[ToolKey, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[ToolKey, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def configure(self, tools: list[Any]):
+        """根据 list_tools 的结果设置各工具的 TTL；只读提示为 False 的工具不缓存"""
+        self.ttls = {}
+        for tool in tools:
+            name = tool.get("name") if isinstance(tool, dict) else tool.name
+            annotations = annotations_dict(tool)
+            if annotations.get("readOnlyHint") is False:
+                continue
+            ttl = annotations.get("cacheTtl")
+            if ttl is not None:
+                self.ttls[name] = float(ttl)
+
+    def ttl_for(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    def get(self, key: ToolKey) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: ToolKey, result: str, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_call(
+        self,
+        tool_name: str,
+        tool_args: dict[str, Any] | None,
+        call: Callable[[], Awaitable[str]],
+        bypass: bool = False,
+    ) -> str:
+        """
+        :param call: 实际调用服务器的协程函数；抛出异常时结果不缓存
+        :param bypass: 为 True 时跳过缓存直接调用，并用新结果刷新缓存
+        """
+        ttl = self.ttl_for(tool_name)
+        if not self.enabled or ttl <= 0:
+            return await call()
+        key = (tool_name, canonical_args(tool_args))
+        if not bypass:
+            result = self.get(key)
+            if result is not None:
+                self.hits += 1
+                return result
+            task = self._inflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+                return await asyncio.shield(task)
+        self.misses += 1
+        task = asyncio.ensure_future(self._load(key, call, ttl))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        return await asyncio.shield(task)
+
+    async def _load(self, key: ToolKey, call: Callable[[], Awaitable[str]], ttl: float) -> str:
+        result = await call()
+        if isinstance(result, str) and ERROR_MARK not in result:
+            self.set(key, result, ttl)
+        return result
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "ttls": dict(self.ttls),
+        }
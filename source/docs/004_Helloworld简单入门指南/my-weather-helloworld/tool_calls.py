@@ -0,0 +1,81 @@
+import os
+import json
+import asyncio
+from typing import Any, Awaitable, Callable, Collection, Optional
+from dotenv import load_dotenv
+from metrics import CLIENT_CALL_TOOL_SECONDS
+
+# 加载.env文件
+load_dotenv()
+
+# 工具调用配置
+TOOL_CONCURRENCY = int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))  # 同一轮中同时执行的工具调用数上限
+TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "30"))  # 单个工具调用超时（秒）
+MAX_ITERATIONS = int(os.getenv("MCP_MAX_ITERATIONS", "5"))  # process_query 中最多的工具调用轮数
+
+
+def print_progress(tool_name: str, progress: float, total: Optional[float]):
+    """chat_loop 中使用的工具进度回调，例如按周分段请求历史数据时显示已完成的段数"""
+    print(f"\n⏳ {tool_name}: {progress:g}/{total:g}" if total else f"\n⏳ {tool_name}: {progress:g}")
+
+
+def tool_names(available_tools: list[dict]) -> frozenset[str]:
+    """OpenAI 工具格式列表中的工具名，用作指标的 tool 标签白名单"""
+    return frozenset(tool["function"]["name"] for tool in available_tools)
+
+
+def make_tool_runner(
+    call_tool: Callable[[str, dict], Awaitable[str]],
+    concurrency: int = TOOL_CONCURRENCY,
+    timeout: float = TOOL_TIMEOUT,
+    known_tools: Collection[str] = (),
+) -> Callable[[Any], Awaitable[dict[str, Any]]]:
+    """
+    构造执行单个 tool_call 的协程函数，同一个 runner 执行的所有工具调用共享并发上限。
+    :param call_tool: 执行单个工具并返回文本结果的协程函数
+    :param known_tools: 服务器提供的工具名；模型给出的其他名称在指标中记为 "unknown"，避免标签基数无限增长
+    :return: 接收 tool_call、返回 role=tool 消息的协程函数；工具失败或超时时，错误信息作为结果返回给模型
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run_one(tool_call) -> dict[str, Any]:
+        tool_name = tool_call.function.name
+        try:
+            tool_args = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            content = f"工具参数不是合法的 JSON: {e}"
+        else:
+            print(f"\n\n[Calling tool {tool_name} with args {tool_args}]\n\n")
+            async with semaphore:
+                try:
+                    # 在信号量内计时，只统计工具本身的耗时，不含排队等待
+                    with CLIENT_CALL_TOOL_SECONDS.time(tool=tool_name if tool_name in known_tools else "unknown"):
+                        content = await asyncio.wait_for(call_tool(tool_name, tool_args), timeout)
+                except asyncio.TimeoutError:
+                    content = f"调用工具 {tool_name} 超时（{timeout}s）"
+                except Exception as e:
+                    content = f"调用工具 {tool_name} 出错: {str(e)}"
+        return {
+            "role": "tool",
+            "content": content,
+            "tool_call_id": tool_call.id,
+        }
+
+    return run_one
+
+
+async def run_tool_calls(
+    tool_calls: list[Any],
+    call_tool: Callable[[str, dict], Awaitable[str]],
+    concurrency: int = TOOL_CONCURRENCY,
+    timeout: float = TOOL_TIMEOUT,
+    known_tools: Collection[str] = (),
+) -> list[dict[str, Any]]:
+    """
+    并发执行模型在一次回复中给出的全部 tool_calls。
+    :param tool_calls: content.message.tool_calls
+    :param call_tool: 执行单个工具并返回文本结果的协程函数
+    :return: 与 tool_calls 顺序一致的 role=tool 消息列表；单个工具失败或超时时，错误信息作为该工具的结果返回给模型
+    """
+    run_one = make_tool_runner(call_tool, concurrency, timeout, known_tools)
+    return list(await asyncio.gather(*(run_one(tool_call) for tool_call in tool_calls)))
@@ -0,0 +1,209 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Iterable
+from dotenv import load_dotenv
+from metrics import REGISTRY
+
+# 加载.env文件
+load_dotenv()
+
+# 限流配置：设置为 OpenWeather 套餐的调用配额（免费套餐为 60 次/分钟），0 表示不限流
+RATE_PER_MINUTE = float(os.getenv("OPENWEATHER_RATE_PER_MINUTE", "0"))
+RATE_BURST = int(os.getenv("OPENWEATHER_RATE_BURST", "10"))  # 允许的突发请求数
+RATE_MAX_WAIT = float(os.getenv("OPENWEATHER_RATE_MAX_WAIT", "2"))  # 等待令牌的最长秒数，超过则快速失败
+# HTTP 服务器的 worker 进程数（由 --workers 传给各 worker）；限流状态按进程保存，配额与突发数按进程数平分
+WORKERS = max(int(os.getenv("WEATHER_WORKERS", "1")), 1)
+
+# 熔断配置
+CB_ERROR_RATE = float(os.getenv("OPENWEATHER_CB_ERROR_RATE", "0.5"))  # 窗口内错误率达到该值时熔断
+CB_MIN_CALLS = int(os.getenv("OPENWEATHER_CB_MIN_CALLS", "20"))  # 窗口内至少有这么多次调用才计算错误率
+CB_WINDOW = float(os.getenv("OPENWEATHER_CB_WINDOW", "30"))  # 统计窗口（秒）
+CB_COOLDOWN = float(os.getenv("OPENWEATHER_CB_COOLDOWN", "15"))  # 熔断后多少秒放行一次探测请求
+
+# 重试配置
+RETRY_MAX = int(os.getenv("OPENWEATHER_RETRY_MAX", "2"))  # 单个请求最多重试次数
+RETRY_BASE_DELAY = float(os.getenv("OPENWEATHER_RETRY_BASE_DELAY", "0.2"))  # 指数退避的基础间隔（秒）
+RETRY_BUDGET_RATIO = float(os.getenv("OPENWEATHER_RETRY_BUDGET_RATIO", "0.2"))  # 每个请求为重试预算增加的额度
+RETRY_BUDGET_MIN = float(os.getenv("OPENWEATHER_RETRY_BUDGET_MIN", "10"))  # 重试预算的上限与初始额度
+
+
+class UpstreamUnavailable(Exception):
+    """限流或熔断导致请求未发出，调用方应快速失败（或使用过期缓存）"""
+
+
+class TokenBucket:
+    """令牌桶限流器：以固定速率补充令牌，桶容量即允许的突发请求数"""
+
+    def __init__(self, rate_per_minute: float = RATE_PER_MINUTE, burst: int = RATE_BURST, max_wait: float = RATE_MAX_WAIT,
+                 workers: int = WORKERS):
+        self.workers = workers
+        self.rate = rate_per_minute / 60.0 / workers
+        self.capacity = max(burst // workers, 1)
+        self.max_wait = max_wait
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.waited = 0
+        self.rejected = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> bool:
+        """取得一个令牌；需要等待超过 max_wait 时返回 False"""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        wait = (1 - self.tokens) / self.rate
+        if wait > self.max_wait:
+            self.rejected += 1
+            return False
+        # 先预留令牌再等待，保证并发等待者按顺序排队而不会超发
+        self.tokens -= 1
+        self.waited += 1
+        await asyncio.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """
+    基于滑动窗口错误率的熔断器：closed → open（快速失败）→ 冷却后 half_open 放行一次探测 → closed/open。
+    """
+
+    def __init__(
+        self,
+        error_rate: float = CB_ERROR_RATE,
+        min_calls: int = CB_MIN_CALLS,
+        window: float = CB_WINDOW,
+        cooldown: float = CB_COOLDOWN,
+    ):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        if self.state == "open":
+            # 熔断前已发出的请求陆续返回，不再重复计入
+            return
+        if self.state == "half_open":
+            self._probing = False
+            if ok:
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._trip(now)
+            return
+        self._outcomes.append((now, ok))
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+        failures = sum(1 for _, success in self._outcomes if not success)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+            self._trip(now)
+
+    def abandon(self):
+        """请求没有结果就结束时（被取消、超出配额、非上游故障的异常）调用，允许 half_open 状态放行下一次探测"""
+        if self.state == "half_open":
+            self._probing = False
+
+    def _trip(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self.trips += 1
+        self._outcomes.clear()
+
+
+class RetryBudget:
+    """全局重试预算：每个请求存入 ratio 额度，每次重试消耗 1，防止上游故障时重试放大流量"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.denied += 1
+        return False
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY) -> float:
+    """带完全抖动的指数退避：在 [0, base * 2^attempt] 内随机取值"""
+    return random.uniform(0, base * (2 ** attempt))
+
+
+class UpstreamGuard:
+    """组合限流器、熔断器与重试预算，保护对 OpenWeather 的调用"""
+
+    def __init__(self):
+        self.limiter = TokenBucket()
+        self.breaker = CircuitBreaker()
+        self.retry_budget = RetryBudget()
+        self.max_retries = RETRY_MAX
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rate_limiter": {
+                "rate_per_minute": round(self.limiter.rate * 60, 2),
+                "tokens": round(self.limiter.tokens, 2),
+                "waited": self.limiter.waited,
+                "rejected": self.limiter.rejected,
+            },
+            "circuit_breaker": {
+                "state": self.breaker.state,
+                "trips": self.breaker.trips,
+                "rejected": self.breaker.rejected,
+            },
+            "retry_budget": {
+                "tokens": round(self.retry_budget.tokens, 2),
+                "retries": self.retry_budget.retries,
+                "denied": self.retry_budget.denied,
+            },
+        }
+
+    def metrics(self) -> Iterable[tuple[str, str, str, float, dict[str, str]]]:
+        """供 /metrics 渲染的限流、熔断与重试计数"""
+        yield "weather_upstream_rate_limited_total", "counter", "因超出调用配额被拒绝的请求数", self.limiter.rejected, {}
+        yield "weather_upstream_breaker_open", "gauge", "熔断器是否处于打开状态", float(self.breaker.state == "open"), {}
+        yield "weather_upstream_breaker_trips_total", "counter", "熔断次数", self.breaker.trips, {}
+        yield "weather_upstream_breaker_rejected_total", "counter", "熔断期间被拒绝的请求数", self.breaker.rejected, {}
+        yield "weather_upstream_retries_total", "counter", "上游请求重试次数", self.retry_budget.retries, {}
+
+
+guard = UpstreamGuard()
+REGISTRY.add_collector(guard.metrics)
@@ -0,0 +1,82 @@
+import os
+import asyncio
+from typing import Any
+from dotenv import load_dotenv
+from weather_upstream import GROUP_MAX_IDS, fetch_weather_group
+from weather_cache import CacheKey, cached_fetch_weather, normalize_key, weather_cache
+from city_index import resolve_city
+
+# 加载.env文件
+load_dotenv()
+
+# 批量查询配置
+BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "8"))  # 单次批量查询的最大并发上游请求数
+BATCH_MAX_CITIES = int(os.getenv("WEATHER_BATCH_MAX_CITIES", "50"))  # 单次批量查询允许的最大城市数
+
+
+def dedupe_cities(cities: list[str]) -> list[str]:
+    """按归一化后的城市名去重，保留首次出现的写法与顺序"""
+    seen = set()
+    unique = []
+    for city in cities:
+        key = normalize_key(city)
+        if key[0] and key not in seen:
+            seen.add(key)
+            unique.append(city)
+    return unique
+
+
+async def _fetch_ids(city_ids: list[int], units: str, lang: str) -> dict[int, dict[str, Any]]:
+    """通过缓存批量查询城市 ID，未命中的按 group 接口分块请求"""
+    keys = {city_id: normalize_key(str(city_id), units, lang) for city_id in city_ids}
+
+    async def fetch_group(missing: list[CacheKey]) -> dict[CacheKey, dict[str, Any]]:
+        ids = [int(key[0]) for key in missing]
+        chunks = [ids[i:i + GROUP_MAX_IDS] for i in range(0, len(ids), GROUP_MAX_IDS)]
+        fetched = {}
+        for chunk in await asyncio.gather(*(fetch_weather_group(chunk, units=units, lang=lang) for chunk in chunks)):
+            fetched.update(chunk)
+        return {normalize_key(str(city_id), units, lang): data for city_id, data in fetched.items()}
+
+    found = await weather_cache.get_or_fetch_many(list(keys.values()), fetch_group)
+    return {city_id: found[key] for city_id, key in keys.items()}
+
+
+async def fetch_weather_many(
+    cities: list[str],
+    units: str = "metric",
+    lang: str = "zh_cn",
+    concurrency: int = BATCH_CONCURRENCY,
+) -> dict[str, dict[str, Any]]:
+    """
+    并发获取多个城市的天气，复用共享连接池与缓存。
+    纯数字的条目以及能通过城市索引解析出唯一 ID 的名称，合并走 group 接口以减少上游请求数。
+    :param cities: 城市名称或城市 ID 列表，重复项只查询一次
+    :return: 城市到天气数据字典的映射（保持输入顺序）；单个城市失败时对应包含 error 信息的字典
+    """
+    unique = dedupe_cities(cities)
+    if len(unique) > BATCH_MAX_CITIES:
+        raise ValueError(f"一次最多查询 {BATCH_MAX_CITIES} 个城市，当前为 {len(unique)} 个")
+
+    resolved = {}
+    for city in unique:
+        match = resolve_city(city)
+        resolved[city] = match.city_id if match is not None else None
+    # "北京" 与 "Beijing" 解析到同一个 ID 时只请求一次
+    city_ids = list(dict.fromkeys(city_id for city_id in resolved.values() if city_id is not None))
+    names = [city for city in unique if resolved[city] is None]
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def fetch_one(city: str) -> dict[str, Any]:
+        async with semaphore:
+            return await cached_fetch_weather(city, units=units, lang=lang)
+
+    by_id, by_name = await asyncio.gather(
+        _fetch_ids(city_ids, units, lang),
+        asyncio.gather(*(fetch_one(city) for city in names)),
+    )
+    by_name = dict(zip(names, by_name))
+    return {
+        city: by_id[resolved[city]] if resolved[city] is not None else by_name[city]
+        for city in unique
+    }
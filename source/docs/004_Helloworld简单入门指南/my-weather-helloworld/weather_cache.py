@@ -0,0 +1,397 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable
+from dotenv import load_dotenv
+from weather_upstream import fetch_weather
+from metrics import REGISTRY
+from city_index import resolve_city
+
+if TYPE_CHECKING:
+    from shared_cache import SQLiteWeatherStore
+
+# 加载.env文件
+load_dotenv()
+
+# 缓存配置
+CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "300"))  # 正常结果缓存秒数
+CACHE_ERROR_TTL = float(os.getenv("WEATHER_CACHE_ERROR_TTL", "30"))  # {"error": ...} 结果缓存秒数
+CACHE_MAX_SIZE = int(os.getenv("WEATHER_CACHE_MAX_SIZE", "1024"))  # LRU 最大条目数
+# 过期后仍保留多少秒，上游暂时不可用（熔断、限流、超时、5xx）时返回这些过期数据
+CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", "3600"))
+# 多进程部署时共享的 SQLite 缓存文件，未设置时只使用进程内缓存
+SHARED_CACHE_PATH = os.getenv("WEATHER_SHARED_CACHE")
+SHARED_CACHE_POLL_INTERVAL = 0.05  # 其他进程正在请求同一城市时，轮询共享缓存的间隔（秒）
+
+CacheKey = tuple[str, str, str]
+
+
+def normalize_key(city: str, units: str = "metric", lang: str = "zh_cn") -> CacheKey:
+    """把 " new  york " 与 "New York" 归一化成同一个缓存键"""
+    return " ".join(city.split()).casefold(), units.lower(), lang.lower()
+
+
+class WeatherCache:
+    """
+    进程内天气缓存：TTL 过期 + LRU 淘汰 + 错误结果短 TTL 缓存，
+    并对同一个键的并发未命中做合并（single-flight），只发起一次上游请求。
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL,
+        error_ttl: float = CACHE_ERROR_TTL,
+        max_size: int = CACHE_MAX_SIZE,
+        shared: "SQLiteWeatherStore | None" = None,
+        stale_ttl: float = CACHE_STALE_TTL,
+    ):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        # 可选的跨进程共享缓存，作为进程内缓存之后、上游之前的第二级
+        self.shared = shared
+        # key -> (过期时间, 数据)，按最近使用顺序排列
+        self._entries: OrderedDict[CacheKey, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._inflight: dict[CacheKey, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self.stale_served = 0
+        self.refreshes = 0
+        # 可选的访问记录器（weather_refresh.HotKeyTracker），用于统计热点城市
+        self.tracker = None
+
+    def get(self, key: CacheKey) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        now = time.monotonic()
+        if expires_at <= now:
+            # 过期的正常结果在 stale_ttl 内保留，供上游不可用时兜底；过期条目只在删除或被替换时计入 expirations
+            if "error" in data or expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+                self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return data
+
+    def expires_in(self, key: CacheKey) -> float | None:
+        """正常结果距过期的秒数（已过期但仍可兜底时为负数）；没有缓存或为错误结果时返回 None"""
+        entry = self._entries.get(key)
+        if entry is None or "error" in entry[1]:
+            return None
+        return entry[0] - time.monotonic()
+
+    def get_stale(self, key: CacheKey) -> dict[str, Any] | None:
+        """返回已过期但仍在 stale_ttl 内的正常结果"""
+        entry = self._entries.get(key)
+        if entry is None or "error" in entry[1] or entry[0] + self.stale_ttl <= time.monotonic():
+            return None
+        return entry[1]
+
+    def _stale_fallback(self, key: CacheKey, data: dict[str, Any]) -> dict[str, Any] | None:
+        """上游暂时不可用时，用过期数据代替错误结果"""
+        if "error" in data and data.get("transient"):
+            stale = self.get_stale(key)
+            if stale is not None:
+                self.stale_served += 1
+                return stale
+        return None
+
+    def ttl_for(self, data: dict[str, Any]) -> float:
+        return self.error_ttl if "error" in data else self.ttl
+
+    def set(self, key: CacheKey, data: dict[str, Any], ttl: float | None = None) -> None:
+        if ttl is None:
+            ttl = self.ttl_for(data)
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        previous = self._entries.get(key)
+        if previous is not None and previous[0] <= now:
+            self.expirations += 1
+        self._entries[key] = (now + ttl, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            _, (expires_at, _) = self._entries.popitem(last=False)
+            # 已过期的条目被挤出算作过期，只有仍然有效的条目被挤出才说明容量不足
+            if expires_at <= now:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+    def record_access(self, key: CacheKey) -> None:
+        if self.tracker is not None:
+            self.tracker.record(key)
+
+    async def get_or_fetch(self, key: CacheKey, fetcher: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        self.record_access(key)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # 上游请求放在独立任务中，某个调用方被取消不会影响其他等待者
+            task = asyncio.ensure_future(self._load(key, fetcher))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: CacheKey, fetcher: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        """进程内缓存未命中时：先查共享缓存，再请求上游，并把结果写回两级缓存"""
+        if self.shared is None:
+            data = await fetcher()
+            stale = self._stale_fallback(key, data)
+            if stale is not None:
+                return stale
+            self.set(key, data)
+            return data
+
+        deadline = time.monotonic() + self.shared.lease_ttl
+        while True:
+            found = await asyncio.to_thread(self.shared.get, key)
+            if found is not None:
+                self.shared_hits += 1
+                data, remaining = found
+                self.set(key, data, min(remaining, self.ttl_for(data)))
+                return data
+            # 拿到租约的进程负责请求上游；其他进程在租约有效期内等待其写入共享缓存
+            if await asyncio.to_thread(self.shared.acquire_lease, key) or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+
+        try:
+            data = await fetcher()
+            stale = self._stale_fallback(key, data)
+            if stale is not None:
+                return stale
+            ttl = self.ttl_for(data)
+            if ttl > 0:
+                await asyncio.to_thread(self.shared.set, key, data, ttl)
+            self.set(key, data, ttl)
+            return data
+        finally:
+            await asyncio.to_thread(self.shared.release_lease, key)
+
+    async def get_or_fetch_many(
+        self,
+        keys: list[CacheKey],
+        fetcher: Callable[[list[CacheKey]], Awaitable[dict[CacheKey, dict[str, Any]]]],
+    ) -> dict[CacheKey, dict[str, Any]]:
+        """
+        批量版 get_or_fetch：命中的键直接返回，已有请求在进行的键合并等待，其余的键交给 fetcher 一次请求。
+        未命中的键各自登记在 _inflight 中，同时到达的单个查询会合并到这次批量请求上；
+        共享缓存、租约与过期数据兜底的处理与 _load 相同。
+        :param fetcher: 接收未命中的键列表，返回每个键对应的天气数据（失败时为包含 error 信息的字典）
+        """
+        results: dict[CacheKey, dict[str, Any]] = {}
+        waiting: dict[CacheKey, asyncio.Future] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            self.record_access(key)
+            data = self.get(key)
+            if data is not None:
+                self.hits += 1
+                results[key] = data
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[key] = self._inflight[key]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing:
+            batch = asyncio.ensure_future(self._load_many(missing, fetcher))
+            for key in missing:
+                task = asyncio.ensure_future(self._pick(batch, key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, key=key: self._inflight.pop(key, None))
+                waiting[key] = task
+        if waiting:
+            loaded = await asyncio.gather(*(asyncio.shield(task) for task in waiting.values()))
+            results.update(zip(waiting, loaded))
+        return results
+
+    @staticmethod
+    async def _pick(batch: asyncio.Future, key: CacheKey) -> dict[str, Any]:
+        return (await batch)[key]
+
+    async def _load_many(
+        self,
+        keys: list[CacheKey],
+        fetcher: Callable[[list[CacheKey]], Awaitable[dict[CacheKey, dict[str, Any]]]],
+    ) -> dict[CacheKey, dict[str, Any]]:
+        """批量版 _load：先查共享缓存并取得租约，其他进程正在请求的键等待其写入，剩下的键一次请求上游"""
+        results: dict[CacheKey, dict[str, Any]] = {}
+        leased = list(keys) if self.shared is None else []
+        pending = [] if self.shared is None else list(keys)
+        deadline = time.monotonic() + (self.shared.lease_ttl if self.shared is not None else 0)
+        while pending:
+            found, acquired, busy = await asyncio.to_thread(self.shared.get_or_lease_many, pending)
+            for key, (data, remaining) in found.items():
+                self.shared_hits += 1
+                self.set(key, data, min(remaining, self.ttl_for(data)))
+                results[key] = data
+            leased.extend(acquired)
+            if busy and time.monotonic() >= deadline:
+                leased.extend(busy)
+                break
+            pending = busy
+            if pending:
+                await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+        if not leased:
+            return results
+
+        try:
+            fetched = await fetcher(leased)
+            shared_writes = []
+            for key in leased:
+                data = fetched[key]
+                stale = self._stale_fallback(key, data)
+                if stale is not None:
+                    results[key] = stale
+                    continue
+                ttl = self.ttl_for(data)
+                if ttl > 0:
+                    shared_writes.append((key, data, ttl))
+                self.set(key, data, ttl)
+                results[key] = data
+            if self.shared is not None and shared_writes:
+                await asyncio.to_thread(self.shared.set_many, shared_writes)
+            return results
+        finally:
+            if self.shared is not None:
+                await asyncio.to_thread(self.shared.release_leases, leased)
+
+    async def refresh(self, key: CacheKey, fetcher: Callable[[], Awaitable[dict[str, Any]]]) -> bool | None:
+        """
+        在条目过期前重新请求上游并替换缓存（refresh-ahead），刷新期间请求仍使用旧数据。
+        同一个键已有请求在进行时不重复发起；上游返回错误时保留旧数据。
+        使用共享缓存时，其他进程已刷新的条目直接复制到本进程，其他进程正在刷新的键跳过，每个键只有一个进程请求上游。
+        :return: 是否刷新成功；没有发起刷新（已有请求在进行或其他进程正在刷新）时返回 None
+        """
+        if key in self._inflight:
+            return None
+        previous = self._entries.get(key)
+        task = asyncio.ensure_future(self._refresh(key, fetcher))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        data = await asyncio.shield(task)
+        if "error" in data:
+            return False
+        return True if self._entries.get(key) is not previous else None
+
+    async def _refresh(self, key: CacheKey, fetcher: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        if self.shared is None:
+            return await self._refresh_from_upstream(key, fetcher)
+
+        found = await asyncio.to_thread(self.shared.get, key)
+        local = self.expires_in(key)
+        if found is not None and (local is None or found[1] > local + 1):
+            # 其他进程已经刷新过
+            data, remaining = found
+            self.shared_hits += 1
+            self.set(key, data, min(remaining, self.ttl_for(data)))
+            return data
+        if not await asyncio.to_thread(self.shared.acquire_lease, key):
+            # 其他进程正在刷新（或请求）这个键，本进程继续使用现有条目，下次扫描时从共享缓存取得结果
+            entry = self._entries.get(key)
+            if entry is not None and "error" not in entry[1]:
+                return entry[1]
+            return await self._load(key, fetcher)
+        try:
+            return await self._refresh_from_upstream(key, fetcher)
+        finally:
+            await asyncio.to_thread(self.shared.release_lease, key)
+
+    async def _refresh_from_upstream(self, key: CacheKey, fetcher: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        data = await fetcher()
+        if "error" in data:
+            # 合并进来的等待者拿到旧数据而不是错误
+            return self.get_stale(key) or data
+        self.set(key, data)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, data, self.ttl)
+        self.refreshes += 1
+        return data
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_hits": self.shared_hits,
+            "stale_served": self.stale_served,
+            "refreshes": self.refreshes,
+            "inflight": len(self._inflight),
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def metrics(self) -> Iterable[tuple[str, str, str, float, dict[str, str]]]:
+        """供 /metrics 渲染的计数器与当前条目数"""
+        for result, count in (
+            ("hit", self.hits),
+            ("miss", self.misses),
+            ("coalesced", self.coalesced),
+            ("shared_hit", self.shared_hits),
+            ("stale", self.stale_served),
+        ):
+            yield "weather_cache_lookups_total", "counter", "天气缓存查询次数（按结果分类）", count, {"result": result}
+        yield "weather_cache_evictions_total", "counter", "LRU 淘汰条目数", self.evictions, {}
+        yield "weather_cache_entries", "gauge", "进程内缓存条目数", len(self._entries), {}
+
+
+def _shared_store() -> "SQLiteWeatherStore | None":
+    """只在配置了共享缓存时才导入 sqlite3，单进程的 stdio 服务器启动时不需要它"""
+    if not SHARED_CACHE_PATH:
+        return None
+    from shared_cache import SQLiteWeatherStore
+    return SQLiteWeatherStore(SHARED_CACHE_PATH)
+
+
+# 进程级单例，query_weather 通过它访问上游
+weather_cache = WeatherCache(shared=_shared_store())
+REGISTRY.add_collector(weather_cache.metrics)
+
+
+def key_fetcher(key: CacheKey) -> Callable[[], Awaitable[dict[str, Any]]]:
+    """由缓存键还原上游请求：纯数字的键（城市索引解析出的 ID）按 ID 查询，其余按归一化后的名称查询"""
+    city, units, lang = key
+    city_id = int(city) if city.isdigit() else None
+    return lambda: fetch_weather(city, units=units, lang=lang, city_id=city_id)
+
+
+async def cached_fetch_weather(city: str, units: str = "metric", lang: str = "zh_cn") -> dict[str, Any]:
+    """
+    带缓存的 fetch_weather。城市名先经过城市索引解析：能确定城市 ID 时按 ID 查询并以 ID 作为缓存键，
+    使 "北京"、"beijing"、"Bejing" 共用同一条缓存；否则按（纠正后的）名称查询。
+    :param city: 城市名称（英文、常见城市的中文名或 OpenWeather 城市 ID）
+    :return: 天气数据字典；若出错返回包含 error 信息的字典
+    """
+    match = resolve_city(city)
+    if match is not None and match.city_id is not None:
+        key = normalize_key(str(match.city_id), units, lang)
+        return await weather_cache.get_or_fetch(key, lambda: fetch_weather(city, units=units, lang=lang, city_id=match.city_id))
+    if match is not None:
+        city = match.query
+    key = normalize_key(city, units, lang)
+    return await weather_cache.get_or_fetch(key, lambda: fetch_weather(city, units=units, lang=lang))
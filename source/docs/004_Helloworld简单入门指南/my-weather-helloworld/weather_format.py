@@ -0,0 +1,120 @@
+import os
+from dataclasses import dataclass
+from typing import Any
+from dotenv import load_dotenv
+import fast_json
+
+# 加载.env文件
+load_dotenv()
+
+# 工具结果的输出格式：
+#   text —— 带 emoji 的多行文本（默认，与原来的输出一致）
+#   llm  —— 单行紧凑文本，尽量减少返回给大模型的 token
+#   json —— WeatherReport 字段组成的紧凑 JSON（结构化结果）
+OUTPUT_FORMAT = os.getenv("WEATHER_OUTPUT_FORMAT", "text").lower()
+OUTPUT_FORMATS = ("text", "llm", "json")
+# 错误结果以该符号开头，客户端的工具结果缓存据此跳过错误
+ERROR_MARK = "⚠"
+_EMPTY: dict[str, Any] = {}
+_NO_WEATHER = (_EMPTY,)
+
+Fields = tuple[str, str, Any, Any, Any, str]
+
+
+def extract_fields(data: dict[str, Any]) -> Fields:
+    """
+    一次取出工具结果需要的字段：(城市, 国家, 温度, 湿度, 风速, 天气描述)。
+    缺失的字段使用 "未知" 或 "N/A"；嵌套字典只查找一次。
+    """
+    main = data.get("main") or _EMPTY
+    # weather 可能为空列表
+    weather = data.get("weather") or _NO_WEATHER
+    return (
+        data.get("name", "未知"),
+        (data.get("sys") or _EMPTY).get("country", "未知"),
+        main.get("temp", "N/A"),
+        main.get("humidity", "N/A"),
+        (data.get("wind") or _EMPTY).get("speed", "N/A"),
+        weather[0].get("description", "未知"),
+    )
+
+
+# f-string 在编译时就拆成了常量与字段的拼接，不需要在运行时解析模板
+def render_text(city, country, temp, humidity, wind_speed, description) -> str:
+    return (
+        f"🌍 {city}, {country}\n"
+        f"🌡 温度: {temp}°C\n"
+        f"💧 湿度: {humidity}%\n"
+        f"🌬 风速: {wind_speed} m/s\n"
+        f"⛅ 天气: {description}\n"
+    )
+
+
+def render_llm(city, country, temp, humidity, wind_speed, description) -> str:
+    return f"{city},{country} {temp}°C 湿度{humidity}% 风{wind_speed}m/s {description}"
+
+
+@dataclass(slots=True)
+class WeatherReport:
+    """结构化的天气结果，只包含工具结果真正需要的字段"""
+
+    city: str
+    country: str
+    temp: Any
+    humidity: Any
+    wind_speed: Any
+    description: str
+
+    @classmethod
+    def from_data(cls, data: dict[str, Any]) -> "WeatherReport":
+        return cls(*extract_fields(data))
+
+    def as_dict(self) -> dict[str, Any]:
+        # dataclasses.asdict 会递归深拷贝，字段都是标量时直接构造更快
+        return {
+            "city": self.city,
+            "country": self.country,
+            "temp": self.temp,
+            "humidity": self.humidity,
+            "wind_speed": self.wind_speed,
+            "description": self.description,
+        }
+
+
+def parse_weather(data: dict[str, Any] | str) -> dict[str, Any] | str:
+    """:return: 天气数据字典；数据无法解析或包含错误信息时返回以 ⚠ 开头的错误提示"""
+    if isinstance(data, str):
+        try:
+            data = fast_json.loads(data)
+        except (ValueError, TypeError) as e:
+            return f"{ERROR_MARK} 无法解析天气数据: {e}"
+    if "error" in data:
+        return f"{ERROR_MARK} {data['error']}"
+    return data
+
+
+def format_weather(data: dict[str, Any] | str, output_format: str = OUTPUT_FORMAT) -> str:
+    data = parse_weather(data)
+    if isinstance(data, str):
+        return fast_json.dumps_str({"error": data}) if output_format == "json" else data
+    if output_format == "json":
+        return fast_json.dumps_str(WeatherReport.from_data(data).as_dict())
+    fields = extract_fields(data)
+    return render_llm(*fields) if output_format == "llm" else render_text(*fields)
+
+
+def format_weather_many(results: dict[str, dict[str, Any]], output_format: str = OUTPUT_FORMAT) -> str:
+    """多个城市的结果：text 每个城市一段，llm 每个城市一行，json 为 {城市: 结果} 对象"""
+    if output_format == "json":
+        parsed = {city: parse_weather(data) for city, data in results.items()}
+        return fast_json.dumps_str({
+            city: {"error": data} if isinstance(data, str) else WeatherReport.from_data(data).as_dict()
+            for city, data in parsed.items()
+        })
+    if output_format == "llm":
+        parsed = ((city, parse_weather(data)) for city, data in results.items())
+        return "\n".join(
+            f"{city} {data}" if isinstance(data, str) else render_llm(*extract_fields(data))
+            for city, data in parsed
+        )
+    return "\n".join(f"[{city}]\n{format_weather(data, output_format)}" for city, data in results.items())
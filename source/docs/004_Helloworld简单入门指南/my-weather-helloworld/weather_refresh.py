@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Iterable, Optional
+from dotenv import load_dotenv
+from weather_upstream import upstream_lifespan
+from upstream_guard import RATE_PER_MINUTE, WORKERS, guard
+from weather_cache import CacheKey, WeatherCache, key_fetcher, weather_cache
+from metrics import REGISTRY
+
+# 加载.env文件
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 热点城市提前刷新配置
+REFRESH_AHEAD = os.getenv("WEATHER_REFRESH_AHEAD", "1").lower() in ("1", "true", "yes")  # 总开关
+REFRESH_WINDOW = float(os.getenv("WEATHER_REFRESH_WINDOW", "30"))  # 热点条目距过期不足多少秒时刷新
+REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", "5"))  # 扫描间隔（秒）
+# 所有 worker 合计每分钟最多发起的刷新请求数，按进程数平分；设置了 OPENWEATHER_RATE_PER_MINUTE 时不超过配额的一半，给用户请求留出余量
+REFRESH_BUDGET = int(os.getenv("WEATHER_REFRESH_BUDGET", "20"))
+HOT_MIN_SCORE = float(os.getenv("WEATHER_HOT_MIN_SCORE", "3"))  # 衰减后的请求次数达到该值才算热点
+HOT_HALF_LIFE = float(os.getenv("WEATHER_HOT_HALF_LIFE", "600"))  # 请求次数的衰减半衰期（秒）
+HOT_MAX_KEYS = 4096  # 最多跟踪的城市数，超出时丢弃热度最低的一半
+HOT_REPORT_SIZE = 20  # stats() 中列出的热点城市数
+
+
+class HotKeyTracker:
+    """按指数衰减统计每个缓存键的请求次数：半衰期之前的一次请求只算 0.5 次"""
+
+    def __init__(self, half_life: float = HOT_HALF_LIFE, max_keys: int = HOT_MAX_KEYS):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._scores: dict[CacheKey, tuple[float, float]] = {}  # key -> (分数, 更新时间)
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record(self, key: CacheKey):
+        now = time.monotonic()
+        score, updated_at = self._scores.get(key, (0.0, now))
+        self._scores[key] = (self._decayed(score, updated_at, now) + 1, now)
+        if len(self._scores) > self.max_keys:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        ranked = sorted(self._scores, key=lambda k: self._decayed(*self._scores[k], now), reverse=True)
+        for key in ranked[self.max_keys // 2:]:
+            del self._scores[key]
+
+    def hot(self, min_score: float = HOT_MIN_SCORE) -> list[tuple[CacheKey, float]]:
+        """:return: 分数不低于 min_score 的键，按分数从高到低排列"""
+        now = time.monotonic()
+        scored = ((key, self._decayed(score, updated_at, now)) for key, (score, updated_at) in self._scores.items())
+        return sorted((item for item in scored if item[1] >= min_score), key=lambda item: item[1], reverse=True)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+
+class RefreshAhead:
+    """
+    后台刷新任务：定期找出即将过期（或已过期但仍可兜底）的热点条目，在用户请求未命中之前重新请求上游。
+    刷新请求受每分钟预算限制，熔断器未闭合时暂停刷新。
+    """
+
+    def __init__(
+        self,
+        cache: WeatherCache,
+        tracker: HotKeyTracker,
+        window: float = REFRESH_WINDOW,
+        interval: float = REFRESH_INTERVAL,
+        budget: int = REFRESH_BUDGET,
+        min_score: float = HOT_MIN_SCORE,
+        workers: int = WORKERS,
+    ):
+        self.cache = cache
+        self.tracker = tracker
+        self.window = window
+        self.interval = interval
+        budget = min(budget, int(RATE_PER_MINUTE // 2)) if RATE_PER_MINUTE > 0 else budget
+        # 各 worker 的刷新共用一份配额；共享缓存的租约保证同一个键只由一个 worker 刷新
+        self.budget = budget // max(workers, 1)
+        self.min_score = min_score
+        self._sent: deque[float] = deque()  # 最近一分钟内发起刷新的时间
+        self._task: Optional[asyncio.Task] = None
+        self.scans = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped = 0  # 其他 worker 正在刷新或已经刷新
+        self.over_budget = 0
+        self.paused = 0  # 因熔断跳过的扫描次数
+
+    def budget_left(self) -> int:
+        now = time.monotonic()
+        while self._sent and self._sent[0] <= now - 60:
+            self._sent.popleft()
+        return self.budget - len(self._sent)
+
+    def due(self) -> list[CacheKey]:
+        """热点中距过期不足 window 秒的键，按热度排列"""
+        keys = []
+        for key, _ in self.tracker.hot(self.min_score):
+            remaining = self.cache.expires_in(key)
+            if remaining is not None and remaining <= self.window:
+                keys.append(key)
+        return keys
+
+    async def refresh_due(self) -> int:
+        """执行一次扫描，:return: 成功刷新的条目数"""
+        self.scans += 1
+        if guard.breaker.state != "closed":
+            self.paused += 1
+            return 0
+        due = self.due()
+        allowed = max(self.budget_left(), 0)
+        if len(due) > allowed:
+            self.over_budget += len(due) - allowed
+            due = due[:allowed]
+        now = time.monotonic()
+        self._sent.extend(now for _ in due)
+        results = await asyncio.gather(*(self.cache.refresh(key, key_fetcher(key)) for key in due))
+        refreshed = results.count(True)
+        self.refreshed += refreshed
+        self.failed += results.count(False)
+        self.skipped += results.count(None)
+        return refreshed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh_due()
+            except Exception:
+                logger.exception("热点城市刷新失败")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        hot = self.tracker.hot(self.min_score)
+        return {
+            "running": self._task is not None,
+            "tracked": len(self.tracker),
+            "hot": [{
+                "city": key[0],
+                "score": round(score, 2),
+                "expires_in": None if (remaining := self.cache.expires_in(key)) is None else round(remaining, 1),
+            } for key, score in hot[:HOT_REPORT_SIZE]],
+            "hot_size": len(hot),
+            "budget_per_minute": self.budget,
+            "budget_left": self.budget_left(),
+            "scans": self.scans,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "over_budget": self.over_budget,
+            "paused": self.paused,
+        }
+
+    def metrics(self) -> Iterable[tuple[str, str, str, float, dict[str, str]]]:
+        for result, count in (("ok", self.refreshed), ("failed", self.failed), ("skipped", self.skipped),
+                              ("over_budget", self.over_budget)):
+            yield "weather_refresh_total", "counter", "热点城市提前刷新次数（按结果分类）", count, {"result": result}
+        yield "weather_hot_keys", "gauge", "当前热点城市数", len(self.tracker.hot(self.min_score)), {}
+
+
+# 进程级单例：缓存的每次查询都计入热度
+hot_keys = HotKeyTracker()
+weather_cache.tracker = hot_keys
+refresher = RefreshAhead(weather_cache, hot_keys)
+REGISTRY.add_collector(refresher.metrics)
+
+
+@asynccontextmanager
+async def weather_lifespan(server):
+    """
+    在 upstream_lifespan 的基础上，服务器运行期间启动热点城市刷新任务（WEATHER_REFRESH_AHEAD=0 时不启动）。
+    """
+    async with upstream_lifespan(server):
+        if REFRESH_AHEAD:
+            refresher.start()
+        try:
+            yield
+        finally:
+            await refresher.stop()
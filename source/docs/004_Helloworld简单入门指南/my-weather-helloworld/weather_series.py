@@ -0,0 +1,385 @@
+import os
+import time
+import asyncio
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+from dotenv import load_dotenv
+import fast_json
+from weather_upstream import fetch_forecast, fetch_history
+from weather_cache import WeatherCache, normalize_key
+from weather_format import ERROR_MARK, OUTPUT_FORMAT
+from city_index import resolve_city
+
+# 加载.env文件
+load_dotenv()
+
+# 预报与历史数据配置
+FORECAST_MAX_DAYS = 5  # 免费的预报接口只提供 5 天、每 3 小时一个时间点
+FORECAST_POINTS_PER_DAY = 8
+HISTORY_MAX_DAYS = int(os.getenv("WEATHER_HISTORY_MAX_DAYS", "31"))  # 单次查询的最大历史天数
+HISTORY_CHUNK_DAYS = 7  # 历史接口单次请求最多一周，更长的范围拆成多次并发请求
+SERIES_PAGE_SIZE = int(os.getenv("WEATHER_SERIES_PAGE_SIZE", "8"))  # 每页返回的行数
+SERIES_CACHE_TTL = float(os.getenv("WEATHER_SERIES_CACHE_TTL", "600"))  # 预报数据缓存秒数
+HISTORY_CACHE_TTL = float(os.getenv("WEATHER_HISTORY_CACHE_TTL", "86400"))  # 历史数据不会变化，缓存更久
+SERIES_CACHE_MAX_SIZE = int(os.getenv("WEATHER_SERIES_CACHE_MAX_SIZE", "128"))
+
+# 进度回调：(已完成, 总数)，与 FastMCP Context.report_progress 的签名一致
+ProgressCallback = Callable[[float, Optional[float]], Awaitable[None]]
+# 汇总后的一行：(开始时间, 最低温, 最高温, 平均温, 平均湿度, 最大风速, 最大降水概率, 主要天气)
+Row = tuple[int, float, float, float, float, float, float, str]
+
+_np: Any = None
+
+
+def _numpy():
+    """numpy 是可选依赖（uv add numpy），只在第一次汇总时导入，未安装时回退到纯 Python 实现"""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+
+@dataclass(slots=True)
+class WeatherSeries:
+    """按列存储的时间序列，每列是一个 array，比逐条保存上游返回的字典紧凑得多"""
+
+    city: str
+    country: str
+    timezone: int  # 相对 UTC 的秒数，用于按当地日期汇总
+    dt: array
+    temp: array
+    temp_min: array
+    temp_max: array
+    humidity: array
+    wind_speed: array
+    pop: array
+    description: list[str]
+
+    @classmethod
+    def from_items(cls, items: list[dict[str, Any]], city: str, country: str, tz: int) -> "WeatherSeries":
+        series = cls(city, country, tz, array("q"), array("d"), array("d"), array("d"), array("d"), array("d"), array("d"), [])
+        for item in sorted(items, key=lambda item: item.get("dt", 0)):
+            main = item.get("main") or {}
+            temp = main.get("temp", 0.0)
+            series.dt.append(item.get("dt", 0))
+            series.temp.append(temp)
+            series.temp_min.append(main.get("temp_min", temp))
+            series.temp_max.append(main.get("temp_max", temp))
+            series.humidity.append(main.get("humidity", 0))
+            series.wind_speed.append((item.get("wind") or {}).get("speed", 0.0))
+            series.pop.append(item.get("pop", 0.0))
+            series.description.append(((item.get("weather") or [{}])[0]).get("description", ""))
+        return series
+
+    @classmethod
+    def concat(cls, parts: list["WeatherSeries"]) -> "WeatherSeries":
+        """按时间顺序拼接多段序列（如按周请求的历史数据），直接拼接各列，不再经过字典"""
+        parts = sorted(parts, key=lambda part: part.dt[0] if len(part) else 0)
+        head = parts[0]
+        series = cls(head.city, head.country, head.timezone, array("q"), array("d"), array("d"), array("d"), array("d"), array("d"), array("d"), [])
+        last = None
+        for part in parts:
+            # 相邻两段的边界时间点可能重复
+            skip = 1 if len(part) and last is not None and part.dt[0] <= last else 0
+            for name in ("dt", "temp", "temp_min", "temp_max", "humidity", "wind_speed", "pop", "description"):
+                getattr(series, name).extend(getattr(part, name)[skip:])
+            if len(part):
+                last = part.dt[-1]
+        return series
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+
+def _most_common(values: list[str]) -> str:
+    return Counter(values).most_common(1)[0][0] if values else ""
+
+
+def _aggregate_numpy(np, series: WeatherSeries, step: int) -> list[Row]:
+    bucket = (np.frombuffer(series.dt, dtype=np.int64) + series.timezone) // step
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    ends = np.append(starts[1:], len(bucket))
+    counts = ends - starts
+    columns = {name: np.frombuffer(getattr(series, name), dtype=np.float64)
+               for name in ("temp", "temp_min", "temp_max", "humidity", "wind_speed", "pop")}
+    aggregated = (
+        (bucket[starts] * step).tolist(),
+        np.minimum.reduceat(columns["temp_min"], starts).round(1).tolist(),
+        np.maximum.reduceat(columns["temp_max"], starts).round(1).tolist(),
+        (np.add.reduceat(columns["temp"], starts) / counts).round(1).tolist(),
+        (np.add.reduceat(columns["humidity"], starts) / counts).round(0).tolist(),
+        np.maximum.reduceat(columns["wind_speed"], starts).round(1).tolist(),
+        np.maximum.reduceat(columns["pop"], starts).round(2).tolist(),
+        [_most_common(series.description[start:end]) for start, end in zip(starts.tolist(), ends.tolist())],
+    )
+    return list(zip(*aggregated))
+
+
+def _aggregate_python(series: WeatherSeries, step: int) -> list[Row]:
+    rows = []
+    start = 0
+    n = len(series)
+    while start < n:
+        bucket = (series.dt[start] + series.timezone) // step
+        end = start + 1
+        while end < n and (series.dt[end] + series.timezone) // step == bucket:
+            end += 1
+        count = end - start
+        rows.append((
+            bucket * step,
+            round(min(series.temp_min[start:end]), 1),
+            round(max(series.temp_max[start:end]), 1),
+            round(sum(series.temp[start:end]) / count, 1),
+            round(sum(series.humidity[start:end]) / count, 0),
+            round(max(series.wind_speed[start:end]), 1),
+            round(max(series.pop[start:end]), 2),
+            _most_common(series.description[start:end]),
+        ))
+        start = end
+    return rows
+
+
+def aggregate(series: WeatherSeries, step_hours: int) -> list[Row]:
+    """
+    按当地时间把序列汇总为每 step_hours 小时一行（24 即按天），
+    安装了 numpy 时用 reduceat 对整列一次计算，否则逐组计算。
+    """
+    if not len(series):
+        return []
+    step = max(step_hours, 1) * 3600
+    np = _numpy()
+    return _aggregate_numpy(np, series, step) if np is not None else _aggregate_python(series, step)
+
+
+def paginate(rows: list[Row], page: int, page_size: int = SERIES_PAGE_SIZE) -> tuple[list[Row], int, int]:
+    """:return: (本页的行, 页码（越界时取最近的有效页）, 总页数)"""
+    pages = max((len(rows) + page_size - 1) // page_size, 1)
+    page = min(max(page, 1), pages)
+    return rows[(page - 1) * page_size:page * page_size], page, pages
+
+
+def _label(timestamp: int, step_hours: int) -> str:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime("%m-%d") if step_hours >= 24 else moment.strftime("%m-%d %H:00")
+
+
+def render_page(
+    series: WeatherSeries,
+    title: str,
+    rows: list[Row],
+    step_hours: int,
+    page: int,
+    pages: int,
+    output_format: str = OUTPUT_FORMAT,
+) -> str:
+    if output_format == "json":
+        return fast_json.dumps_str({
+            "city": series.city,
+            "country": series.country,
+            "step_hours": step_hours,
+            "page": page,
+            "pages": pages,
+            "rows": [{
+                "time": _label(start, step_hours),
+                "temp_min": temp_min,
+                "temp_max": temp_max,
+                "temp_mean": temp_mean,
+                "humidity": humidity,
+                "wind_max": wind,
+                "pop": pop,
+                "description": description,
+            } for start, temp_min, temp_max, temp_mean, humidity, wind, pop, description in rows],
+        })
+    lines = [f"{series.city},{series.country} {title}（每 {step_hours} 小时汇总，第 {page}/{pages} 页）"]
+    lines.extend(
+        f"{_label(start, step_hours)} {temp_min}~{temp_max}°C 均{temp_mean}°C 湿度{humidity:.0f}% 风≤{wind}m/s"
+        f"{f' 降水{pop:.0%}' if pop else ''} {description}"
+        for start, temp_min, temp_max, temp_mean, humidity, wind, pop, description in rows
+    )
+    if page < pages:
+        lines.append(f"（还有 {pages - page} 页，使用 page={page + 1} 获取下一页）")
+    return "\n".join(lines)
+
+
+# 预报与历史数据的缓存，与当前天气的缓存分开，避免大的序列挤掉热点城市
+series_cache = WeatherCache(ttl=SERIES_CACHE_TTL, max_size=SERIES_CACHE_MAX_SIZE)
+history_cache = WeatherCache(ttl=HISTORY_CACHE_TTL, max_size=SERIES_CACHE_MAX_SIZE)
+
+
+def _series_or_error(data: dict[str, Any], city: str) -> dict[str, Any]:
+    """把上游响应转换为 {"series": WeatherSeries} 后再缓存；错误结果原样返回"""
+    if "error" in data:
+        return data
+    info = data.get("city") or {}
+    series = WeatherSeries.from_items(
+        data.get("list") or [], info.get("name", city), info.get("country", ""), info.get("timezone", 0)
+    )
+    return {"series": series}
+
+
+async def load_forecast(city: str, days: int, units: str = "metric", lang: str = "zh_cn") -> WeatherSeries | str:
+    """:return: 预报序列；出错时返回以 ⚠ 开头的错误提示"""
+    days = min(max(days, 1), FORECAST_MAX_DAYS)
+    count = days * FORECAST_POINTS_PER_DAY
+    match = resolve_city(city)
+    city_id = match.city_id if match is not None else None
+    query = match.query if match is not None else city
+    key = normalize_key(f"forecast:{city_id if city_id is not None else query}:{count}", units, lang)
+
+    async def fetch() -> dict[str, Any]:
+        return _series_or_error(await fetch_forecast(query, count, units=units, lang=lang, city_id=city_id), query)
+
+    data = await series_cache.get_or_fetch(key, fetch)
+    return data["series"] if "series" in data else f"{ERROR_MARK} {data['error']}"
+
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value.strip(), "%Y-%m-%d").date()
+
+
+def history_chunks(start: date, end: date) -> list[tuple[int, int]]:
+    """把 [start, end] 日期范围（含 end 当天，UTC）拆成不超过 HISTORY_CHUNK_DAYS 天的时间戳区间"""
+    chunks = []
+    day = start
+    while day <= end:
+        chunk_end = min(day + timedelta(days=HISTORY_CHUNK_DAYS), end + timedelta(days=1))
+        chunks.append((
+            int(datetime.combine(day, datetime.min.time(), timezone.utc).timestamp()),
+            int(datetime.combine(chunk_end, datetime.min.time(), timezone.utc).timestamp()) - 1,
+        ))
+        day = chunk_end
+    return chunks
+
+
+async def load_history(
+    city: str,
+    start: str,
+    end: str,
+    units: str = "metric",
+    on_progress: Optional[ProgressCallback] = None,
+) -> WeatherSeries | str:
+    """
+    按周拆分并发请求历史数据，每完成一段通过 on_progress 报告进度。
+    :return: 合并后的历史序列；参数或上游出错时返回以 ⚠ 开头的错误提示
+    """
+    try:
+        first, last = _parse_date(start), _parse_date(end)
+    except ValueError:
+        return f"{ERROR_MARK} 日期格式应为 YYYY-MM-DD"
+    if last < first:
+        return f"{ERROR_MARK} 结束日期早于开始日期"
+    # 历史数据最多到今天（UTC）；结束日期在未来时截止到今天，否则 load_chunk 截止到当前整点后会出现 start > end
+    today = datetime.now(timezone.utc).date()
+    if first > today:
+        return f"{ERROR_MARK} 开始日期不能晚于今天（UTC {today.isoformat()}）"
+    last = min(last, today)
+    if (last - first).days + 1 > HISTORY_MAX_DAYS:
+        return f"{ERROR_MARK} 一次最多查询 {HISTORY_MAX_DAYS} 天的历史数据"
+
+    match = resolve_city(city)
+    city_id = match.city_id if match is not None else None
+    query = match.query if match is not None else city
+    chunks = history_chunks(first, last)
+
+    async def load_chunk(chunk_start: int, chunk_end: int) -> dict[str, Any]:
+        # 包含当前时间的一段截止到最近的整点，缓存键每小时变化一次；已经结束的时间段数据不会再变化
+        chunk_end = min(chunk_end, int(time.time()) // 3600 * 3600)
+        key = normalize_key(f"history:{city_id if city_id is not None else query}:{chunk_start}:{chunk_end}", units, "")
+
+        async def fetch() -> dict[str, Any]:
+            return _series_or_error(
+                await fetch_history(query, chunk_start, chunk_end, units=units, city_id=city_id), query
+            )
+
+        return await history_cache.get_or_fetch(key, fetch)
+
+    results = []
+    tasks = [asyncio.ensure_future(load_chunk(*chunk)) for chunk in chunks]
+    try:
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            results.append(await task)
+            if on_progress is not None:
+                await on_progress(done, len(chunks))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    errors = [data["error"] for data in results if "error" in data]
+    if errors:
+        return f"{ERROR_MARK} {errors[0]}"
+    return WeatherSeries.concat([data["series"] for data in results])
+
+
+async def forecast_page(
+    city: str,
+    days: int = 3,
+    step_hours: int = 24,
+    page: int = 1,
+    on_progress: Optional[ProgressCallback] = None,
+) -> str:
+    series = await load_forecast(city, days)
+    if on_progress is not None:
+        await on_progress(1, 1)
+    if isinstance(series, str):
+        return series
+    rows, page, pages = paginate(aggregate(series, step_hours), page)
+    return render_page(series, f"未来 {min(max(days, 1), FORECAST_MAX_DAYS)} 天预报", rows, step_hours, page, pages)
+
+
+async def history_page(
+    city: str,
+    start: str,
+    end: str,
+    step_hours: int = 24,
+    page: int = 1,
+    on_progress: Optional[ProgressCallback] = None,
+) -> str:
+    series = await load_history(city, start, end, on_progress=on_progress)
+    if isinstance(series, str):
+        return series
+    rows, page, pages = paginate(aggregate(series, step_hours), page)
+    return render_page(series, f"{start} 至 {end} 历史天气", rows, step_hours, page, pages)
+
+
+async def series_pages(tool_name: str, tool_args: dict[str, Any], on_progress: Optional[ProgressCallback] = None) -> AsyncIterator[str]:
+    """
+    依次产出 query_forecast / query_history 的全部分页，用于 SSE 分块推送：
+    数据只请求与汇总一次，每一页渲染后立即发送，不需要把完整结果拼成一个字符串。
+    """
+    args = dict(tool_args)
+    step_hours = int(args.pop("step_hours", 24))
+    args.pop("page", None)
+    if tool_name == "query_forecast":
+        days = int(args.get("days", 3))
+        series = await load_forecast(args["city"], days)
+        title = f"未来 {min(max(days, 1), FORECAST_MAX_DAYS)} 天预报"
+    else:
+        series = await load_history(args["city"], args["start"], args["end"], on_progress=on_progress)
+        title = f"{args['start']} 至 {args['end']} 历史天气"
+    if isinstance(series, str):
+        yield series
+        return
+    rows = aggregate(series, step_hours)
+    _, _, pages = paginate(rows, 1)
+    for page in range(1, pages + 1):
+        page_rows, _, _ = paginate(rows, page)
+        yield render_page(series, title, page_rows, step_hours, page, pages)
+
+
+SERIES_TOOLS = ("query_forecast", "query_history")
+
+
+def context_progress(ctx: Any) -> Optional[ProgressCallback]:
+    """FastMCP Context 的进度回调；不在 MCP 请求中（如 HTTP 服务器直接调用工具）时返回 None"""
+    try:
+        ctx.request_context
+    except (AttributeError, ValueError):
+        return None
+    return ctx.report_progress
@@ -0,0 +1,300 @@
+import os
+import asyncio
+import logging
+from typing import Any
+from contextlib import asynccontextmanager
+import httpx
+from dotenv import load_dotenv
+from upstream_guard import UpstreamUnavailable, backoff_delay, guard
+from metrics import UPSTREAM_ERRORS, UPSTREAM_FETCH_SECONDS
+
+# 加载.env文件，确保API Key受到保护
+load_dotenv()
+
+# OpenWeather API 配置
+OPENWEATHER_API_BASE = os.getenv("OPENWEATHER_API_BASE")
+OPEN_WEATHER_API_KEY = os.getenv("OPEN_WEATHER_API_KEY")
+USER_AGENT = os.getenv("OPEN_WEATHER_USER_AGENT")
+# 历史数据接口（需要相应的付费套餐），与当前天气接口不在同一个域名下
+OPENWEATHER_HISTORY_API_BASE = os.getenv(
+    "OPENWEATHER_HISTORY_API_BASE", "https://history.openweathermap.org/data/2.5/history/city"
+)
+
+# 连接池配置：整个服务器进程共享一个 httpx.AsyncClient，避免每次调用都重新握手
+MAX_CONNECTIONS = int(os.getenv("OPENWEATHER_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENWEATHER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENWEATHER_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 需要额外安装 h2（uv add "httpx[http2]"），默认关闭
+HTTP2 = os.getenv("OPENWEATHER_HTTP2", "0").lower() in ("1", "true", "yes")
+
+# 超时配置：连接超时与读取超时分开设置
+CONNECT_TIMEOUT = float(os.getenv("OPENWEATHER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENWEATHER_READ_TIMEOUT", "10"))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamClient:
+    """
+    服务器生命周期内共享的上游 HTTP 客户端。
+    首次使用时才创建 httpx.AsyncClient，在服务器关闭时通过 aclose() 释放连接池。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=connect_timeout,
+        )
+        if http2 and not _http2_available():
+            logging.warning("OPENWEATHER_HTTP2 已开启但未安装 h2，回退到 HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                headers={"User-Agent": USER_AGENT} if USER_AGENT else None,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 进程级单例，两个服务器都通过它访问 OpenWeather
+upstream = UpstreamClient()
+
+
+@asynccontextmanager
+async def upstream_lifespan(_server):
+    """
+    挂到 FastMCP(lifespan=...) 或 FastAPI(lifespan=...) 上，服务器退出时关闭连接池。
+    """
+    try:
+        yield
+    finally:
+        await upstream.aclose()
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """429 与 5xx 视为上游暂时故障，可以重试并计入熔断统计"""
+    return status_code == 429 or status_code >= 500
+
+
+async def guarded_get(url: str, params: dict[str, Any], timeout: httpx.Timeout | None = None) -> httpx.Response:
+    """
+    经过限流、熔断与重试保护的 GET 请求。
+    超时、连接错误、429 与 5xx 会在重试预算允许时按带抖动的指数退避重试；其余响应直接返回。
+    :raises UpstreamUnavailable: 熔断打开或超出调用配额时不发出请求
+    """
+    guard.retry_budget.deposit()
+    attempt = 0
+    while True:
+        if not guard.breaker.allow():
+            raise UpstreamUnavailable("上游错误率过高，已熔断")
+        # allow() 在 half_open 状态下占用了唯一的探测名额；没有记录结果就退出时（配额不足、取消、其他异常）必须释放
+        recorded = False
+        try:
+            if not await guard.limiter.acquire():
+                raise UpstreamUnavailable("超出上游调用配额")
+            try:
+                response = await upstream.client.get(url, params=params, timeout=timeout or upstream.timeout)
+            except (httpx.TimeoutException, httpx.TransportError):
+                guard.breaker.record(False)
+                recorded = True
+                if attempt >= guard.max_retries or not guard.retry_budget.withdraw():
+                    raise
+            else:
+                ok = not is_retryable_status(response.status_code)
+                guard.breaker.record(ok)
+                recorded = True
+                if ok or attempt >= guard.max_retries or not guard.retry_budget.withdraw():
+                    return response
+        finally:
+            if not recorded:
+                guard.breaker.abandon()
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def upstream_error(e: Exception) -> dict[str, Any]:
+    """
+    把异常转换为包含 error 信息的字典。
+    transient 标记上游暂时不可用（限流、熔断、超时、429/5xx），缓存层据此决定是否返回过期数据。
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        status_code = e.response.status_code
+        UPSTREAM_ERRORS.inc(reason=f"http_{status_code}")
+        return {"error": f"HTTP 错误: {status_code}", "transient": is_retryable_status(status_code)}
+    if isinstance(e, UpstreamUnavailable):
+        UPSTREAM_ERRORS.inc(reason="unavailable")
+        return {"error": f"上游暂不可用: {str(e)}", "transient": True}
+    UPSTREAM_ERRORS.inc(reason=type(e).__name__)
+    return {"error": f"请求失败: {str(e)}", "transient": isinstance(e, (httpx.TimeoutException, httpx.TransportError))}
+
+
+async def fetch_weather(
+    city: str,
+    units: str = "metric",
+    lang: str = "zh_cn",
+    timeout: httpx.Timeout | None = None,
+    city_id: int | None = None,
+) -> dict[str, Any] | None:
+    """
+    从 OpenWeather API 获取天气信息。
+    :param city: 城市名称（需使用英文，如 Beijing）
+    :param units: 单位制（metric / imperial / standard）
+    :param lang: 返回描述所用语言
+    :param timeout: 可选的单次请求超时，默认使用连接池的 connect/read 超时
+    :param city_id: 已解析出的 OpenWeather 城市 ID，提供时按 ID 查询而不是按名称
+    :return: 天气数据字典；若出错返回包含 error 信息的字典
+    """
+    params = {
+        **city_params(city, city_id),
+        "appid": OPEN_WEATHER_API_KEY,
+        "units": units,
+        "lang": lang
+    }
+    try:
+        with UPSTREAM_FETCH_SECONDS.time(endpoint="weather"):
+            response = await guarded_get(OPENWEATHER_API_BASE, params, timeout)
+        response.raise_for_status()
+        return response.json()  # 返回字典类型
+    except Exception as e:
+        return upstream_error(e)
+
+
+# OpenWeather 的 group 接口一次最多接受 20 个城市 ID
+GROUP_MAX_IDS = 20
+
+
+def group_api_url() -> str:
+    """由 OPENWEATHER_API_BASE（.../data/2.5/weather）推导出 group 接口地址"""
+    base = OPENWEATHER_API_BASE.rstrip("/")
+    return base.rsplit("/", 1)[0] + "/group"
+
+
+async def fetch_weather_group(
+    city_ids: list[int],
+    units: str = "metric",
+    lang: str = "zh_cn",
+    timeout: httpx.Timeout | None = None,
+) -> dict[int, dict[str, Any]]:
+    """
+    通过 group 接口一次获取多个城市 ID 的天气（每次最多 GROUP_MAX_IDS 个）。
+    :param city_ids: OpenWeather 城市 ID 列表
+    :return: 城市 ID 到天气数据字典的映射；请求失败或未返回的 ID 对应包含 error 信息的字典
+    """
+    params = {
+        "id": ",".join(str(city_id) for city_id in city_ids),
+        "appid": OPEN_WEATHER_API_KEY,
+        "units": units,
+        "lang": lang
+    }
+    try:
+        with UPSTREAM_FETCH_SECONDS.time(endpoint="group"):
+            response = await guarded_get(group_api_url(), params, timeout)
+        response.raise_for_status()
+        found = {item.get("id"): item for item in response.json().get("list", [])}
+    except Exception as e:
+        error = upstream_error(e)
+        return {city_id: error for city_id in city_ids}
+    return {city_id: found.get(city_id, {"error": f"未找到城市 ID: {city_id}"}) for city_id in city_ids}
+
+
+def forecast_api_url() -> str:
+    """由 OPENWEATHER_API_BASE（.../data/2.5/weather）推导出 5 天 / 3 小时预报接口地址"""
+    base = OPENWEATHER_API_BASE.rstrip("/")
+    return base.rsplit("/", 1)[0] + "/forecast"
+
+
+def city_params(city: str, city_id: int | None) -> dict[str, Any]:
+    return {"id": city_id} if city_id is not None else {"q": city}
+
+
+async def fetch_forecast(
+    city: str,
+    count: int,
+    units: str = "metric",
+    lang: str = "zh_cn",
+    timeout: httpx.Timeout | None = None,
+    city_id: int | None = None,
+) -> dict[str, Any]:
+    """
+    获取 5 天 / 3 小时预报。
+    :param count: 返回的时间点数（每天 8 个，最多 40 个）
+    :return: 预报数据字典（list 为各时间点）；若出错返回包含 error 信息的字典
+    """
+    params = {
+        **city_params(city, city_id),
+        "cnt": count,
+        "appid": OPEN_WEATHER_API_KEY,
+        "units": units,
+        "lang": lang
+    }
+    try:
+        with UPSTREAM_FETCH_SECONDS.time(endpoint="forecast"):
+            response = await guarded_get(forecast_api_url(), params, timeout)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return upstream_error(e)
+
+
+async def fetch_history(
+    city: str,
+    start: int,
+    end: int,
+    units: str = "metric",
+    timeout: httpx.Timeout | None = None,
+    city_id: int | None = None,
+) -> dict[str, Any]:
+    """
+    获取逐小时历史数据，接口单次最多返回一周。
+    :param start: 开始时间（Unix 时间戳，UTC）
+    :param end: 结束时间（Unix 时间戳，UTC）
+    :return: 历史数据字典（list 为各时间点）；若出错返回包含 error 信息的字典
+    """
+    params = {
+        **city_params(city, city_id),
+        "type": "hour",
+        "start": start,
+        "end": end,
+        "appid": OPEN_WEATHER_API_KEY,
+        "units": units
+    }
+    try:
+        with UPSTREAM_FETCH_SECONDS.time(endpoint="history"):
+            response = await guarded_get(OPENWEATHER_HISTORY_API_BASE, params, timeout)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return upstream_error(e)
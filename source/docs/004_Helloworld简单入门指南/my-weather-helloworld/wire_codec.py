@@ -0,0 +1,114 @@
+import os
+import zlib
+from typing import Any, Optional
+from dotenv import load_dotenv
+import fast_json
+
+# MessagePack 是可选依赖（uv add msgpack），未安装时只支持 JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 加载.env文件
+load_dotenv()
+
+# 客户端使用的编码：json（默认）或 msgpack；服务器未安装 msgpack 时按 Accept 协商回退到 JSON
+WIRE_FORMAT = os.getenv("MCP_WIRE_FORMAT", "json").lower()
+# 响应体达到该字节数且客户端接受 gzip 时压缩；小响应压缩后收益很小，反而增加 CPU
+COMPRESS_MIN_BYTES = int(os.getenv("MCP_WIRE_COMPRESS_MIN_BYTES", "1024"))
+# zlib 压缩级别：1 的压缩率与默认的 6 相差很小，CPU 开销低得多
+COMPRESS_LEVEL = int(os.getenv("MCP_WIRE_COMPRESS_LEVEL", "1"))
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# 常见的非标准写法也识别为 MessagePack
+MSGPACK_ALIASES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";", 1)[0].strip().lower() in MSGPACK_ALIASES
+
+
+def content_type_for(wire_format: str) -> str:
+    """客户端配置的编码对应的 Content-Type；要求 msgpack 但未安装时使用 JSON"""
+    return MSGPACK if wire_format == "msgpack" and msgpack is not None else JSON
+
+
+def encode(obj: Any, content_type: str = JSON) -> bytes:
+    if is_msgpack(content_type):
+        return msgpack.packb(obj, use_bin_type=True)
+    return fast_json.dumps(obj)
+
+
+def decode(data: bytes, content_type: Optional[str] = JSON) -> Any:
+    """按 Content-Type 解码；缺失或无法识别时按 JSON 处理"""
+    if is_msgpack(content_type):
+        if msgpack is None:
+            raise ValueError("未安装 msgpack，无法解析 application/msgpack")
+        return msgpack.unpackb(data, raw=False)
+    return fast_json.loads(data)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    根据 Accept 选择响应编码：客户端明确接受 MessagePack 且服务器已安装时使用 MessagePack，其余情况使用 JSON，
+    因此只发送 JSON 的客户端（或不带 Accept）行为不变。
+    """
+    if msgpack is None or not accept:
+        return JSON
+    for item in accept.split(","):
+        media_type, _, params = item.partition(";")
+        if media_type.strip().lower() in MSGPACK_ALIASES and "q=0" not in params.replace(" ", "").split(";"):
+            return MSGPACK
+    return JSON
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    return bool(accept_encoding) and any(
+        item.split(";", 1)[0].strip().lower() == "gzip" for item in accept_encoding.split(",")
+    )
+
+
+def gzip_compress(data: bytes, level: int = COMPRESS_LEVEL) -> bytes:
+    # wbits=31 生成 gzip 格式（带头部与校验和）
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def encode_body(
+    obj: Any,
+    accept: Optional[str],
+    accept_encoding: Optional[str],
+    min_bytes: int = COMPRESS_MIN_BYTES,
+) -> tuple[bytes, dict[str, str]]:
+    """
+    按协商结果编码响应体，较大的响应在客户端接受时用 gzip 压缩。
+    :return: (响应体, 响应头)，响应头包含 Content-Type、Vary 与可能的 Content-Encoding
+    """
+    content_type = negotiate(accept)
+    body = encode(obj, content_type)
+    headers = {"Content-Type": content_type, "Vary": "Accept, Accept-Encoding"}
+    if len(body) >= min_bytes and accepts_gzip(accept_encoding):
+        body = gzip_compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def request_body(obj: Any, wire_format: str = WIRE_FORMAT) -> tuple[bytes, dict[str, str]]:
+    """
+    客户端请求：按配置的编码序列化请求体，并通过 Accept 要求服务器用同样的编码响应。
+    :return: (请求体, 请求头)
+    """
+    content_type = content_type_for(wire_format)
+    return encode(obj, content_type), {"Content-Type": content_type, "Accept": content_type}
+
+
+def accept_headers(wire_format: str = WIRE_FORMAT) -> dict[str, str]:
+    """没有请求体的请求（如 GET /list_tools）只需要 Accept"""
+    return {"Accept": content_type_for(wire_format)}
+
+
+async def read_response(response) -> Any:
+    """按响应的 Content-Type 解码 aiohttp 响应体；gzip 由 aiohttp 根据 Content-Encoding 自动解压"""
+    return decode(await response.read(), response.headers.get("Content-Type"))